@@ -0,0 +1,36 @@
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode JSON the way FastAPI's JSONResponse does (compact, UTF-8), with
+    orjson when it is installed. Only plain dicts, lists, strings, numbers,
+    booleans and None are supported, so both encoders give the same bytes.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class PrebuiltJSONResponse(Response):
+    """
+    JSON response for payloads the models already build in the exact shape,
+    key order and formatting of the route's response_model. Returning it
+    skips FastAPI's validation and serialization of the response, which
+    dominate the cost of listing endpoints; the response_model still
+    documents the route.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, Query, Path
 
+from app.config import settings
 from app.controllers.conversation_controller import ConversationController
 from app.schemas.conversation import (
     ConversationResponse,
@@ -11,8 +12,8 @@ router = APIRouter(prefix="/api/conversations", tags=["Conversations"])
 @router.get("/user/{user_id}", response_model=PaginatedConversationResponse)
 async def get_user_conversations(
     user_id: int = Path(..., description="ID of the user"),
-    page: int = Query(1, description="Page number"),
-    limit: int = Query(20, description="Number of conversations per page"),
+    page: int = Query(1, ge=1, description="Page number"),
+    limit: int = Query(20, ge=1, le=settings.page_max_limit, description="Number of conversations per page"),
     conversation_controller: ConversationController = Depends()
 ) -> PaginatedConversationResponse:
     """
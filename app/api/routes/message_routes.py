@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, Query, Path, Body
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from datetime import datetime
 
+from app.config import settings
 from app.controllers.message_controller import MessageController
 from app.schemas.message import (
     MessageCreate, 
     MessageResponse, 
-    PaginatedMessageResponse
+    PaginatedMessageResponse,
+    BatchMessageResponse,
+    MessageSyncResponse,
+    UserMessageSyncResponse
 )
 
 router = APIRouter(prefix="/api/messages", tags=["Messages"])
@@ -21,11 +26,22 @@ async def send_message(
     """
     return await message_controller.send_message(message)
 
+@router.post("/batch", response_model=BatchMessageResponse)
+async def send_messages(
+    messages: List[MessageCreate] = Body(..., max_length=settings.message_batch_max_size),
+    message_controller: MessageController = Depends()
+) -> BatchMessageResponse:
+    """
+    Send many messages at once, with a result per message
+    """
+    return await message_controller.send_messages(messages)
+
 @router.get("/conversation/{conversation_id}", response_model=PaginatedMessageResponse)
 async def get_conversation_messages(
     conversation_id: str = Path(..., description="ID of the conversation"),
-    page: int = Query(1, description="Page number"),
-    limit: int = Query(20, description="Number of messages per page"),
+    page: int = Query(1, ge=1, description="Page number, ignored when a cursor is given"),
+    limit: int = Query(20, ge=1, le=settings.page_max_limit, description="Number of messages per page"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
     message_controller: MessageController = Depends()
 ) -> PaginatedMessageResponse:
     """
@@ -34,15 +50,17 @@ async def get_conversation_messages(
     return await message_controller.get_conversation_messages(
         conversation_id=conversation_id,
         page=page,
-        limit=limit
+        limit=limit,
+        cursor=cursor
     )
 
 @router.get("/conversation/{conversation_id}/before", response_model=PaginatedMessageResponse)
 async def get_messages_before_timestamp(
     conversation_id: str = Path(..., description="ID of the conversation"),
     before_timestamp: datetime = Query(..., description="Get messages before this timestamp"),
-    page: int = Query(1, description="Page number"),
-    limit: int = Query(20, description="Number of messages per page"),
+    page: int = Query(1, ge=1, description="Page number, ignored when a cursor is given"),
+    limit: int = Query(20, ge=1, le=settings.page_max_limit, description="Number of messages per page"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
     message_controller: MessageController = Depends()
 ) -> PaginatedMessageResponse:
     """
@@ -52,5 +70,60 @@ async def get_messages_before_timestamp(
         conversation_id=conversation_id,
         before_timestamp=before_timestamp,
         page=page,
+        limit=limit,
+        cursor=cursor
+    )
+
+@router.get("/conversation/{conversation_id}/since", response_model=MessageSyncResponse)
+async def get_messages_since(
+    conversation_id: str = Path(..., description="ID of the conversation"),
+    after: str = Query(..., description="ID of the newest message the client already has"),
+    limit: int = Query(100, ge=1, le=settings.sync_max_limit, description="Maximum number of messages to return"),
+    message_controller: MessageController = Depends()
+) -> MessageSyncResponse:
+    """
+    Get the messages of a conversation sent after a given message, oldest first
+    """
+    return await message_controller.get_messages_since(
+        conversation_id=conversation_id,
+        after=after,
         limit=limit
-    ) 
\ No newline at end of file
+    )
+
+@router.get("/user/{user_id}/since", response_model=UserMessageSyncResponse)
+async def get_user_messages_since(
+    user_id: int = Path(..., description="ID of the user"),
+    after: str = Query(..., description="ID of the newest message the client already has"),
+    limit: int = Query(100, ge=1, le=settings.sync_max_limit, description="Maximum number of messages per conversation"),
+    conversations: int = Query(20, ge=1, le=settings.sync_max_conversations, description="Maximum number of conversations"),
+    message_controller: MessageController = Depends()
+) -> UserMessageSyncResponse:
+    """
+    Get the messages sent after a given message in all conversations of a user
+    """
+    return await message_controller.get_user_messages_since(
+        user_id=user_id,
+        after=after,
+        limit=limit,
+        max_conversations=conversations
+    )
+
+@router.get("/conversation/{conversation_id}/export", response_class=StreamingResponse)
+async def export_conversation_messages(
+    conversation_id: str = Path(..., description="ID of the conversation"),
+    start: Optional[datetime] = Query(None, description="Only export messages sent at or after this timestamp"),
+    end: Optional[datetime] = Query(None, description="Only export messages sent before this timestamp"),
+    after_id: Optional[str] = Query(None, description="Resume an interrupted export after the message with this id"),
+    gzip: bool = Query(False, description="Gzip-compress the export"),
+    message_controller: MessageController = Depends()
+) -> StreamingResponse:
+    """
+    Stream the messages of a conversation as NDJSON, latest first
+    """
+    return await message_controller.export_conversation_messages(
+        conversation_id=conversation_id,
+        start=start,
+        end=end,
+        after_id=after_id,
+        gzip=gzip
+    )
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Path, Request, WebSocket
+from fastapi.responses import StreamingResponse
+
+from app.controllers.realtime_controller import RealtimeController
+
+router = APIRouter(prefix="/api/realtime", tags=["Realtime"])
+
+@router.websocket("/ws/{user_id}")
+async def stream_websocket(
+    websocket: WebSocket,
+    user_id: int = Path(..., description="ID of the user"),
+    realtime_controller: RealtimeController = Depends()
+) -> None:
+    """
+    Receive new messages of all conversations of a user over a WebSocket
+    """
+    await realtime_controller.stream_websocket(websocket, user_id)
+
+@router.get("/events/{user_id}", response_class=StreamingResponse)
+async def stream_events(
+    request: Request,
+    user_id: int = Path(..., description="ID of the user"),
+    realtime_controller: RealtimeController = Depends()
+) -> StreamingResponse:
+    """
+    Receive new messages of all conversations of a user as Server-Sent Events
+    """
+    return await realtime_controller.stream_events(request, user_id)
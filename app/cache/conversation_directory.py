@@ -0,0 +1,78 @@
+from typing import Awaitable, Callable, Dict, Any
+
+from app.cache.lru import LRUCache
+from app.config import settings
+
+
+def canonical_conversation_id(user_a: int, user_b: int) -> str:
+    """
+    Canonical id of the conversation between two users: "{smaller}_{larger}".
+    """
+
+    low, high = sorted((user_a, user_b))
+    return f"{low}_{high}"
+
+
+def legacy_conversation_id(user_a: int, user_b: int) -> str:
+    """
+    The reversed "{larger}_{smaller}" id some older conversations were stored under.
+    """
+
+    low, high = sorted((user_a, user_b))
+    return f"{high}_{low}"
+
+
+class ConversationDirectory:
+    """
+    In-process LRU/TTL cache of participant pair -> conversation_id.
+
+    New conversations always use the canonical id, so the only thing a cache
+    miss has to find out is whether the pair still lives under a legacy
+    reversed id. With legacy lookups disabled (after running
+    scripts/migrate_conversation_ids.py) resolution never touches Cassandra.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, legacy_lookup: bool = True):
+        self.legacy_lookup = legacy_lookup
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.lookups = 0
+
+    async def resolve(self, user_a: int, user_b: int, exists: Callable[[str], Awaitable[bool]]) -> str:
+        """
+        Return the conversation_id for a pair of users. `exists` is used on a
+        cache miss to check whether the legacy id holds any messages.
+        """
+
+        key = tuple(sorted((user_a, user_b)))
+        conversation_id = self._cache.get(key)
+        if conversation_id is not None:
+            return conversation_id
+
+        conversation_id = canonical_conversation_id(user_a, user_b)
+        legacy_id = legacy_conversation_id(user_a, user_b)
+        if self.legacy_lookup and legacy_id != conversation_id:
+            self.lookups += 1
+            if await exists(legacy_id):
+                conversation_id = legacy_id
+
+        self._cache.put(key, conversation_id)
+        return conversation_id
+
+    def remember(self, user_a: int, user_b: int, conversation_id: str) -> None:
+        """
+        Record a mapping observed elsewhere, e.g. while reading an inbox.
+        """
+
+        key = tuple(sorted((user_a, user_b)))
+        if self._cache.peek(key) != conversation_id:
+            self._cache.put(key, conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "legacy_lookups": self.lookups}
+
+
+conversation_directory = ConversationDirectory(
+    max_entries=settings.conversation_cache_size,
+    ttl=settings.conversation_cache_ttl,
+    legacy_lookup=settings.conversation_legacy_lookup,
+)
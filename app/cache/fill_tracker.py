@@ -0,0 +1,46 @@
+from typing import Dict, Hashable, List
+
+
+class FillTracker:
+    """
+    Read-throughs in flight per cache key, so that a cache can tell whether
+    a key was written while its rows were being read. A fill that started
+    before a write must not be stored after it: the cache would then hold
+    the pre-write rows and miss the write until the entry expires.
+
+    Only keys with a fill in flight are tracked, so memory is bounded by
+    concurrent reads rather than by the number of keys ever written.
+    """
+
+    def __init__(self):
+        # key -> [fills in flight, writes seen while they were]
+        self._fills: Dict[Hashable, List[int]] = {}
+        self.dropped = 0
+
+    def begin(self, key: Hashable) -> int:
+        """
+        Note that a fill of `key` is starting. Returns the generation to hand
+        back to end().
+        """
+        fill = self._fills.setdefault(key, [0, 0])
+        fill[0] += 1
+        return fill[1]
+
+    def written(self, key: Hashable) -> None:
+        fill = self._fills.get(key)
+        if fill is not None:
+            fill[1] += 1
+
+    def end(self, key: Hashable, generation: int) -> bool:
+        """
+        Note that a fill of `key` finished (or failed). Returns whether it may
+        be stored, i.e. whether `key` was not written since it began.
+        """
+        fill = self._fills[key]
+        fill[0] -= 1
+        if not fill[0]:
+            del self._fills[key]
+        if fill[1] != generation:
+            self.dropped += 1
+            return False
+        return True
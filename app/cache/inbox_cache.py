@@ -0,0 +1,154 @@
+import sys
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache.fill_tracker import FillTracker
+from app.cache.lru import LRUCache
+from app.config import settings
+
+# (last_message_time, conversation in response format)
+CachedConversation = Tuple[uuid.UUID, Dict[str, Any]]
+
+
+def _conversation_size(conversation: Dict[str, Any]) -> int:
+    return sys.getsizeof(conversation) + sum(sys.getsizeof(value) for value in conversation.values())
+
+
+class UserInbox:
+    """
+    The materialized conversation list of one user, latest first. `complete`
+    is set when it holds every conversation of the user.
+    """
+
+    __slots__ = ("conversations", "total", "complete", "size")
+
+    def __init__(self, conversations: List[CachedConversation], total: int, complete: bool):
+        self.conversations = conversations
+        self.total = total
+        self.complete = complete
+        self.size = sum(_conversation_size(conversation) for _, conversation in conversations)
+
+
+class InboxCache:
+    """
+    Memory-bounded LRU of per-user inbox listings.
+
+    Listings are loaded by inbox reads and updated in place by sends handled
+    in this process, for both participants. As with the message tail cache,
+    sends handled by other workers only show up once the entry expires, so
+    `ttl` bounds staleness across workers. As with the tail cache, a listing
+    read while one of the user's conversations was updated is not stored.
+    """
+
+    def __init__(self, max_conversations: int, max_bytes: int, ttl: float):
+        self.max_conversations = max_conversations
+        self._cache = LRUCache(max_bytes=max_bytes, ttl=ttl or None, sizeof=lambda inbox: inbox.size)
+        self._fills = FillTracker()
+        self.updates = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_conversations > 0
+
+    def get_page(self, user_id: int, start: int, limit: int) -> Optional[Tuple[List[CachedConversation], int]]:
+        """
+        Return (conversations, total) for a page, or None if the cached
+        listing does not cover it.
+        """
+
+        inbox = self._cache.get(user_id)
+        if inbox is None:
+            return None
+        if start + limit > len(inbox.conversations) and not inbox.complete:
+            return None
+        return inbox.conversations[start:start + limit], inbox.total
+
+    def begin_fill(self, user_id: int) -> int:
+        return self._fills.begin(user_id)
+
+    def end_fill(self, user_id: int, generation: int) -> bool:
+        """
+        Returns whether a listing read since begin_fill may be stored.
+        """
+
+        return self._fills.end(user_id, generation)
+
+    def store(self, user_id: int, conversations: List[CachedConversation], total: int, complete: bool) -> None:
+        if not self.enabled:
+            return
+        if len(conversations) > self.max_conversations:
+            conversations, complete = conversations[:self.max_conversations], False
+        self._cache.put(user_id, UserInbox(list(conversations), total, complete))
+
+    def record_message(
+        self,
+        user_id: int,
+        other_user_id: int,
+        conversation_id: str,
+        message_id: uuid.UUID,
+        message_text: str,
+        last_message_at: str
+    ) -> None:
+        """
+        Move a conversation to the top of a cached inbox after a send.
+        """
+
+        self._fills.written(user_id)
+        inbox = self._cache.peek(user_id)
+        if inbox is None:
+            return
+
+        conversations = inbox.conversations
+        for index, (last_message_time, conversation) in enumerate(conversations):
+            if conversation["id"] == conversation_id:
+                if last_message_time.time >= message_id.time:
+                    return
+                inbox.size -= _conversation_size(conversations.pop(index)[1])
+                break
+        else:
+            if not inbox.complete:
+                # The conversation may exist beyond the cached prefix, so the
+                # total is unknown: let the next read reload the listing.
+                self._cache.pop(user_id)
+                self.invalidations += 1
+                return
+            inbox.total += 1
+
+        conversation = {
+            "id": conversation_id,
+            "user1_id": user_id,
+            "user2_id": other_user_id,
+            "last_message_at": last_message_at,
+            "last_message_content": message_text,
+        }
+        index = 0
+        while index < len(conversations) and conversations[index][0].time > message_id.time:
+            index += 1
+        conversations.insert(index, (message_id, conversation))
+        inbox.size += _conversation_size(conversation)
+        while len(conversations) > self.max_conversations:
+            inbox.size -= _conversation_size(conversations.pop()[1])
+            inbox.complete = False
+        self.updates += 1
+        self._cache.resize(user_id)
+
+    def invalidate(self, user_id: int) -> None:
+        self._fills.written(user_id)
+        if self._cache.pop(user_id) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "updates": self.updates,
+            "invalidations": self.invalidations,
+            "dropped_fills": self._fills.dropped,
+        }
+
+
+inbox_cache = InboxCache(
+    max_conversations=settings.inbox_cache_conversations,
+    max_bytes=settings.inbox_cache_max_bytes,
+    ttl=settings.inbox_cache_ttl,
+)
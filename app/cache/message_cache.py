@@ -0,0 +1,176 @@
+import sys
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache.fill_tracker import FillTracker
+from app.cache.lru import LRUCache
+from app.config import settings
+
+# (message_id, message in response format)
+CachedMessage = Tuple[uuid.UUID, Dict[str, Any]]
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return sys.getsizeof(message) + sum(sys.getsizeof(value) for value in message.values())
+
+
+def _order_key(message_id: uuid.UUID) -> tuple:
+    return (message_id.time, message_id.bytes)
+
+
+class ConversationTail:
+    """
+    The newest messages of one conversation, newest first. `complete` is set
+    when the tail holds the whole conversation.
+    """
+
+    __slots__ = ("messages", "complete", "size")
+
+    def __init__(self, messages: List[CachedMessage], complete: bool):
+        self.messages = messages
+        self.complete = complete
+        self.size = sum(_message_size(message) for _, message in messages)
+
+
+class MessageTailCache:
+    """
+    Memory-bounded LRU of the newest `tail_size` messages per conversation.
+
+    Filled by first-page reads (read-through) and kept current by sends
+    handled in this process (write-through). Every process has its own
+    cache, so a message sent through another worker only becomes visible
+    here once the entry expires: `ttl` is the upper bound on staleness for
+    readers served by a different worker than the sender. Cross-worker
+    invalidation can call `invalidate`.
+
+    A read-through is bracketed by begin_fill and end_fill; its rows are
+    not stored if a message was appended meanwhile, since they could miss it.
+    """
+
+    def __init__(self, tail_size: int, max_bytes: int, ttl: float):
+        self.tail_size = tail_size
+        self._cache = LRUCache(max_bytes=max_bytes, ttl=ttl or None, sizeof=lambda tail: tail.size)
+        self._fills = FillTracker()
+
+    @property
+    def enabled(self) -> bool:
+        return self.tail_size > 0
+
+    def get_page(
+        self,
+        conversation_id: str,
+        start: int,
+        limit: int,
+        before_id: Optional[uuid.UUID] = None
+    ) -> Optional[Tuple[List[CachedMessage], bool]]:
+        """
+        Serve `limit` messages after skipping `start`, optionally only those
+        older than `before_id`. Returns (messages, has_more), or None when the
+        tail cannot answer the request on its own.
+        """
+
+        tail = self._cache.get(conversation_id)
+        if tail is None:
+            return None
+
+        messages = tail.messages
+        offset = 0
+        if before_id is not None:
+            bound = _order_key(before_id)
+            while offset < len(messages) and _order_key(messages[offset][0]) >= bound:
+                offset += 1
+
+        first = offset + start
+        if start and first >= len(messages):
+            # A page past the end: the caller counts the messages there are
+            return None
+        available = len(messages) - first
+        if available > limit:
+            return messages[first:first + limit], True
+        if tail.complete:
+            return messages[first:first + limit], False
+        return None
+
+    def get_after(self, conversation_id: str, after_id: uuid.UUID, limit: int) -> Optional[Tuple[List[CachedMessage], bool]]:
+        """
+        Serve up to `limit` messages newer than `after_id`, oldest first.
+        Returns (messages, has_more), or None when the tail does not reach
+        back to `after_id`.
+        """
+
+        tail = self._cache.get(conversation_id)
+        if tail is None:
+            return None
+
+        messages = tail.messages
+        bound = _order_key(after_id)
+        newer = 0
+        while newer < len(messages) and _order_key(messages[newer][0]) > bound:
+            newer += 1
+        if newer == len(messages) and not tail.complete:
+            return None
+        return messages[newer - 1::-1][:limit] if newer else [], newer > limit
+
+    def begin_fill(self, conversation_id: str) -> int:
+        """
+        Note that a read-through of a conversation is starting. Returns the
+        generation to pass to end_fill once the read is over.
+        """
+
+        return self._fills.begin(conversation_id)
+
+    def end_fill(self, conversation_id: str, generation: int) -> bool:
+        """
+        Note that a read-through finished or failed. Returns whether its rows
+        may be stored, i.e. no message was appended since it began.
+        """
+
+        return self._fills.end(conversation_id, generation)
+
+    def store(self, conversation_id: str, messages: List[CachedMessage], complete: bool) -> None:
+        """
+        Cache the newest messages of a conversation as read from Cassandra.
+        """
+
+        if not self.enabled:
+            return
+        if len(messages) > self.tail_size:
+            messages, complete = messages[:self.tail_size], False
+        self._cache.put(conversation_id, ConversationTail(list(messages), complete))
+
+    def append(self, conversation_id: str, message_id: uuid.UUID, message: Dict[str, Any]) -> None:
+        """
+        Add a freshly written message to a cached tail. Conversations that are
+        not cached are left alone: their tail gets loaded by the next read.
+        """
+
+        self._fills.written(conversation_id)
+        tail = self._cache.peek(conversation_id)
+        if tail is None:
+            return
+
+        key = _order_key(message_id)
+        index = 0
+        while index < len(tail.messages) and _order_key(tail.messages[index][0]) > key:
+            index += 1
+        tail.messages.insert(index, (message_id, message))
+        tail.size += _message_size(message)
+        while len(tail.messages) > self.tail_size:
+            _, dropped = tail.messages.pop()
+            tail.size -= _message_size(dropped)
+            tail.complete = False
+        self._cache.resize(conversation_id)
+
+    def invalidate(self, conversation_id: str) -> None:
+        self._fills.written(conversation_id)
+        self._cache.pop(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "dropped_fills": self._fills.dropped}
+
+
+message_cache = MessageTailCache(
+    tail_size=settings.message_tail_size,
+    max_bytes=settings.message_cache_max_bytes,
+    ttl=settings.message_cache_ttl,
+)
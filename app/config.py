@@ -0,0 +1,193 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_list(name: str, default: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+def _env_choice(name: str, default: str, choices: Tuple[str, ...]) -> str:
+    value = os.getenv(name, default).strip().lower()
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {', '.join(choices)}, got '{value}'")
+    return value
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class ProfileSettings:
+    """
+    Tuning of one named execution profile. Every field can be overridden with
+    CASSANDRA_PROFILE_<NAME>_<FIELD>, e.g. CASSANDRA_PROFILE_READ_HOT_TIMEOUT=1.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        consistency: str,
+        timeout: float,
+        retry: str = "default",
+        speculative_delay: float = 0,
+        speculative_attempts: int = 0
+    ):
+        prefix = f"CASSANDRA_PROFILE_{name.upper()}_"
+        self.name = name
+        self.consistency = os.getenv(prefix + "CONSISTENCY", consistency).upper()
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", str(timeout)))
+        # "default" retries timeouts/unavailable once where safe, "fallthrough" never retries
+        self.retry = os.getenv(prefix + "RETRY", retry).lower()
+        # Speculative executions are only sent for idempotent statements; 0 disables them
+        self.speculative_delay = float(os.getenv(prefix + "SPECULATIVE_DELAY", str(speculative_delay)))
+        self.speculative_attempts = int(os.getenv(prefix + "SPECULATIVE_ATTEMPTS", str(speculative_attempts)))
+
+
+class Settings:
+    """
+    Application settings, read from the environment.
+    """
+
+    def __init__(self):
+        # Serving (python -m app.main). Every worker process opens its own
+        # Cassandra connections when it starts. One worker by default: caches,
+        # metrics and the inprocess realtime transport are per worker.
+        self.app_host = os.getenv("APP_HOST", "0.0.0.0")
+        self.app_port = int(os.getenv("APP_PORT", "8000"))
+        self.web_workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        # Development auto-reload; forces a single worker
+        self.app_reload = _env_bool("APP_RELOAD", False)
+        # Seconds in-flight requests and streams get to finish on shutdown
+        self.graceful_shutdown_timeout = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+
+        # Where the models' statements run (see app/db/storage.py): "cassandra",
+        # or "memory" for in-process tables with the same schema, for tests and
+        # benchmarks. Memory data is per worker and lost when it exits.
+        self.storage_backend = _env_choice("STORAGE_BACKEND", "cassandra", ("cassandra", "memory"))
+        # Seconds every statement (and every further page) of the memory backend
+        # takes, plus up to STORAGE_MEMORY_JITTER more, to simulate round trips
+        self.storage_memory_latency = float(os.getenv("STORAGE_MEMORY_LATENCY", "0"))
+        self.storage_memory_jitter = float(os.getenv("STORAGE_MEMORY_JITTER", "0"))
+
+        # Cassandra connection. CASSANDRA_HOSTS takes a comma separated list of
+        # contact points; CASSANDRA_HOST is kept for single-node setups.
+        self.cassandra_hosts = _env_list("CASSANDRA_HOSTS", os.getenv("CASSANDRA_HOST", "localhost"))
+        self.cassandra_port = int(os.getenv("CASSANDRA_PORT", "9042"))
+        self.cassandra_keyspace = os.getenv("CASSANDRA_KEYSPACE", "messenger")
+        self.cassandra_local_dc = os.getenv("CASSANDRA_LOCAL_DC") or None
+        self.cassandra_protocol_version = _env_int("CASSANDRA_PROTOCOL_VERSION")
+        self.cassandra_username = os.getenv("CASSANDRA_USERNAME") or None
+        self.cassandra_password = os.getenv("CASSANDRA_PASSWORD") or None
+        # "true" lets the driver pick lz4/snappy, "lz4"/"snappy" forces one, "false" disables it
+        self.cassandra_compression = os.getenv("CASSANDRA_COMPRESSION", "true").strip().lower()
+        self.cassandra_connect_timeout = float(os.getenv("CASSANDRA_CONNECT_TIMEOUT", "5"))
+        self.cassandra_control_connection_timeout = float(os.getenv("CASSANDRA_CONTROL_CONNECTION_TIMEOUT", "2"))
+        self.cassandra_request_timeout = float(os.getenv("CASSANDRA_REQUEST_TIMEOUT", "10"))
+        self.cassandra_executor_threads = int(os.getenv("CASSANDRA_EXECUTOR_THREADS", "2"))
+        # Delay before retrying a failed connect, doubled after every failure up to the max
+        self.cassandra_connect_backoff = float(os.getenv("CASSANDRA_CONNECT_BACKOFF", "0.5"))
+        self.cassandra_connect_backoff_max = float(os.getenv("CASSANDRA_CONNECT_BACKOFF_MAX", "30"))
+        # Connection pool sizing; only honoured by protocol versions 1 and 2.
+        # Protocol v3+ multiplexes up to 32k requests over one connection per host.
+        self.cassandra_core_connections = _env_int("CASSANDRA_CORE_CONNECTIONS_PER_HOST")
+        self.cassandra_max_connections = _env_int("CASSANDRA_MAX_CONNECTIONS_PER_HOST")
+        self.cassandra_max_requests_per_connection = _env_int("CASSANDRA_MAX_REQUESTS_PER_CONNECTION")
+
+        # Admission control: Cassandra requests in flight per process, by kind.
+        # Requests over the limit wait in a queue of CASSANDRA_ADMISSION_QUEUE
+        # entries for at most CASSANDRA_ADMISSION_TIMEOUT seconds, then get a 503.
+        # 0 disables the limit.
+        self.cassandra_max_inflight_reads = int(os.getenv("CASSANDRA_MAX_INFLIGHT_READS", "256"))
+        self.cassandra_max_inflight_writes = int(os.getenv("CASSANDRA_MAX_INFLIGHT_WRITES", "128"))
+        self.cassandra_admission_queue = int(os.getenv("CASSANDRA_ADMISSION_QUEUE", "1024"))
+        self.cassandra_admission_timeout = float(os.getenv("CASSANDRA_ADMISSION_TIMEOUT", "1"))
+        # Lower the limits below the maximums above while requests take longer than the target
+        self.cassandra_admission_adaptive = _env_bool("CASSANDRA_ADMISSION_ADAPTIVE", False)
+        self.cassandra_admission_target_latency = float(os.getenv("CASSANDRA_ADMISSION_TARGET_LATENCY", "0.05"))
+
+        # Statements whose first page takes longer than this many seconds are
+        # logged by the app.db.slow_query logger (0 disables it)
+        self.cassandra_slow_query_threshold = float(os.getenv("CASSANDRA_SLOW_QUERY_THRESHOLD", "0.5"))
+        # Fraction of statements sent with Cassandra tracing on (0 to 1)
+        self.cassandra_trace_sample_rate = float(os.getenv("CASSANDRA_TRACE_SAMPLE_RATE", "0"))
+        # Requests carrying "X-Trace-Query: <token>" trace all their statements and
+        # get a summary in the X-Query-Trace response header. Unset disables the header.
+        self.cassandra_trace_token = os.getenv("CASSANDRA_TRACE_TOKEN") or None
+        # Seconds to wait for a trace to be written to system_traces
+        self.cassandra_trace_max_wait = float(os.getenv("CASSANDRA_TRACE_MAX_WAIT", "2"))
+
+        # Execution profiles selected per call site in the models
+        self.execution_profiles: Dict[str, ProfileSettings] = {
+            profile.name: profile for profile in (
+                # Latest messages, inboxes and lookups on the request path
+                ProfileSettings("read_hot", "LOCAL_QUORUM", timeout=2, speculative_delay=0.05, speculative_attempts=2),
+                # Older pages of a conversation: immutable data, one replica is enough
+                ProfileSettings("read_history", "LOCAL_ONE", timeout=5, speculative_delay=0.1, speculative_attempts=1),
+                ProfileSettings("write_message", "LOCAL_QUORUM", timeout=5),
+                ProfileSettings("write_inbox", "LOCAL_QUORUM", timeout=2),
+            )
+        }
+
+        # Bulk message ingestion (POST /api/messages/batch)
+        self.message_batch_max_size = int(os.getenv("MESSAGE_BATCH_MAX_SIZE", "1000"))
+        # Rows per single-partition unlogged batch
+        self.message_batch_chunk_size = int(os.getenv("MESSAGE_BATCH_CHUNK_SIZE", "20"))
+        self.message_batch_concurrency = int(os.getenv("MESSAGE_BATCH_CONCURRENCY", "32"))
+
+        # Message storage layout: "flat" (messages), "dual" (write messages and
+        # messages_by_bucket, read messages; while scripts/migrate_message_buckets.py
+        # runs) or "bucketed" (messages_by_bucket only)
+        self.message_layout = _env_choice("MESSAGE_LAYOUT", "flat", ("flat", "dual", "bucketed"))
+        # Partition size of messages_by_bucket: "day" or "month". Fixed once data is written.
+        self.message_bucket = _env_choice("MESSAGE_BUCKET", "month", ("day", "month"))
+
+        # Listings: largest `limit` of a page, and how deep page-number paging
+        # of messages goes (page * limit); deeper pages need the cursor
+        self.page_max_limit = int(os.getenv("PAGE_MAX_LIMIT", "100"))
+        self.page_max_depth = int(os.getenv("PAGE_MAX_DEPTH", "1000"))
+        # Delta sync: messages per conversation, and conversations per request
+        self.sync_max_limit = int(os.getenv("SYNC_MAX_LIMIT", "1000"))
+        self.sync_max_conversations = int(os.getenv("SYNC_MAX_CONVERSATIONS", "100"))
+
+        # Conversation export (GET /api/messages/conversation/{id}/export): rows per page
+        self.message_export_fetch_size = int(os.getenv("MESSAGE_EXPORT_FETCH_SIZE", "1000"))
+
+        # Conversation directory (participant pair -> conversation_id)
+        self.conversation_cache_size = int(os.getenv("CONVERSATION_CACHE_SIZE", "100000"))
+        self.conversation_cache_ttl = float(os.getenv("CONVERSATION_CACHE_TTL", "3600"))
+        # Check for legacy "{larger}_{smaller}" conversation ids on cache misses.
+        # Disable once scripts/migrate_conversation_ids.py has run.
+        self.conversation_legacy_lookup = _env_bool("CONVERSATION_LEGACY_LOOKUP", True)
+
+        # Per-conversation tail cache of recent messages (0 disables it)
+        self.message_tail_size = int(os.getenv("MESSAGE_TAIL_SIZE", "50"))
+        self.message_cache_max_bytes = int(os.getenv("MESSAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        # Upper bound on how stale a tail can be for messages sent through other workers
+        self.message_cache_ttl = float(os.getenv("MESSAGE_CACHE_TTL", "2"))
+
+        # Per-user inbox listing cache (0 disables it)
+        self.inbox_cache_conversations = int(os.getenv("INBOX_CACHE_CONVERSATIONS", "100"))
+        self.inbox_cache_max_bytes = int(os.getenv("INBOX_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.inbox_cache_ttl = float(os.getenv("INBOX_CACHE_TTL", "2"))
+        # Seconds inbox updates are buffered so that only the newest per (user,
+        # conversation) is written (0 writes every update with its message).
+        # Buffered updates are lost if the process crashes; see app/models/inbox_coalescer.py
+        self.inbox_coalesce_window = float(os.getenv("INBOX_COALESCE_WINDOW", "0"))
+        # Buffered (user, conversation) pairs that trigger an early flush
+        self.inbox_coalesce_max_pending = int(os.getenv("INBOX_COALESCE_MAX_PENDING", "10000"))
+
+        # Real-time push (WebSocket/SSE)
+        # Events buffered per subscriber before it is dropped as a slow consumer
+        self.realtime_queue_size = int(os.getenv("REALTIME_QUEUE_SIZE", "256"))
+        # How events reach the subscribers of other workers (see app/realtime/hub.py)
+        self.realtime_transport = os.getenv("REALTIME_TRANSPORT", "inprocess")
+        # Seconds between keep-alives on idle SSE streams
+        self.realtime_heartbeat = float(os.getenv("REALTIME_HEARTBEAT", "15"))
+
+
+settings = Settings()
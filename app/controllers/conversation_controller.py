@@ -1,7 +1,8 @@
 from fastapi import HTTPException, status
+from app.api.responses import PrebuiltJSONResponse
 from app.models.cassandra_models import ConversationModel
 
-from app.schemas.conversation import ConversationResponse, PaginatedConversationResponse
+from app.schemas.conversation import ConversationResponse
 
 class ConversationController:
 
@@ -13,8 +14,8 @@ class ConversationController:
         user_id: int, 
         page: int = 1, 
         limit: int = 20
-    ) -> PaginatedConversationResponse:
-        return await self.conversation_model.get_user_conversations(user_id, page, limit)
+    ) -> PrebuiltJSONResponse:
+        return PrebuiltJSONResponse(await self.conversation_model.get_user_conversations(user_id, page, limit))
     
     async def get_conversation(self, conversation_id: str) -> ConversationResponse:
         return await self.conversation_model.get_conversation(conversation_id)
\ No newline at end of file
@@ -1,11 +1,16 @@
-from typing import Optional
+import asyncio
+import zlib
+from typing import List, Optional, AsyncIterator
 from datetime import datetime
 from fastapi import HTTPException, status
-from app.db.cassandra_client import cassandra_client
-from app.models.cassandra_models import MessageModel
+from fastapi.responses import StreamingResponse
+from app.api.responses import PrebuiltJSONResponse, dumps
+from app.models.cassandra_models import MessageModel, MessageWriteError, row_to_message
 from app.models.cassandra_models import ConversationModel
 
-from app.schemas.message import MessageCreate, MessageResponse, PaginatedMessageResponse
+from app.config import settings
+from app.realtime.hub import message_hub
+from app.schemas.message import MessageCreate, MessageResponse, BatchMessageResponse
 
 class MessageController:
 
@@ -15,24 +20,62 @@ class MessageController:
     
     async def send_message(self, message_data: MessageCreate) -> MessageResponse:
         conversation_id = await self.conversation_model.create_or_get_conversation(message_data.sender_id, message_data.receiver_id)
-        return await self.message_model.create_message(
-            conversation_id=conversation_id,
-            sender_id=message_data.sender_id,
-            recipient_id=message_data.receiver_id,
-            message_text=message_data.content
+        try:
+            message = await self.message_model.create_message(
+                conversation_id=conversation_id,
+                sender_id=message_data.sender_id,
+                recipient_id=message_data.receiver_id,
+                message_text=message_data.content
+            )
+        except MessageWriteError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        await message_hub.publish((message_data.sender_id, message_data.receiver_id), {"type": "message", "message": message})
+        return message
+    
+    async def send_messages(self, messages: List[MessageCreate]) -> BatchMessageResponse:
+        if len(messages) > settings.message_batch_max_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"A batch can hold at most {settings.message_batch_max_size} messages"
+            )
+
+        pairs = list({(message.sender_id, message.receiver_id) for message in messages})
+        conversation_ids = await asyncio.gather(
+            *(self.conversation_model.create_or_get_conversation(sender_id, receiver_id) for sender_id, receiver_id in pairs)
         )
+        conversations = dict(zip(pairs, conversation_ids))
+
+        results = await self.message_model.create_messages([
+            (conversations[(message.sender_id, message.receiver_id)], message.sender_id, message.receiver_id, message.content)
+            for message in messages
+        ])
+
+        items = []
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                items.append({"index": index, "status": "failed", "error": str(result)})
+            else:
+                items.append({"index": index, "status": "created", "message": result})
+                await message_hub.publish((result["sender_id"], result["receiver_id"]), {"type": "message", "message": result})
+        created = sum(item["status"] == "created" for item in items)
+        return {"created": created, "failed": len(items) - created, "results": items}
     
     async def get_conversation_messages(
         self, 
         conversation_id: str, 
         page: int = 1, 
-        limit: int = 20
-    ) -> PaginatedMessageResponse:        
-        return await self.message_model.get_conversation_messages(
-            conversation_id=conversation_id,
-            page=page,
-            limit=limit
-        )
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> PrebuiltJSONResponse:
+        try:
+            return PrebuiltJSONResponse(await self.message_model.get_conversation_messages(
+                conversation_id=conversation_id,
+                page=page,
+                limit=limit,
+                cursor=cursor
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     
     async def get_messages_before_timestamp(
@@ -40,18 +83,85 @@ class MessageController:
         conversation_id: int, 
         before_timestamp: datetime,
         page: int = 1, 
-        limit: int = 20
-    ) -> PaginatedMessageResponse:
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> PrebuiltJSONResponse:
         
-        conversation_id = conversation_id
-        before_timestamp = before_timestamp
-        page = page
-        limit = limit
-
-        return await self.message_model.get_messages_before_timestamp(
-            conversation_id=conversation_id,
-            before_timestamp=before_timestamp,
-            page=page,
-            limit=limit
+        try:
+            return PrebuiltJSONResponse(await self.message_model.get_messages_before_timestamp(
+                conversation_id=conversation_id,
+                before_timestamp=before_timestamp,
+                page=page,
+                limit=limit,
+                cursor=cursor
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def get_messages_since(self, conversation_id: str, after: str, limit: int = 100) -> PrebuiltJSONResponse:
+        try:
+            return PrebuiltJSONResponse(await self.message_model.get_messages_since(
+                conversation_id=conversation_id,
+                after=after,
+                limit=limit
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def get_user_messages_since(
+        self,
+        user_id: int,
+        after: str,
+        limit: int = 100,
+        max_conversations: int = 20
+    ) -> PrebuiltJSONResponse:
+        try:
+            return PrebuiltJSONResponse(await self.message_model.get_user_messages_since(
+                user_id=user_id,
+                after=after,
+                limit=limit,
+                max_conversations=max_conversations
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def export_conversation_messages(
+        self,
+        conversation_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        after_id: Optional[str] = None,
+        gzip: bool = False
+    ) -> StreamingResponse:
+        try:
+            pager = await self.message_model.export_messages(
+                conversation_id=conversation_id,
+                start=start,
+                end=end,
+                after_id=after_id
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        async def ndjson() -> AsyncIterator[bytes]:
+            # One chunk per Cassandra page; the next page is only requested
+            # once the client has taken the current one.
+            page = await pager.next_page()
+            while page is not None:
+                yield b"".join(dumps(row_to_message(row)) + b"\n" for row in page)
+                page = await pager.next_page()
+
+        async def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+            compressor = zlib.compressobj(wbits=31)
+            async for chunk in chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+
+        filename = f"{conversation_id}.ndjson.gz" if gzip else f"{conversation_id}.ndjson"
+        return StreamingResponse(
+            gzipped(ndjson()) if gzip else ndjson(),
+            media_type="application/gzip" if gzip else "application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
-        
\ No newline at end of file
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from typing import AsyncIterator
+from fastapi import Request, WebSocket
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketState
+
+from app.config import settings
+from app.realtime.hub import message_hub
+
+class RealtimeController:
+
+    def __init__(self):
+        self.hub = message_hub
+
+    async def stream_websocket(self, websocket: WebSocket, user_id: int) -> None:
+        """
+        Push the events of a user over a WebSocket until either side closes it.
+        """
+        await websocket.accept()
+        await self.hub.start()
+        subscription = self.hub.subscribe(user_id)
+
+        async def wait_for_disconnect() -> None:
+            # Clients have nothing to send; this only notices disconnects.
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+
+        receiver = asyncio.create_task(wait_for_disconnect())
+        receiver.add_done_callback(lambda _: subscription.close())
+        try:
+            event = await subscription.get()
+            while event is not None:
+                await websocket.send_json(event)
+                event = await subscription.get()
+        finally:
+            receiver.cancel()
+            self.hub.unsubscribe(subscription)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+    async def stream_events(self, request: Request, user_id: int) -> StreamingResponse:
+        """
+        Push the events of a user as Server-Sent Events.
+        """
+        await self.hub.start()
+
+        async def events() -> AsyncIterator[str]:
+            # Subscribed only once the response is being sent: a client gone
+            # before the first chunk never runs the generator, so a
+            # subscription made earlier would never be removed.
+            subscription = self.hub.subscribe(user_id)
+            try:
+                while True:
+                    try:
+                        event = await subscription.get(settings.realtime_heartbeat)
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keep-alive\n\n"
+                        continue
+                    if event is None:
+                        return
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            finally:
+                self.hub.unsubscribe(subscription)
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised instead of sending a request to Cassandra when the process
+    already has as many in flight as it allows and the wait queue is full,
+    or the request waited longer than its queue timeout.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    Caps the Cassandra requests of one kind (reads or writes) in flight in
+    this process. Requests over the limit wait in a bounded FIFO queue;
+    once the queue is full they are rejected right away, so a slow cluster
+    turns into fast 503s instead of a growing backlog.
+
+    With `adaptive`, the limit follows observed latency (AIMD): it grows by
+    about one per limit's worth of requests completing under
+    `target_latency` while the limit is in use, and shrinks by 10% (at most
+    once per round trip) when a request is slower or fails. `max_limit`
+    bounds it from above, `min_limit` from below.
+
+    Must be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        adaptive: bool = False,
+        target_latency: float = 0.05,
+        min_limit: int = 4
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_limit > 0
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot. Returns the time it was granted, to be passed back to
+        release(). Raises AdmissionRejected if the queue is full or the wait
+        exceeds the queue timeout.
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return time.monotonic()
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(f"Too many concurrent Cassandra {self.name}s, try again later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                self.timed_out += 1
+                raise AdmissionRejected(f"Timed out waiting for a Cassandra {self.name} slot")
+        except asyncio.CancelledError:
+            if waiter.done():
+                # The slot was handed over already; pass it on.
+                self._release_slot()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        # in_flight was incremented on our behalf when the waiter was woken.
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, started: float, failed: bool = False) -> None:
+        """
+        Give back the slot taken at `started`, adapting the limit to how long
+        the request took.
+        """
+        if self.adaptive:
+            self._adapt(time.monotonic() - started, failed)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        # Admit the oldest waiters while the (possibly changed) limit allows.
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _adapt(self, latency: float, failed: bool) -> None:
+        now = time.monotonic()
+        if failed or latency > self.target_latency:
+            if now - self._last_decrease >= latency:
+                self._last_decrease = now
+                self.limit = max(float(self.min_limit), self.limit * 0.9)
+        elif self.in_flight >= int(self.limit):
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
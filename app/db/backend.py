@@ -0,0 +1,159 @@
+import asyncio
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cassandra import OperationTimedOut, Timeout
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+
+from app.config import settings
+from app.db.admission import AdmissionLimiter
+
+
+def is_read(query: str) -> bool:
+    return query.lstrip()[:6].upper() == "SELECT"
+
+
+class StorageBackend:
+    """
+    What the models need from a database: statements registered by name and
+    run asynchronously, and a connection the warm-up opens before the first
+    request. Statements are CQL with `?` bind markers; rows are dicts.
+
+    CassandraClient runs them on a cluster, MemoryClient against in-process
+    tables with the same schema. STORAGE_BACKEND picks one (app/db/storage.py).
+    Both take an admission slot per statement (_admit) and report it through
+    a QueryObserver (app/db/observer.py).
+    """
+
+    def __init__(self):
+        # CQL text -> name it was registered under
+        self._statement_names: Dict[str, str] = {}
+
+        # Admission control of async requests; see app/db/admission.py
+        self.admission: Dict[str, AdmissionLimiter] = {
+            kind: AdmissionLimiter(
+                kind,
+                max_limit=max_limit,
+                max_queue=settings.cassandra_admission_queue,
+                queue_timeout=settings.cassandra_admission_timeout,
+                adaptive=settings.cassandra_admission_adaptive,
+                target_latency=settings.cassandra_admission_target_latency,
+            )
+            for kind, max_limit in (
+                ("read", settings.cassandra_max_inflight_reads),
+                ("write", settings.cassandra_max_inflight_writes),
+            )
+        }
+
+    def statement(self, name: str, query: str) -> str:
+        """
+        Register a CQL statement (with `?` bind markers) under a name and
+        return its text, so models can declare their queries as constants.
+        """
+        self._statement_names[query] = name
+        return query
+
+    def statement_name(self, query: str) -> str:
+        return self._statement_names.get(query, "adhoc")
+
+    @property
+    def connected(self) -> bool:
+        raise NotImplementedError
+
+    def ensure_connected(self, wait_for_all_pools: bool = False) -> Any:
+        """
+        Connect if not connected yet. Blocking; called by the warm-up.
+        """
+        raise NotImplementedError
+
+    def hosts_up(self) -> int:
+        raise NotImplementedError
+
+    def retry_delay(self) -> float:
+        """
+        Seconds until the next connection attempt is allowed.
+        """
+        return 0.0
+
+    def prepare_all(self) -> int:
+        """
+        Get every registered statement ready to run. Returns how many were
+        prepared.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def prepared_stats(self) -> Dict[str, int]:
+        """
+        Lookups of the registered statements: hits and misses of the cache of
+        ready-to-run statements, and how many it holds.
+        """
+        raise NotImplementedError
+
+    def admission_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {kind: limiter.stats() for kind, limiter in self.admission.items()}
+
+    async def _admit(self, kind: str) -> Optional[Callable[[Optional[Exception]], None]]:
+        """
+        Take an admission slot for a read or write request. Returns the
+        callback that gives it back once the response arrives, or None if
+        admission control is disabled for that kind.
+        """
+        limiter = self.admission[kind]
+        if not limiter.enabled:
+            return None
+        started = await limiter.acquire()
+
+        def release(exc: Optional[Exception]) -> None:
+            # Only timeouts say something about the cluster's load.
+            limiter.release(started, failed=isinstance(exc, (OperationTimedOut, Timeout)))
+
+        return release
+
+    async def aiter(self, query: str, params: tuple = None, fetch_size: Optional[int] = None, profile=EXEC_PROFILE_DEFAULT):
+        """
+        Start a query and return a pager over its rows: next_page() returns
+        the next page (None once exhausted), all() every remaining row, and
+        it can be iterated with `async for`. `profile` names the execution
+        profile of the call site.
+        """
+        raise NotImplementedError
+
+    async def aexecute(self, query: str, params: tuple = None, profile=EXEC_PROFILE_DEFAULT) -> List[Dict[str, Any]]:
+        """
+        Run a query and return every row of its result.
+        """
+        raise NotImplementedError
+
+    async def abatch(self, statements: Iterable[Tuple[str, Any]], logged: bool = False, profile=EXEC_PROFILE_DEFAULT) -> None:
+        """
+        Execute (query, params) pairs as one batch. Batches are unlogged by
+        default and meant for statements sharing a partition key.
+        """
+        raise NotImplementedError
+
+    async def aexecute_many(
+        self,
+        statements: Iterable[Tuple[str, Any]],
+        concurrency: int = 100,
+        return_exceptions: bool = False,
+        profile=EXEC_PROFILE_DEFAULT
+    ) -> List[Any]:
+        """
+        Run (query, params) pairs concurrently, keeping at most `concurrency`
+        of them in flight. Results are returned in input order; with
+        return_exceptions=True a failed query yields its exception. Otherwise
+        the first failure is raised, while the queries already sent keep
+        running and those still waiting for a slot are started anyway.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(query, params):
+            async with semaphore:
+                return await self.aexecute(query, params, profile=profile)
+
+        return await asyncio.gather(
+            *(run(query, params) for query, params in statements),
+            return_exceptions=return_exceptions
+        )
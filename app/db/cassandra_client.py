@@ -1,16 +1,140 @@
 import os
-import uuid
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import time
+import random
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Tuple, Callable
 import logging
 
-from cassandra.cluster import Cluster, Session
-from cassandra.auth import PlainTextAuthProvider
-from cassandra.query import SimpleStatement, dict_factory
+from cassandra.cluster import Session, EXEC_PROFILE_DEFAULT
+from cassandra import InvalidRequest
+from cassandra.query import PreparedStatement, BoundStatement, BatchStatement, BatchType
+
+from app.config import settings
+from app.db.admission import AdmissionRejected
+from app.db.backend import StorageBackend, is_read
+from app.db.connection import create_cluster
+from app.db.observer import QueryObserver
 
 logger = logging.getLogger(__name__)
 
-class CassandraClient:
+
+def is_idempotent(query: str) -> bool:
+    """
+    Reads, and writes carrying an explicit USING TIMESTAMP, can be safely
+    retried or sent speculatively to another replica.
+    """
+    normalized = " ".join(query.split()).upper()
+    return normalized.startswith("SELECT") or "USING TIMESTAMP" in normalized
+
+
+class CassandraUnavailable(Exception):
+    """
+    Raised instead of connecting while the client is not connected yet, or
+    is waiting out the backoff of a failed connection attempt.
+    """
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AsyncResultPager:
+    """
+    Bridges a driver ResponseFuture into asyncio.
+
+    The driver invokes the registered callbacks from its event thread once
+    per page; each page is handed to the asyncio loop through
+    call_soon_threadsafe. The next page is only requested once the current
+    one has been consumed, so a slow consumer never buffers more than one page.
+
+    `on_response`, if given, is called on the loop with the first page (or
+    None) and the error (or None) once either arrives, even if nobody awaits
+    it anymore; `on_page` with the rows of every page.
+    """
+
+    def __init__(
+        self,
+        response_future,
+        loop: asyncio.AbstractEventLoop,
+        on_response: Optional[Callable[[Any, Optional[Exception]], None]] = None,
+        on_page: Optional[Callable[[Any], None]] = None
+    ):
+        self._response_future = response_future
+        self._loop = loop
+        self._waiter = loop.create_future()
+        self._rows = iter(())
+        self._on_response = on_response
+        self._on_page_rows = on_page
+        response_future.add_callbacks(self._on_page, self._on_error)
+
+    def _on_page(self, rows) -> None:
+        self._loop.call_soon_threadsafe(self._resolve, rows, None)
+
+    def _on_error(self, exc: Exception) -> None:
+        self._loop.call_soon_threadsafe(self._resolve, None, exc)
+
+    def _resolve(self, rows, exc: Optional[Exception]) -> None:
+        if self._on_response is not None:
+            on_response, self._on_response = self._on_response, None
+            on_response(rows, exc)
+        if exc is None and self._on_page_rows is not None:
+            self._on_page_rows(rows)
+        if self._waiter is None or self._waiter.done():
+            return
+        if exc is not None:
+            self._waiter.set_exception(exc)
+        else:
+            self._waiter.set_result(rows)
+
+    async def next_page(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Wait for the next page of rows. Returns None once the result is exhausted.
+        """
+        if self._waiter is None:
+            return None
+
+        rows = await self._waiter
+        if self._response_future.has_more_pages:
+            self._waiter = self._loop.create_future()
+            self._response_future.start_fetching_next_page()
+        else:
+            self._waiter = None
+        return list(rows or [])
+
+    async def all(self) -> List[Dict[str, Any]]:
+        """
+        Collect every remaining row.
+        """
+        result = []
+        page = await self.next_page()
+        while page is not None:
+            result.extend(page)
+            page = await self.next_page()
+        return result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        while True:
+            for row in self._rows:
+                return row
+            page = await self.next_page()
+            if page is None:
+                raise StopAsyncIteration
+            self._rows = iter(page)
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class CassandraClient(StorageBackend):
     
     _instance = None
     
@@ -24,61 +148,338 @@ class CassandraClient:
 
         if self._initialized:
             return
-        
-        self.host = os.getenv("CASSANDRA_HOST", "localhost")
-        self.port = int(os.getenv("CASSANDRA_PORT", "9042"))
-        self.keyspace = os.getenv("CASSANDRA_KEYSPACE", "messenger")
+        super().__init__()
+
+        self.hosts = settings.cassandra_hosts
+        self.port = settings.cassandra_port
+        self.keyspace = settings.cassandra_keyspace
         
         self.cluster = None
         self.session = None
-        self.connect()
-        
+        # Process that opened the current session; see _ensure_session.
+        self._pid = None
+        self._connect_lock = threading.Lock()
+        # Exponential backoff between failed connection attempts
+        self.connect_failures = 0
+        self._retry_at = 0.0
+
+        # Prepared-statement registry: CQL text -> PreparedStatement for the
+        # current session (statement names are kept by StorageBackend).
+        self._prepared: Dict[str, PreparedStatement] = {}
+        self._prepared_lock = threading.Lock()
+        self.prepared_hits = 0
+        self.prepared_misses = 0
+
+        # Connections are opened by the app's warm-up task in every worker
+        # process (app/db/warmup.py), never at import time.
         self._initialized = True
     
-    def connect(self) -> None:
+    def connect(self, wait_for_all_pools: bool = False) -> None:
+        """
+        Open the cluster and session. With wait_for_all_pools, return only
+        once a connection pool is open to every host that is not ignored by
+        the load balancing policy, rather than to the first one.
 
+        A failure schedules the next attempt after an exponentially growing,
+        jittered delay; see retry_delay().
+        """
         try:
-            self.cluster = Cluster([self.host])
-            self.session = self.cluster.connect(self.keyspace)
-            self.session.row_factory = dict_factory
-            logger.info(f"Connected to Cassandra at {self.host}:{self.port}, keyspace: {self.keyspace}")
+            cluster = create_cluster(settings)
+            try:
+                session = cluster.connect(self.keyspace, wait_for_all_pools=wait_for_all_pools)
+            except Exception:
+                cluster.shutdown()
+                raise
         except Exception as e:
-            logger.error(f"Failed to connect to Cassandra: {str(e)}")
+            self.connect_failures += 1
+            delay = min(
+                settings.cassandra_connect_backoff * 2 ** (self.connect_failures - 1),
+                settings.cassandra_connect_backoff_max
+            )
+            delay = random.uniform(delay / 2, delay)
+            self._retry_at = time.monotonic() + delay
+            logger.error(
+                f"Failed to connect to Cassandra (attempt {self.connect_failures}, retrying in {delay:.1f}s): {str(e)}"
+            )
             raise
+
+        self.cluster = cluster
+        self.session = session
+        self._pid = os.getpid()
+        self.connect_failures = 0
+        self._retry_at = 0.0
+        # Statements are prepared per session; start from scratch on (re)connect.
+        self.invalidate_prepared()
+        logger.info(
+            f"Connected to Cassandra at {','.join(self.hosts)}:{self.port}, keyspace: {self.keyspace} (pid {self._pid})"
+        )
+
+    @property
+    def connected(self) -> bool:
+        return self.session is not None and self._pid == os.getpid()
+
+    def retry_delay(self) -> float:
+        """
+        Seconds until the next connection attempt is allowed.
+        """
+        return max(0.0, self._retry_at - time.monotonic())
+
+    def hosts_up(self) -> int:
+        if not self.connected:
+            return 0
+        return sum(1 for host in self.cluster.metadata.all_hosts() if host.is_up)
     
     def close(self) -> None:
 
-        if self.cluster:
-            self.cluster.shutdown()
-            logger.info("Cassandra connection closed")
+        # Waits for a connection attempt in progress, so it is not left open.
+        with self._connect_lock:
+            if self.cluster and self._pid == os.getpid():
+                self.cluster.shutdown()
+                logger.info("Cassandra connection closed")
+            self.cluster = None
+            self.session = None
+            self._pid = None
+
+    def _ensure_session(self) -> Session:
+        """
+        Return a session owned by the current process, connecting if needed.
+
+        A session inherited through fork() (e.g. a pre-forking server with
+        the app preloaded) shares sockets with the parent and has lost the
+        driver's threads, so it is abandoned, without shutting it down, and
+        a new one is opened in this process.
+
+        Connecting blocks, so it is never done on an event loop thread, nor
+        while another thread is connecting or a failed attempt is backing
+        off: CassandraUnavailable is raised instead. The app connects from
+        its warm-up task (app/db/warmup.py).
+        """
+        session = self.session
+        if session is not None and self._pid == os.getpid():
+            return session
+
+        if not self._connect_lock.acquire(blocking=False):
+            raise CassandraUnavailable("Cassandra connection in progress", settings.cassandra_connect_backoff)
+        try:
+            self._drop_inherited_session()
+            if self.session is None:
+                delay = self.retry_delay()
+                if delay > 0:
+                    raise CassandraUnavailable(f"Cassandra unavailable, next connection attempt in {delay:.1f}s", delay)
+                if _on_event_loop():
+                    raise CassandraUnavailable("Cassandra is not connected yet", settings.cassandra_connect_backoff)
+                self.connect()
+            return self.session
+        finally:
+            self._connect_lock.release()
+
+    def ensure_connected(self, wait_for_all_pools: bool = False) -> Session:
+        """
+        Blocking counterpart of _ensure_session for startup code: waits for
+        any connection attempt in progress and ignores the backoff.
+        """
+        with self._connect_lock:
+            self._drop_inherited_session()
+            if self.session is None:
+                self.connect(wait_for_all_pools)
+            return self.session
+
+    def _drop_inherited_session(self) -> None:
+        if self.session is not None and self._pid != os.getpid():
+            logger.warning(f"Cassandra session was opened by pid {self._pid}; reconnecting in pid {os.getpid()}")
+            self.cluster = None
+            self.session = None
+
+    def prepare(self, query: str) -> PreparedStatement:
+        """
+        Return the prepared statement for `query`, preparing it on first use.
+        """
+        prepared = self._prepared.get(query)
+        if prepared is not None:
+            self.prepared_hits += 1
+            return prepared
+
+        session = self._ensure_session()
+
+        with self._prepared_lock:
+            prepared = self._prepared.get(query)
+            if prepared is None:
+                self.prepared_misses += 1
+                prepared = session.prepare(query)
+                # Bound statements inherit this; speculative execution requires it.
+                prepared.is_idempotent = is_idempotent(query)
+                self._prepared[query] = prepared
+                logger.debug(f"Prepared statement {self.statement_name(query)}")
+            else:
+                self.prepared_hits += 1
+        return prepared
+
+    def prepare_all(self) -> int:
+        """
+        Prepare every registered statement that is not prepared yet, so that
+        no request pays for a preparing round trip. Returns how many were
+        prepared.
+        """
+        queries = [query for query in list(self._statement_names) if query not in self._prepared]
+        for query in queries:
+            self.prepare(query)
+        return len(queries)
+
+    async def aprepare(self, query: str) -> PreparedStatement:
+        """
+        Like prepare, but runs a cache miss in the default executor so the
+        preparing round trip does not block the event loop.
+        """
+        prepared = self._prepared.get(query)
+        if prepared is not None:
+            self.prepared_hits += 1
+            return prepared
+        return await asyncio.get_running_loop().run_in_executor(None, self.prepare, query)
+
+    def invalidate_prepared(self, query: Optional[str] = None) -> None:
+        """
+        Drop one cached statement, or all of them, so they get re-prepared.
+        """
+        with self._prepared_lock:
+            if query is None:
+                self._prepared.clear()
+            else:
+                self._prepared.pop(query, None)
+
+    def prepared_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.prepared_hits,
+            "misses": self.prepared_misses,
+            "prepared": len(self._prepared),
+        }
+
+    @staticmethod
+    def _bind(prepared: PreparedStatement, params, fetch_size: Optional[int] = None) -> BoundStatement:
+        bound = prepared.bind(params or ())
+        if fetch_size is not None:
+            bound.fetch_size = fetch_size
+        return bound
     
-    def execute(self, query: str, params: dict = None) -> List[Dict[str, Any]]:
-        if not self.session:
-            self.connect()
+    def execute(self, query: str, params: tuple = None, profile=EXEC_PROFILE_DEFAULT) -> List[Dict[str, Any]]:
+        session = self._ensure_session()
         
         try:
-            statement = SimpleStatement(query)
-            result = self.session.execute(statement, params or {})
+            statement = self._bind(self.prepare(query), params)
+            result = session.execute(statement, execution_profile=profile)
             return list(result)
+        except InvalidRequest:
+            # The statement may have been invalidated by a schema change.
+            self.invalidate_prepared(query)
+            raise
         except Exception as e:
             logger.error(f"Query execution failed: {str(e)}")
             raise
     
-    def execute_async(self, query: str, params: dict = None):
-        if not self.session:
-            self.connect()
+    def execute_async(self, query: str, params: tuple = None, profile=EXEC_PROFILE_DEFAULT):
+        session = self._ensure_session()
         
         try:
-            statement = SimpleStatement(query)
-            return self.session.execute_async(statement, params or {})
+            statement = self._bind(self.prepare(query), params)
+            return session.execute_async(statement, execution_profile=profile)
         except Exception as e:
             logger.error(f"Async query execution failed: {str(e)}")
             raise
-    
+
+    async def aiter(
+        self,
+        query: str,
+        params: tuple = None,
+        fetch_size: Optional[int] = None,
+        profile=EXEC_PROFILE_DEFAULT
+    ) -> AsyncResultPager:
+        """
+        Start a query and return an async iterator over its rows. Pages are
+        fetched lazily as the iterator is consumed. `profile` names the
+        execution profile (consistency, timeout, retries) to run it with.
+
+        Waits for an admission slot first, held until the first page
+        arrives; later pages are requested by the consumer and not limited.
+        """
+        session = self._ensure_session()
+
+        prepared = await self.aprepare(query)
+        observer = QueryObserver(
+            self.statement_name(query), await self._admit("read" if is_read(query) else "write"), prepared, params
+        )
+        try:
+            response_future = session.execute_async(
+                self._bind(prepared, params, fetch_size), execution_profile=profile, trace=observer.trace
+            )
+            observer.response_future = response_future
+            return AsyncResultPager(
+                response_future, asyncio.get_running_loop(), on_response=observer.on_response, on_page=observer.on_page
+            )
+        except Exception as e:
+            observer.on_response(None, e)
+            logger.error(f"Async query execution failed: {str(e)}")
+            raise
+
+    async def aexecute(self, query: str, params: tuple = None, profile=EXEC_PROFILE_DEFAULT) -> List[Dict[str, Any]]:
+        """
+        Awaitable counterpart of execute: runs the query without blocking the
+        event loop and returns every row of the result.
+        """
+        try:
+            return await (await self.aiter(query, params, profile=profile)).all()
+        except InvalidRequest:
+            # Re-prepare once in case a schema change invalidated the statement.
+            self.invalidate_prepared(query)
+            try:
+                return await (await self.aiter(query, params, profile=profile)).all()
+            except Exception as e:
+                logger.error(f"Query execution failed: {str(e)}")
+                raise
+        except (CassandraUnavailable, AdmissionRejected):
+            # Expected under overload or before warm-up; counted, not logged.
+            raise
+        except Exception as e:
+            logger.error(f"Query execution failed: {str(e)}")
+            raise
+
+    async def abatch(
+        self,
+        statements: Iterable[Tuple[str, Any]],
+        logged: bool = False,
+        profile=EXEC_PROFILE_DEFAULT
+    ) -> None:
+        """
+        Execute (query, params) pairs as one batch. Batches are unlogged by
+        default and meant for statements sharing a partition key.
+        """
+        session = self._ensure_session()
+
+        batch = BatchStatement(batch_type=BatchType.LOGGED if logged else BatchType.UNLOGGED)
+        idempotent = True
+        first = None
+        for query, params in statements:
+            prepared = await self.aprepare(query)
+            idempotent = idempotent and prepared.is_idempotent
+            first = first or (query, prepared, params)
+            batch.add(self._bind(prepared, params))
+        batch.is_idempotent = idempotent
+        # Batches share a partition key, so the first statement's names it.
+        query, prepared, params = first
+        observer = QueryObserver(f"batch:{self.statement_name(query)}", await self._admit("write"), prepared, params)
+        try:
+            response_future = session.execute_async(batch, execution_profile=profile, trace=observer.trace)
+            observer.response_future = response_future
+        except Exception as e:
+            observer.on_response(None, e)
+            logger.error(f"Batch execution failed: {str(e)}")
+            raise
+        try:
+            await AsyncResultPager(response_future, asyncio.get_running_loop(), on_response=observer.on_response).all()
+        except Exception as e:
+            logger.error(f"Batch execution failed: {str(e)}")
+            raise
+
     def get_session(self) -> Session:
-        if not self.session:
-            self.connect()
-        return self.session
+        return self._ensure_session()
 
 # Create a global instance
 cassandra_client = CassandraClient() 
\ No newline at end of file
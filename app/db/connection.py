@@ -0,0 +1,129 @@
+import logging
+from typing import Callable, Optional
+
+from cassandra import ConsistencyLevel, UnsupportedOperation
+from cassandra.auth import PlainTextAuthProvider
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import (
+    ConstantSpeculativeExecutionPolicy,
+    DCAwareRoundRobinPolicy,
+    FallthroughRetryPolicy,
+    HostDistance,
+    RetryPolicy,
+    TokenAwarePolicy,
+)
+from cassandra.query import dict_factory
+
+from app.config import ProfileSettings, Settings, settings as default_settings
+
+# Names of the execution profiles models pick per call site.
+READ_HOT = "read_hot"
+READ_HISTORY = "read_history"
+WRITE_MESSAGE = "write_message"
+WRITE_INBOX = "write_inbox"
+
+RETRY_POLICIES = {
+    "default": RetryPolicy,
+    "fallthrough": FallthroughRetryPolicy,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def load_balancing_policy(settings: Settings) -> TokenAwarePolicy:
+    """
+    Token-aware routing on top of DC-aware round robin, so each request goes
+    straight to a replica of its partition in the local data center.
+    """
+    return TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=settings.cassandra_local_dc))
+
+
+def execution_profile(
+    profile: ProfileSettings,
+    settings: Settings,
+    row_factory: Optional[Callable] = dict_factory
+) -> ExecutionProfile:
+    """
+    Build a driver ExecutionProfile from its settings.
+    """
+    if profile.retry not in RETRY_POLICIES:
+        raise ValueError(f"Unknown retry policy '{profile.retry}' for profile {profile.name}")
+
+    speculative = None
+    if profile.speculative_delay > 0 and profile.speculative_attempts > 0:
+        speculative = ConstantSpeculativeExecutionPolicy(profile.speculative_delay, profile.speculative_attempts)
+
+    return ExecutionProfile(
+        load_balancing_policy=load_balancing_policy(settings),
+        retry_policy=RETRY_POLICIES[profile.retry](),
+        consistency_level=ConsistencyLevel.name_to_value[profile.consistency],
+        request_timeout=profile.timeout,
+        speculative_execution_policy=speculative,
+        row_factory=row_factory,
+    )
+
+
+def _compression(settings: Settings):
+    if settings.cassandra_compression in ("false", "0", "no", "off"):
+        return False
+    if settings.cassandra_compression in ("lz4", "snappy"):
+        return settings.cassandra_compression
+    return True
+
+
+def _configure_pool(cluster: Cluster, settings: Settings) -> None:
+    pool_settings = [
+        (cluster.set_core_connections_per_host, settings.cassandra_core_connections),
+        (cluster.set_max_connections_per_host, settings.cassandra_max_connections),
+        (cluster.set_max_requests_per_connection, settings.cassandra_max_requests_per_connection),
+    ]
+    for setter, value in pool_settings:
+        if value is None:
+            continue
+        try:
+            setter(HostDistance.LOCAL, value)
+        except UnsupportedOperation:
+            logger.warning(f"Ignoring {setter.__name__}: only supported with protocol versions 1 and 2")
+
+
+def create_cluster(
+    settings: Optional[Settings] = None,
+    row_factory: Optional[Callable] = dict_factory
+) -> Cluster:
+    """
+    Build a Cluster from settings. Shared by the app and the scripts so they
+    all connect the same way; callers still call cluster.connect().
+    """
+    settings = settings or default_settings
+
+    profile = ExecutionProfile(
+        load_balancing_policy=load_balancing_policy(settings),
+        request_timeout=settings.cassandra_request_timeout,
+        row_factory=row_factory,
+    )
+    kwargs = dict(
+        contact_points=settings.cassandra_hosts,
+        port=settings.cassandra_port,
+        execution_profiles={
+            EXEC_PROFILE_DEFAULT: profile,
+            **{
+                name: execution_profile(profile_settings, settings, row_factory)
+                for name, profile_settings in settings.execution_profiles.items()
+            },
+        },
+        compression=_compression(settings),
+        connect_timeout=settings.cassandra_connect_timeout,
+        control_connection_timeout=settings.cassandra_control_connection_timeout,
+        executor_threads=settings.cassandra_executor_threads,
+    )
+    if settings.cassandra_protocol_version is not None:
+        kwargs["protocol_version"] = settings.cassandra_protocol_version
+    if settings.cassandra_username:
+        kwargs["auth_provider"] = PlainTextAuthProvider(
+            username=settings.cassandra_username,
+            password=settings.cassandra_password,
+        )
+
+    cluster = Cluster(**kwargs)
+    _configure_pool(cluster, settings)
+    return cluster
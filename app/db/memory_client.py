@@ -0,0 +1,463 @@
+import time
+import uuid
+import random
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+
+from app.config import settings
+from app.db.backend import StorageBackend, is_read
+from app.db.observer import QueryObserver
+
+logger = logging.getLogger(__name__)
+
+# Rows per page when a query sets no fetch size, as with the driver
+DEFAULT_FETCH_SIZE = 5000
+
+Bound = Tuple[Any, bool]
+
+
+def timeuuid_key(value: uuid.UUID) -> Tuple[int, bytes]:
+    """
+    Sort key of a timeuuid: its time first, as Cassandra orders them.
+    """
+    return value.time, value.bytes
+
+
+def _now() -> int:
+    return int(time.time() * 1e6)
+
+
+class Partition:
+    """
+    The rows of one partition in a sorted array, ascending by clustering
+    key, with the write timestamp of each row.
+
+    Reads run in the direction of the first clustering column. With
+    `order_prefix`, only that many leading columns of a tuple key do; rows
+    sharing them run the other way, as in a table with CLUSTERING ORDER BY
+    (first DESC) and further columns ascending.
+
+    Writes are last-write-wins by timestamp, as in Cassandra. A delete
+    removes the row and keeps a tombstone, outside the array, so that a late
+    write with an older timestamp stays deleted; a newer write drops it.
+    """
+
+    __slots__ = ("keys", "rows", "stamps", "tombstones", "order_prefix")
+
+    def __init__(self, order_prefix: Optional[int] = None):
+        self.order_prefix = order_prefix
+        self.keys: List[Any] = []
+        self.rows: List[Dict[str, Any]] = []
+        self.stamps: List[int] = []
+        self.tombstones: Dict[Any, int] = {}
+
+    def _find(self, key: Any) -> Tuple[int, bool]:
+        index = bisect_left(self.keys, key)
+        return index, index < len(self.keys) and self.keys[index] == key
+
+    def upsert(self, key: Any, row: Dict[str, Any], timestamp: int) -> None:
+        deleted_at = self.tombstones.get(key)
+        if deleted_at is not None:
+            if deleted_at >= timestamp:
+                return
+            del self.tombstones[key]
+        index, found = self._find(key)
+        if not found:
+            self.keys.insert(index, key)
+            self.rows.insert(index, row)
+            self.stamps.insert(index, timestamp)
+        elif self.stamps[index] <= timestamp:
+            self.rows[index] = row
+            self.stamps[index] = timestamp
+
+    def delete(self, key: Any, timestamp: int) -> None:
+        if self.tombstones.get(key, -1) < timestamp:
+            self.tombstones[key] = timestamp
+        index, found = self._find(key)
+        if found and self.stamps[index] <= timestamp:
+            del self.keys[index]
+            del self.rows[index]
+            del self.stamps[index]
+
+    def select(
+        self,
+        lower: Optional[Bound] = None,
+        upper: Optional[Bound] = None,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        prefix: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Rows between the (key, inclusive) bounds, newest or largest first
+        unless ascending, at most `limit` of them. With `prefix`, bounds are
+        compared with the first clustering column only.
+        """
+        key = itemgetter(0) if prefix else None
+        start, end = 0, len(self.keys)
+        if lower is not None:
+            start = (bisect_left if lower[1] else bisect_right)(self.keys, lower[0], key=key)
+        if upper is not None:
+            end = (bisect_right if upper[1] else bisect_left)(self.keys, upper[0], key=key)
+        if self.order_prefix is not None:
+            return self._select_grouped(start, end, descending, limit)
+        if limit is not None:
+            if descending:
+                start = max(start, end - limit)
+            else:
+                end = min(end, start + limit)
+        rows = self.rows[start:end] if start < end else []
+        if descending:
+            rows.reverse()
+        return rows
+
+    def _select_grouped(self, start: int, end: int, descending: bool, limit: Optional[int]) -> List[Dict[str, Any]]:
+        """
+        select() for an order_prefix: runs of rows sharing the prefix in the
+        requested direction, the rows of each run in the other one.
+        """
+        prefix = self.order_prefix
+
+        def group(key):
+            return key[:prefix]
+
+        rows: List[Dict[str, Any]] = []
+        while start < end and (limit is None or len(rows) < limit):
+            if descending:
+                split = bisect_left(self.keys, group(self.keys[end - 1]), start, end, key=group)
+                rows.extend(self.rows[split:end])
+                end = split
+            else:
+                split = bisect_right(self.keys, group(self.keys[start]), start, end, key=group)
+                rows.extend(reversed(self.rows[start:split]))
+                start = split
+        return rows if limit is None else rows[:limit]
+
+
+# Read by statements on partitions that were never written
+_EMPTY = Partition()
+
+
+class MemoryEngine:
+    """
+    The messenger keyspace of scripts/setup_db.py in memory. Every statement
+    the models register is a method of the same name taking the statement's
+    bind values, and returns its rows:
+
+    - messages and messages_by_bucket: a Partition per conversation (and
+      bucket), sorted by timeuuid, so page reads are a bisect and a slice
+    - user_conversations: a Partition per user sorted by (last_message_time,
+      conversation_id), read by time with ties by conversation_id ascending
+      as the table's clustering order has it; user_conversation_latest a
+      dict per user
+    - conversation_buckets: a Partition of bucket numbers per conversation
+
+    Must only be used from one thread, like the event loop.
+    """
+
+    def __init__(self):
+        self.messages: Dict[str, Partition] = {}
+        self.messages_by_bucket: Dict[Tuple[str, int], Partition] = {}
+        self.conversation_buckets: Dict[str, Partition] = {}
+        self.user_conversations: Dict[int, Partition] = {}
+        # user_id -> conversation_id -> (write timestamp, last_message_time)
+        self.user_conversation_latest: Dict[int, Dict[str, Tuple[int, uuid.UUID]]] = {}
+
+    @staticmethod
+    def _partition(table: Dict[Any, Partition], key: Any, order_prefix: Optional[int] = None) -> Partition:
+        partition = table.get(key)
+        if partition is None:
+            partition = table[key] = Partition(order_prefix)
+        return partition
+
+    @staticmethod
+    def _message_row(conversation_id, message_id, sender_id, recipient_id, message_text) -> Dict[str, Any]:
+        return {
+            "conversation_id": conversation_id,
+            "message_id": message_id,
+            "sender_id": sender_id,
+            "recipient_id": recipient_id,
+            "message_text": message_text,
+        }
+
+    # messages
+
+    def insert_message(self, conversation_id, message_id, sender_id, recipient_id, message_text, timestamp):
+        self._partition(self.messages, conversation_id).upsert(
+            timeuuid_key(message_id),
+            self._message_row(conversation_id, message_id, sender_id, recipient_id, message_text),
+            timestamp
+        )
+
+    def select_messages(self, conversation_id, limit):
+        return self.messages.get(conversation_id, _EMPTY).select(limit=limit)
+
+    def select_messages_before(self, conversation_id, before_id, limit):
+        return self.messages.get(conversation_id, _EMPTY).select(upper=(timeuuid_key(before_id), False), limit=limit)
+
+    def select_messages_after(self, conversation_id, after_id, limit):
+        return self.messages.get(conversation_id, _EMPTY).select(
+            lower=(timeuuid_key(after_id), False), descending=False, limit=limit
+        )
+
+    def select_messages_range(self, conversation_id, lower, upper):
+        return self.messages.get(conversation_id, _EMPTY).select(
+            lower=(timeuuid_key(lower), True), upper=(timeuuid_key(upper), False)
+        )
+
+    # messages_by_bucket and conversation_buckets (MESSAGE_LAYOUT=dual/bucketed)
+
+    def insert_bucketed_message(self, conversation_id, bucket, message_id, sender_id, recipient_id, message_text, timestamp):
+        self._partition(self.messages_by_bucket, (conversation_id, bucket)).upsert(
+            timeuuid_key(message_id),
+            self._message_row(conversation_id, message_id, sender_id, recipient_id, message_text),
+            timestamp
+        )
+
+    def insert_conversation_bucket(self, conversation_id, bucket):
+        self._partition(self.conversation_buckets, conversation_id).upsert(bucket, {"bucket": bucket}, _now())
+
+    def select_buckets_before(self, conversation_id, bucket):
+        return self.conversation_buckets.get(conversation_id, _EMPTY).select(upper=(bucket, True))
+
+    def select_buckets_after(self, conversation_id, bucket):
+        return self.conversation_buckets.get(conversation_id, _EMPTY).select(lower=(bucket, True), descending=False)
+
+    def select_buckets_between(self, conversation_id, lower, upper):
+        return self.conversation_buckets.get(conversation_id, _EMPTY).select(lower=(lower, True), upper=(upper, True))
+
+    def select_bucket_messages_before(self, conversation_id, bucket, before_id, limit):
+        return self.messages_by_bucket.get((conversation_id, bucket), _EMPTY).select(
+            upper=(timeuuid_key(before_id), False), limit=limit
+        )
+
+    def select_bucket_messages_after(self, conversation_id, bucket, after_id, limit):
+        return self.messages_by_bucket.get((conversation_id, bucket), _EMPTY).select(
+            lower=(timeuuid_key(after_id), False), descending=False, limit=limit
+        )
+
+    def select_bucket_messages_range(self, conversation_id, bucket, lower, upper):
+        return self.messages_by_bucket.get((conversation_id, bucket), _EMPTY).select(
+            lower=(timeuuid_key(lower), True), upper=(timeuuid_key(upper), False)
+        )
+
+    # user_conversations and user_conversation_latest
+
+    def insert_user_conversation(self, user_id, last_message_time, conversation_id, receiver_id, last_message, timestamp):
+        row = {
+            "user_id": user_id,
+            "last_message_time": last_message_time,
+            "conversation_id": conversation_id,
+            "receiver_id": receiver_id,
+            "last_message": last_message,
+        }
+        self._partition(self.user_conversations, user_id, order_prefix=1).upsert(
+            (timeuuid_key(last_message_time), conversation_id), row, timestamp
+        )
+
+    def delete_user_conversation(self, timestamp, user_id, last_message_time, conversation_id):
+        self._partition(self.user_conversations, user_id, order_prefix=1).delete(
+            (timeuuid_key(last_message_time), conversation_id), timestamp
+        )
+
+    def delete_stale_user_conversation(self, user_id, last_message_time, conversation_id):
+        self.delete_user_conversation(_now(), user_id, last_message_time, conversation_id)
+
+    def select_user_conversations(self, user_id):
+        return self.user_conversations.get(user_id, _EMPTY).select()
+
+    def select_user_conversations_after(self, user_id, after_id, limit):
+        return self.user_conversations.get(user_id, _EMPTY).select(
+            lower=(timeuuid_key(after_id), False), descending=False, limit=limit, prefix=True
+        )
+
+    def upsert_conversation_latest(self, user_id, conversation_id, last_message_time, timestamp):
+        latest = self.user_conversation_latest.setdefault(user_id, {})
+        current = latest.get(conversation_id)
+        if current is None or current[0] <= timestamp:
+            latest[conversation_id] = (timestamp, last_message_time)
+
+    def select_conversation_latest(self, user_id, conversation_id):
+        current = self.user_conversation_latest.get(user_id, {}).get(conversation_id)
+        return [] if current is None else [{"last_message_time": current[1]}]
+
+    def count_user_conversations(self, user_id):
+        return [{"total": len(self.user_conversation_latest.get(user_id, ()))}]
+
+
+class MemoryResultPager:
+    """
+    AsyncResultPager over rows computed by the engine: pages of fetch_size
+    rows, every page after the first one costing another round trip. Rows
+    are copied as they are handed out, so callers never share the engine's.
+    `on_page`, if given, is called with the rows of every page.
+    """
+
+    def __init__(
+        self,
+        rows: List[Dict[str, Any]],
+        fetch_size: int,
+        delay: Callable[[], Awaitable[None]],
+        on_page: Optional[Callable[[Any], None]] = None
+    ):
+        self._rows = rows
+        self._fetch_size = fetch_size
+        self._delay = delay
+        self._on_page = on_page
+        self._offset: Optional[int] = 0
+        self._iterator = iter(())
+
+    async def next_page(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Wait for the next page of rows. Returns None once the result is exhausted.
+        """
+        offset = self._offset
+        if offset is None:
+            return None
+        if offset > 0:
+            await self._delay()
+        end = offset + self._fetch_size
+        self._offset = end if end < len(self._rows) else None
+        page = [dict(row) for row in self._rows[offset:end]]
+        if self._on_page is not None:
+            self._on_page(page)
+        return page
+
+    async def all(self) -> List[Dict[str, Any]]:
+        """
+        Collect every remaining row.
+        """
+        result = []
+        page = await self.next_page()
+        while page is not None:
+            result.extend(page)
+            page = await self.next_page()
+        return result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        while True:
+            for row in self._iterator:
+                return row
+            page = await self.next_page()
+            if page is None:
+                raise StopAsyncIteration
+            self._iterator = iter(page)
+
+
+class MemoryClient(StorageBackend):
+    """
+    Runs the models' statements against a MemoryEngine in the worker's
+    process (STORAGE_BACKEND=memory), for tests and for benchmarks that
+    leave the database out. Every statement, batch and further result page
+    waits `latency` seconds plus up to `jitter` more before it runs,
+    simulating the round trips to a cluster. Statements take admission
+    slots and are observed like the driver's, so the same limits, metrics
+    and slow-query log apply.
+    """
+
+    def __init__(self, engine: Optional[MemoryEngine] = None, latency: Optional[float] = None, jitter: Optional[float] = None):
+        super().__init__()
+        self.engine = engine or MemoryEngine()
+        self.latency = settings.storage_memory_latency if latency is None else latency
+        self.jitter = settings.storage_memory_jitter if jitter is None else jitter
+        self._connected = False
+        # CQL text -> engine method
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self.prepared_hits = 0
+        self.prepared_misses = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def ensure_connected(self, wait_for_all_pools: bool = False) -> MemoryEngine:
+        if not self._connected:
+            self._connected = True
+            logger.info(f"Using the in-memory storage backend (latency {self.latency * 1000:g}ms, jitter {self.jitter * 1000:g}ms)")
+        return self.engine
+
+    def hosts_up(self) -> int:
+        return 1 if self._connected else 0
+
+    def close(self) -> None:
+        # The data stays, as a cluster's would.
+        self._connected = False
+
+    def _handler(self, query: str) -> Callable[..., Any]:
+        handler = self._handlers.get(query)
+        if handler is not None:
+            self.prepared_hits += 1
+            return handler
+        name = self.statement_name(query)
+        handler = getattr(self.engine, name, None) if not name.startswith("_") else None
+        if handler is None:
+            raise ValueError(f"Statement {name} is not supported by the memory backend")
+        self.prepared_misses += 1
+        self._handlers[query] = handler
+        return handler
+
+    def prepare_all(self) -> int:
+        """
+        Check that the engine implements every registered statement.
+        """
+        queries = [query for query in list(self._statement_names) if query not in self._handlers]
+        for query in queries:
+            self._handler(query)
+        return len(queries)
+
+    def prepared_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.prepared_hits,
+            "misses": self.prepared_misses,
+            "prepared": len(self._handlers),
+        }
+
+    async def _delay(self) -> None:
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def aiter(self, query: str, params: tuple = None, fetch_size: Optional[int] = None, profile=EXEC_PROFILE_DEFAULT) -> MemoryResultPager:
+        """
+        Waits for an admission slot first, held until the first page is
+        ready, as with the driver.
+        """
+        handler = self._handler(query)
+        fetch_size = fetch_size or DEFAULT_FETCH_SIZE
+        observer = QueryObserver(
+            self.statement_name(query), await self._admit("read" if is_read(query) else "write"), params=params
+        )
+        try:
+            await self._delay()
+            rows = handler(*(params or ())) or []
+        except BaseException as e:
+            # Cancellation included, so that the slot is given back.
+            observer.on_response(None, e)
+            raise
+        observer.on_response(rows[:fetch_size], None)
+        return MemoryResultPager(rows, fetch_size, self._delay, on_page=observer.on_page)
+
+    async def aexecute(self, query: str, params: tuple = None, profile=EXEC_PROFILE_DEFAULT) -> List[Dict[str, Any]]:
+        return await (await self.aiter(query, params, profile=profile)).all()
+
+    async def abatch(self, statements: Iterable[Tuple[str, Any]], logged: bool = False, profile=EXEC_PROFILE_DEFAULT) -> None:
+        # Applied together, with no await in between, like a batch on one partition.
+        statements = [(query, self._handler(query), params) for query, params in statements]
+        # Batches share a partition key, so the first statement's names it.
+        query, _, params = statements[0]
+        observer = QueryObserver(f"batch:{self.statement_name(query)}", await self._admit("write"), params=params)
+        try:
+            await self._delay()
+            for _, handler, params in statements:
+                handler(*(params or ()))
+        except BaseException as e:
+            observer.on_response(None, e)
+            raise
+        observer.on_response(None, None)
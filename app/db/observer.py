@@ -0,0 +1,93 @@
+import time
+import logging
+from typing import Any, Callable, Optional
+
+from cassandra.query import PreparedStatement
+
+from app.config import settings
+from app.db.tracing import should_trace, start_trace_fetch, requested_traces
+from app.metrics import metrics, ROW_BUCKETS, BYTE_BUCKETS
+
+# Statements slower than CASSANDRA_SLOW_QUERY_THRESHOLD, on a logger of their own
+slow_query_logger = logging.getLogger("app.db.slow_query")
+
+QUERY_DURATION = metrics.histogram(
+    "cassandra_query_duration_seconds", "Time from sending a statement to its first page or error", ("statement",)
+)
+QUERY_ROWS = metrics.histogram("cassandra_query_rows", "Rows per result page", ("statement",), ROW_BUCKETS)
+QUERY_BYTES = metrics.histogram(
+    "cassandra_query_result_bytes", "Size of the text and blob values per result page", ("statement",), BYTE_BUCKETS
+)
+QUERY_ERRORS = metrics.counter("cassandra_query_errors_total", "Failed statements by error type", ("statement", "error"))
+
+
+class QueryObserver:
+    """
+    Records the metrics of one statement execution, logs it if slow, starts
+    fetching its trace if traced and gives its admission slot back; its
+    methods are the result pager's on_response and on_page.
+
+    Both storage backends run their statements through one. Only the
+    driver's statements carry a response_future, so only those are traced
+    and name their partition key (from the prepared statement).
+    """
+
+    __slots__ = ("statement", "started", "release", "prepared", "params", "response_future", "trace", "trace_tasks")
+
+    def __init__(
+        self,
+        statement: str,
+        release: Optional[Callable[[Optional[Exception]], None]],
+        prepared: Optional[PreparedStatement] = None,
+        params=None
+    ):
+        self.statement = statement
+        self.release = release
+        self.prepared = prepared
+        self.params = params
+        self.response_future = None
+        # Decided, and the requesting request's trace list captured, in the
+        # caller's context: the callbacks run in the driver's.
+        self.trace = should_trace()
+        self.trace_tasks = requested_traces.get()
+        self.started = time.perf_counter()
+
+    def partition_key(self) -> Any:
+        indexes = self.prepared.routing_key_indexes if self.prepared is not None else None
+        if not indexes or not self.params:
+            return None
+        values = tuple(self.params[index] for index in indexes)
+        return values[0] if len(values) == 1 else values
+
+    def on_response(self, rows, exc: Optional[Exception]) -> None:
+        elapsed = time.perf_counter() - self.started
+        QUERY_DURATION.observe((self.statement,), elapsed)
+        if exc is not None:
+            QUERY_ERRORS.inc((self.statement, type(exc).__name__))
+        if self.trace and self.response_future is not None:
+            start_trace_fetch(self.response_future, self.statement, self.partition_key(), self.trace_tasks)
+        threshold = settings.cassandra_slow_query_threshold
+        if threshold and elapsed >= threshold:
+            self._log_slow(rows, exc, elapsed)
+        if self.release is not None:
+            self.release(exc)
+
+    def _log_slow(self, rows, exc: Optional[Exception], elapsed: float) -> None:
+        more = self.response_future is not None and exc is None and self.response_future.has_more_pages
+        line = (
+            f"Slow query statement={self.statement} partition_key={self.partition_key()!r} "
+            f"rows={len(rows or ())}{'+' if more else ''} elapsed_ms={elapsed * 1000:.1f}"
+        )
+        if exc is not None:
+            line += f" error={type(exc).__name__}"
+        if self.trace and self.response_future is not None:
+            line += f" trace_ids={','.join(str(trace_id) for trace_id in self.response_future.get_query_trace_ids())}"
+        slow_query_logger.warning(line)
+
+    def on_page(self, rows) -> None:
+        rows = rows or ()
+        QUERY_ROWS.observe((self.statement,), len(rows))
+        QUERY_BYTES.observe((self.statement,), sum(
+            len(value) for row in rows for value in (row.values() if isinstance(row, dict) else row)
+            if isinstance(value, (str, bytes))
+        ))
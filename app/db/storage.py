@@ -0,0 +1,15 @@
+from typing import Callable, Dict
+
+from app.config import settings
+from app.db.backend import StorageBackend
+from app.db.cassandra_client import CassandraClient
+from app.db.memory_client import MemoryClient
+
+# STORAGE_BACKEND values
+BACKENDS: Dict[str, Callable[[], StorageBackend]] = {
+    "cassandra": CassandraClient,
+    "memory": MemoryClient,
+}
+
+# Runs the statements of the models; the connection is opened by the warm-up
+storage = BACKENDS[settings.storage_backend]()
@@ -0,0 +1,148 @@
+import asyncio
+import hmac
+import json
+import logging
+import random
+import re
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACE_REQUEST_HEADER = b"x-trace-query"
+TRACE_RESPONSE_HEADER = b"x-query-trace"
+# Larger summaries are cut down to their trace ids
+MAX_HEADER_SIZE = 8192
+
+# Trace fetches of the current HTTP request, when it asked for tracing
+requested_traces: ContextVar[Optional[List[asyncio.Task]]] = ContextVar("requested_traces", default=None)
+
+# Trace fetches nobody waits for, referenced until they finish
+_background: Set[asyncio.Task] = set()
+
+# Event descriptions written by Cassandra's read path, e.g.
+# "Merged data from memtables and 2 sstables", "Read 10 live rows and 3 tombstone cells"
+_SSTABLES = re.compile(r"(\d+) sstables", re.IGNORECASE)
+_LIVE_ROWS = re.compile(r"(\d+) live rows", re.IGNORECASE)
+_TOMBSTONES = re.compile(r"(\d+) tombstone", re.IGNORECASE)
+
+
+def should_trace() -> bool:
+    """
+    Whether the statement about to be sent should be traced: always within a
+    request that asked for it, otherwise with CASSANDRA_TRACE_SAMPLE_RATE.
+    """
+    if requested_traces.get() is not None:
+        return True
+    rate = settings.cassandra_trace_sample_rate
+    return rate > 0 and random.random() < rate
+
+
+def _total(pattern, events) -> int:
+    return sum(int(match.group(1)) for event in events for match in pattern.finditer(event.description or ""))
+
+
+def summarize(trace, statement: str, partition_key: Any) -> Dict[str, Any]:
+    """
+    The parts of a driver QueryTrace that explain a slow read: where it ran,
+    how long it took and how much each replica had to read.
+    """
+    events = trace.events or ()
+    sstables = [int(match.group(1)) for event in events for match in _SSTABLES.finditer(event.description or "")]
+    return {
+        "statement": statement,
+        "partition_key": partition_key,
+        "trace_id": str(trace.trace_id),
+        "coordinator": str(trace.coordinator),
+        "duration_us": int(trace.duration.total_seconds() * 1e6) if trace.duration else None,
+        "replicas": sorted({str(event.source) for event in events}),
+        "max_sstables_per_read": max(sstables, default=0),
+        "live_rows": _total(_LIVE_ROWS, events),
+        "tombstones": _total(_TOMBSTONES, events),
+    }
+
+
+async def _fetch_trace(response_future, statement: str, partition_key: Any) -> Optional[Dict[str, Any]]:
+    try:
+        # Polls system_traces with sleeps in between, so it runs off the loop.
+        trace = await asyncio.get_running_loop().run_in_executor(
+            None, response_future.get_query_trace, settings.cassandra_trace_max_wait
+        )
+    except Exception as e:
+        logger.warning(f"Trace of {statement} unavailable: {str(e)}")
+        return None
+    if trace is None:
+        return None
+
+    summary = summarize(trace, statement, partition_key)
+    events = [
+        {
+            "source": str(event.source),
+            "elapsed_us": int(event.source_elapsed.total_seconds() * 1e6) if event.source_elapsed else None,
+            "thread": event.thread_name,
+            "activity": event.description,
+        }
+        for event in trace.events or ()
+    ]
+    logger.info("Query trace " + json.dumps({**summary, "events": events}, default=str))
+    return summary
+
+
+def start_trace_fetch(response_future, statement: str, partition_key: Any, tasks: Optional[List[asyncio.Task]]) -> None:
+    """
+    Fetch and log the trace of a traced statement in the background. `tasks`
+    is the requesting request's list (see requested_traces), if any, so
+    that its summary can be added to the response.
+    """
+    task = asyncio.get_running_loop().create_task(_fetch_trace(response_future, statement, partition_key))
+    if tasks is not None:
+        tasks.append(task)
+    else:
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+class TraceMiddleware:
+    """
+    Traces every statement of requests sent with "X-Trace-Query: <token>",
+    where the token is CASSANDRA_TRACE_TOKEN, and returns a JSON summary per
+    statement in the X-Query-Trace response header. The response waits for
+    the traces of the statements run before it started (up to
+    CASSANDRA_TRACE_MAX_WAIT); those of streamed bodies are only logged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _requested(self, scope) -> bool:
+        token = settings.cassandra_trace_token
+        if scope["type"] != "http" or not token:
+            return False
+        for name, value in scope["headers"]:
+            if name == TRACE_REQUEST_HEADER:
+                return hmac.compare_digest(value, token.encode())
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if not self._requested(scope):
+            return await self.app(scope, receive, send)
+
+        tasks: List[asyncio.Task] = []
+
+        async def send_with_traces(message):
+            if message["type"] == "http.response.start" and tasks:
+                done, _ = await asyncio.wait(list(tasks), timeout=settings.cassandra_trace_max_wait + 1)
+                summaries = [task.result() for task in done if task.result() is not None]
+                value = json.dumps(summaries, default=str, separators=(",", ":"))
+                if len(value) > MAX_HEADER_SIZE:
+                    value = json.dumps([summary["trace_id"] for summary in summaries])[:MAX_HEADER_SIZE]
+                message = {**message, "headers": [*message.get("headers", []), (TRACE_RESPONSE_HEADER, value.encode())]}
+            await send(message)
+
+        reset = requested_traces.set(tasks)
+        try:
+            await self.app(scope, receive, send_with_traces)
+        finally:
+            requested_traces.reset(reset)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.db.storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Brings a worker to the point where its first request is fast: connects
+    the storage backend (to Cassandra, with pools open to every local host),
+    then prepares every registered statement. Failed attempts are retried with the client's
+    exponential backoff until the worker shuts down.
+
+    Runs as a background task of the app's lifespan, so the server starts
+    answering /healthz right away; /readyz reports ready once it is done.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.attempts = 0
+        self.error: Optional[str] = None
+        # Seconds spent in each phase of the last successful warm-up
+        self.timings: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        self.ready = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        while True:
+            self.attempts += 1
+            try:
+                phase_started = time.monotonic()
+                await loop.run_in_executor(None, lambda: storage.ensure_connected(wait_for_all_pools=True))
+                self.timings["connect"] = time.monotonic() - phase_started
+                logger.info(
+                    f"Warm-up: connected with {storage.hosts_up()} host(s) up "
+                    f"in {self.timings['connect']:.2f}s (attempt {self.attempts})"
+                )
+
+                phase_started = time.monotonic()
+                prepared = await loop.run_in_executor(None, storage.prepare_all)
+                self.timings["prepare"] = time.monotonic() - phase_started
+                logger.info(f"Warm-up: prepared {prepared} statement(s) in {self.timings['prepare']:.2f}s")
+                break
+            except Exception as e:
+                self.error = str(e)
+                # Connect failures come with the client's backoff; others (e.g. a
+                # statement whose table does not exist yet) back off the same way.
+                delay = storage.retry_delay() or min(
+                    settings.cassandra_connect_backoff * 2 ** (self.attempts - 1),
+                    settings.cassandra_connect_backoff_max
+                )
+                logger.warning(f"Warm-up attempt {self.attempts} failed, retrying in {delay:.1f}s: {self.error}")
+                await asyncio.sleep(delay)
+
+        self.timings["total"] = time.monotonic() - started
+        self.error = None
+        self.ready = True
+        logger.info(f"Warm-up: ready after {self.timings['total']:.2f}s and {self.attempts} attempt(s)")
+
+    def status(self) -> Dict[str, Any]:
+        hosts_up = storage.hosts_up()
+        return {
+            "ready": self.ready and hosts_up > 0,
+            "cassandra_hosts_up": hosts_up,
+            "attempts": self.attempts,
+            "error": self.error,
+            "timings": {phase: round(seconds, 3) for phase, seconds in self.timings.items()},
+        }
+
+
+warmup = WarmUp()
@@ -1,13 +1,31 @@
+import time
+
+IMPORT_STARTED = time.monotonic()
+
+import asyncio
 import logging
-from fastapi import FastAPI, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-import sys
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 
-from app.api.routes import message_router, conversation_router
+from app.api.routes import message_router, conversation_router, realtime_router
 from app.controllers.message_controller import MessageController
 from app.controllers.conversation_controller import ConversationController
-from app.db.cassandra_client import cassandra_client
+from app.controllers.realtime_controller import RealtimeController
+from app.db.cassandra_client import CassandraUnavailable
+from app.db.storage import storage
+from app.db.admission import AdmissionRejected
+from app.db.warmup import warmup
+from app.db.tracing import TraceMiddleware
+from app.cache.conversation_directory import conversation_directory
+from app.cache.message_cache import message_cache
+from app.cache.inbox_cache import inbox_cache
+from app.realtime.hub import message_hub
+from app.models.cassandra_models import inbox_coalescer
+from app.config import settings
+from app.metrics import metrics, MetricsMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -16,7 +34,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker startup and shutdown.
+
+    Runs in every worker process after it has been started, so each worker
+    opens its own Cassandra connections instead of inheriting them. Startup
+    does not wait for Cassandra: the warm-up connects in the background,
+    retrying with backoff, and /readyz turns ready once it is done. On
+    shutdown the server first stops accepting connections and lets in-flight
+    requests finish (up to GRACEFUL_SHUTDOWN_TIMEOUT); realtime streams are
+    then closed, buffered inbox updates written and the driver shut down last.
+    """
+    logger.info(f"Initializing application (pid {os.getpid()}, imported in {time.monotonic() - IMPORT_STARTED:.2f}s)...")
+    warmup.start()
+
+    yield
+
+    logger.info(f"Shutting down application (pid {os.getpid()})...")
+    await warmup.stop()
+    await message_hub.close()
+    await inbox_coalescer.close()
+    await asyncio.get_running_loop().run_in_executor(None, storage.close)
+
 app = FastAPI(
+    lifespan=lifespan,
     title="FB Messenger API",
     description="Backend API for FB Messenger implementation using Cassandra",
     version="1.0.0"
@@ -31,6 +74,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(CassandraUnavailable)
+@app.exception_handler(AdmissionRejected)
+async def cassandra_unavailable_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+# Statement traces on request (X-Trace-Query); see app/db/tracing.py
+app.add_middleware(TraceMiddleware)
+
+# Outermost, so that it also times requests rejected by the other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Dependency injection
 def get_message_controller():
     """Dependency for message controller."""
@@ -40,36 +98,101 @@ def get_conversation_controller():
     """Dependency for conversation controller."""
     return ConversationController()
 
+def get_realtime_controller():
+    """Dependency for realtime controller."""
+    return RealtimeController()
+
 # Update the routes with the dependencies
 app.dependency_overrides[MessageController] = get_message_controller
 app.dependency_overrides[ConversationController] = get_conversation_controller
+app.dependency_overrides[RealtimeController] = get_realtime_controller
 
 # Include routers
 app.include_router(message_router)
 app.include_router(conversation_router)
+app.include_router(realtime_router)
 
 @app.get("/")
 async def root():
     return {"message": "FB Messenger API is running with Cassandra backend"}
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup."""
-    logger.info("Initializing application...")
-    try:
-        # Ensure Cassandra connection is established
-        cassandra_client.get_session()
-        logger.info("Cassandra connection established")
-    except Exception as e:
-        logger.error(f"Failed to connect to Cassandra: {str(e)}")
-        sys.exit(1)
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up resources on shutdown."""
-    logger.info("Shutting down application...")
-    cassandra_client.close()
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker's event loop is running. Does not touch Cassandra."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: connected to Cassandra with every statement prepared."""
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+# Cache, admission and realtime counters are kept by their components and
+# read at scrape time.
+CACHES = {
+    "conversation_directory": conversation_directory,
+    "message_tail": message_cache,
+    "inbox": inbox_cache,
+}
+for field, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("entries", "gauge"), ("bytes", "gauge")):
+    metrics.callback(
+        f"cache_{field}_total" if kind == "counter" else f"cache_{field}",
+        f"In-process cache {field}", ("cache",),
+        lambda field=field: {(name,): cache.stats()[field] for name, cache in CACHES.items()},
+        type=kind,
+    )
+metrics.callback(
+    "cassandra_prepared_statements_total", "Prepared statement cache lookups", ("result",),
+    lambda: {("hit",): storage.prepared_stats()["hits"], ("miss",): storage.prepared_stats()["misses"]},
+    type="counter",
+)
+for field, kind in (("in_flight", "gauge"), ("limit", "gauge"), ("queue_depth", "gauge"), ("rejected", "counter"), ("timed_out", "counter")):
+    metrics.callback(
+        f"cassandra_admission_{field}_total" if kind == "counter" else f"cassandra_admission_{field}",
+        f"Admission control {field.replace('_', ' ')}", ("kind",),
+        lambda field=field: {(name,): stats[field] for name, stats in storage.admission_stats().items()},
+        type=kind,
+    )
+metrics.callback(
+    "realtime_subscribers", "Connected realtime clients", (), lambda: {(): message_hub.stats()["subscribers"]}
+)
+metrics.callback(
+    "inbox_coalescer_pending", "Buffered inbox updates", (), lambda: {(): inbox_coalescer.stats()["pending"]}
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Metrics of this worker in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    """Runtime counters of this worker's storage backend, admission control, in-process caches and realtime hub."""
+    return {
+        "prepared_statements": storage.prepared_stats(),
+        "admission": storage.admission_stats(),
+        "conversation_directory": conversation_directory.stats(),
+        "message_cache": message_cache.stats(),
+        "inbox_cache": inbox_cache.stats(),
+        "inbox_coalescer": inbox_coalescer.stats(),
+        "realtime": message_hub.stats(),
+        "pid": os.getpid(),
+    }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    workers = 1 if settings.app_reload else settings.web_workers
+    if workers > 1 and settings.realtime_transport == "inprocess":
+        logger.warning(
+            f"Serving with {workers} workers and REALTIME_TRANSPORT=inprocess: realtime clients only receive "
+            f"messages sent through the worker they are connected to, and caches and /metrics are per worker"
+        )
+    uvicorn.run(
+        "app.main:app",
+        host=settings.app_host,
+        port=settings.app_port,
+        reload=settings.app_reload,
+        # Workers are spawned, not forked: each imports the app on its own.
+        workers=workers,
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout,
+    ) 
\ No newline at end of file
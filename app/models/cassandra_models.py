@@ -1,9 +1,178 @@
+import asyncio
+import base64
+import logging
 import uuid
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from cassandra.util import uuid_from_time, unix_time_from_uuid1
+from functools import partial
+from typing import List, Dict, Any, Optional, Callable, Awaitable, NamedTuple, Tuple
+from cassandra.util import uuid_from_time, min_uuid_from_time
+
+from app.db.admission import AdmissionRejected
+from app.db.storage import storage
+from app.db.connection import READ_HOT, READ_HISTORY, WRITE_MESSAGE, WRITE_INBOX
+from app.cache.conversation_directory import conversation_directory
+from app.cache.message_cache import message_cache
+from app.cache.inbox_cache import inbox_cache
+from app.models import message_buckets
+from app.models.inbox_coalescer import InboxCoalescer
+from app.models.timeuuid import (
+    bucket_of, format_message_id, format_last_message_at, write_timestamp, MIN_MESSAGE_ID, MAX_MESSAGE_ID
+)
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_COLUMNS = "conversation_id, message_id, sender_id, recipient_id, message_text"
+USER_CONVERSATION_COLUMNS = "user_id, last_message_time, conversation_id, receiver_id, last_message"
+
+# All statements are registered with the storage backend, which prepares
+# them once per session (see app/db/storage.py).
+INSERT_MESSAGE = storage.statement("insert_message", f"""
+    INSERT INTO messages ({MESSAGE_COLUMNS}) VALUES (?, ?, ?, ?, ?) USING TIMESTAMP ?
+""")
+INSERT_USER_CONVERSATION = storage.statement("insert_user_conversation", f"""
+    INSERT INTO user_conversations ({USER_CONVERSATION_COLUMNS}) VALUES (?, ?, ?, ?, ?) USING TIMESTAMP ?
+""")
+SELECT_MESSAGES = storage.statement("select_messages", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? LIMIT ?
+""")
+SELECT_MESSAGES_BEFORE = storage.statement("select_messages_before", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND message_id < ? LIMIT ?
+""")
+SELECT_MESSAGES_AFTER = storage.statement("select_messages_after", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND message_id > ?
+    ORDER BY message_id ASC LIMIT ?
+""")
+SELECT_MESSAGES_RANGE = storage.statement("select_messages_range", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND message_id >= ? AND message_id < ?
+""")
+DELETE_USER_CONVERSATION = storage.statement("delete_user_conversation", """
+    DELETE FROM user_conversations USING TIMESTAMP ?
+    WHERE user_id = ? AND last_message_time = ? AND conversation_id = ?
+""")
+DELETE_STALE_USER_CONVERSATION = storage.statement("delete_stale_user_conversation", """
+    DELETE FROM user_conversations WHERE user_id = ? AND last_message_time = ? AND conversation_id = ?
+""")
+SELECT_USER_CONVERSATIONS = storage.statement("select_user_conversations", f"""
+    SELECT {USER_CONVERSATION_COLUMNS} FROM user_conversations WHERE user_id = ?
+""")
+SELECT_USER_CONVERSATIONS_AFTER = storage.statement("select_user_conversations_after", f"""
+    SELECT {USER_CONVERSATION_COLUMNS} FROM user_conversations WHERE user_id = ? AND last_message_time > ?
+    ORDER BY last_message_time ASC LIMIT ?
+""")
+UPSERT_CONVERSATION_LATEST = storage.statement("upsert_conversation_latest", """
+    INSERT INTO user_conversation_latest (user_id, conversation_id, last_message_time) VALUES (?, ?, ?)
+    USING TIMESTAMP ?
+""")
+SELECT_CONVERSATION_LATEST = storage.statement("select_conversation_latest", """
+    SELECT last_message_time FROM user_conversation_latest WHERE user_id = ? AND conversation_id = ?
+""")
+COUNT_USER_CONVERSATIONS = storage.statement("count_user_conversations", """
+    SELECT COUNT(*) AS total FROM user_conversation_latest WHERE user_id = ?
+""")
+
+
+class MessageWriteError(Exception):
+    """
+    Raised when the message row itself could not be written.
+    """
+
+
+class InboxUpdate(NamedTuple):
+    """
+    A message to show at the top of one participant's inbox.
+    """
+
+    user_id: int
+    other_user_id: int
+    conversation_id: str
+    message_id: uuid.UUID
+    message_text: str
+    timestamp: int
+
+
+async def run_idempotent(operations: List[Callable[[], Awaitable[Any]]], concurrency: Optional[int] = None) -> List[Any]:
+    """
+    Run idempotent operations concurrently, at most `concurrency` at a time,
+    and retry the failed ones once. Returns results in input order, with an
+    exception in place of any operation that failed twice. Operations turned
+    away by admission control are not retried, as that would only add load.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def run(operation):
+        if semaphore is None:
+            return await operation()
+        async with semaphore:
+            return await operation()
+
+    results = await asyncio.gather(*(run(operation) for operation in operations), return_exceptions=True)
+    failed = [
+        i for i, result in enumerate(results)
+        if isinstance(result, Exception) and not isinstance(result, AdmissionRejected)
+    ]
+    if failed:
+        retries = await asyncio.gather(*(run(operations[i]) for i in failed), return_exceptions=True)
+        for i, result in zip(failed, retries):
+            results[i] = result
+    return results
+
+
+def encode_cursor(message_id: uuid.UUID) -> str:
+    """
+    Turn the last message_id of a page into an opaque cursor.
+    """
+
+    return base64.urlsafe_b64encode(message_id.bytes).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    """
+    Inverse of encode_cursor. Raises ValueError for malformed cursors.
+    """
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        message_id = uuid.UUID(bytes=raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if message_id.version != 1:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return message_id
+
+
+def parse_message_id(message_id: str) -> uuid.UUID:
+    """
+    Parse a message id as returned by the API. Raises ValueError for
+    anything that is not a timeuuid.
+    """
+
+    try:
+        parsed = uuid.UUID(message_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid message id: {message_id}") from e
+    if parsed.version != 1:
+        raise ValueError(f"Invalid message id: {message_id}")
+    return parsed
+
+
+def row_to_message(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a `messages` row into the response format, with the keys in
+    MessageResponse's order so that it can be sent without re-validation.
+    """
+
+    message_id, created_at = format_message_id(row["message_id"])
+    return {
+        "content": row["message_text"],
+        "id": message_id,
+        "sender_id": row["sender_id"],
+        "receiver_id": row["recipient_id"],
+        "created_at": created_at,
+        "conversation_id": str(row["conversation_id"]),
+    }
 
-from app.db.cassandra_client import cassandra_client
 
 class MessageModel:
     
@@ -11,147 +180,495 @@ class MessageModel:
     async def create_message(conversation_id: str, sender_id: int, recipient_id: int, message_text: str):
         """
         Create a new message and return it in the response format.
+
+        The message row is written concurrently with the lookups of both
+        participants' current inbox rows; the inbox rows are then replaced by
+        one unlogged batch per participant. Everything uses the same write
+        timestamp and is idempotent (fixed message_id and timestamp), so
+        failed operations are retried once. After that:
+        - if the message row failed, MessageWriteError is raised and the
+          inboxes are left untouched;
+        - if only an inbox update failed, the message is durable and is
+          returned; the failure is logged since inbox rows are derived data.
+
+        With INBOX_COALESCE_WINDOW set, the inbox updates are handed to
+        inbox_coalescer instead and written after the message is returned.
         """
 
         message_id = uuid.uuid1()
-        query = """
-        INSERT INTO messages (conversation_id, message_id, sender_id, recipient_id, message_text)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cassandra_client.execute(query, (conversation_id, message_id, sender_id, recipient_id, message_text))
+        timestamp = write_timestamp(message_id)
+        updates = [
+            InboxUpdate(sender_id, recipient_id, conversation_id, message_id, message_text, timestamp),
+            InboxUpdate(recipient_id, sender_id, conversation_id, message_id, message_text, timestamp),
+        ]
+
+        coalesce = inbox_coalescer.enabled
+        writes = MessageModel._message_writes([(conversation_id, message_id, sender_id, recipient_id, message_text, timestamp)])
+        lookups = [] if coalesce else ConversationModel.inbox_lookups(updates)
+        results = await run_idempotent(writes + lookups)
+        if any(isinstance(result, Exception) for result in results[:len(writes)]):
+            raise MessageWriteError(f"Failed to write message {message_id} to conversation {conversation_id}")
+
+        if coalesce:
+            ConversationModel.record_inbox_cache(updates)
+            inbox_coalescer.add(updates)
+        else:
+            failed = await ConversationModel.apply_inbox_updates(updates, results[len(writes):])
+            if failed:
+                logger.warning(f"Message {message_id} stored but {failed} inbox update(s) failed")
 
-        update_user_conversations_query = """
-        INSERT INTO user_conversations (user_id, last_message_time, conversation_id, receiver_id, last_message)
-        VALUES (%s, %s, %s, %s, %s)
+        message = MessageModel._message(conversation_id, message_id, sender_id, recipient_id, message_text)
+        message_cache.append(conversation_id, message_id, message)
+        return message
+
+    @staticmethod
+    def _message_writes(rows: List[tuple]) -> List[Callable[[], Awaitable[Any]]]:
         """
-        cassandra_client.execute(update_user_conversations_query, (sender_id, message_id, conversation_id, recipient_id, message_text))
-        cassandra_client.execute(update_user_conversations_query, (recipient_id, message_id, conversation_id, sender_id, message_text))
+        Writes of message rows of one conversation and bucket, for
+        run_idempotent. Rows are (conversation_id, message_id, sender_id,
+        recipient_id, message_text, timestamp). MESSAGE_LAYOUT decides whether
+        they go to `messages`, to `messages_by_bucket` (registering the bucket
+        in `conversation_buckets`) or, while migrating, to both.
+        """
+
+        def write(query, statements):
+            if len(statements) == 1:
+                return partial(storage.aexecute, query, statements[0], profile=WRITE_MESSAGE)
+            return partial(storage.abatch, [(query, params) for params in statements], profile=WRITE_MESSAGE)
+
+        writes = []
+        if settings.message_layout in ("flat", "dual"):
+            writes.append(write(INSERT_MESSAGE, rows))
+        if settings.message_layout in ("dual", "bucketed"):
+            conversation_id, message_id = rows[0][:2]
+            bucket = bucket_of(message_id)
+            writes.append(write(
+                message_buckets.INSERT_BUCKETED_MESSAGE,
+                [(conversation_id, bucket, *row[1:]) for row in rows]
+            ))
+            writes.append(partial(message_buckets.register_bucket, conversation_id, bucket))
+        return writes
+
+    @staticmethod
+    def _message(conversation_id: str, message_id: uuid.UUID, sender_id: int, recipient_id: int, message_text: str) -> Dict[str, Any]:
+        message_id, created_at = format_message_id(message_id)
         return {
-            "id": str(message_id),
+            "content": message_text,
+            "id": message_id,
             "sender_id": sender_id,
             "receiver_id": recipient_id,
-            "created_at": str(unix_time_from_uuid1(message_id)),
+            "created_at": created_at,
             "conversation_id": conversation_id,
-            "content": message_text,
         }
+
+    @staticmethod
+    async def create_messages(items: List[Tuple[str, int, int, str]]) -> List[Any]:
+        """
+        Bulk counterpart of create_message for (conversation_id, sender_id,
+        recipient_id, message_text) items. Returns, in input order, the
+        created message or the exception that prevented writing it.
+
+        Messages are grouped by partition (conversation and bucket) and
+        written as single-partition unlogged batches of up to
+        message_batch_chunk_size rows, with at most message_batch_concurrency
+        writes in flight. Inbox
+        updates are collapsed so that only the newest written message of each
+        (user, conversation) pair in the batch touches user_conversations.
+        """
+
+        message_ids = [uuid.uuid1() for _ in items]
+
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for index, (conversation_id, _, _, _) in enumerate(items):
+            groups.setdefault((conversation_id, bucket_of(message_ids[index])), []).append(index)
+
+        chunk_size = settings.message_batch_chunk_size
+        chunks = [
+            indexes[start:start + chunk_size]
+            for indexes in groups.values()
+            for start in range(0, len(indexes), chunk_size)
+        ]
+
+        def insert_chunk(chunk):
+            rows = []
+            for index in chunk:
+                conversation_id, sender_id, recipient_id, message_text = items[index]
+                message_id = message_ids[index]
+                rows.append((conversation_id, message_id, sender_id, recipient_id, message_text, write_timestamp(message_id)))
+            writes = MessageModel._message_writes(rows)
+
+            async def write_all():
+                await asyncio.gather(*(write() for write in writes))
+            return write_all
+
+        chunk_results = await run_idempotent([insert_chunk(chunk) for chunk in chunks], settings.message_batch_concurrency)
+
+        results: List[Any] = [None] * len(items)
+        latest: Dict[Tuple[int, str], InboxUpdate] = {}
+        for chunk, result in zip(chunks, chunk_results):
+            for index in chunk:
+                conversation_id, sender_id, recipient_id, message_text = items[index]
+                message_id = message_ids[index]
+                if isinstance(result, Exception):
+                    results[index] = MessageWriteError(f"Failed to write message {message_id} to conversation {conversation_id}")
+                    continue
+
+                results[index] = MessageModel._message(conversation_id, message_id, sender_id, recipient_id, message_text)
+                message_cache.append(conversation_id, message_id, results[index])
+                timestamp = write_timestamp(message_id)
+                for user_id, other_user_id in ((sender_id, recipient_id), (recipient_id, sender_id)):
+                    current = latest.get((user_id, conversation_id))
+                    if current is None or current.message_id.time < message_id.time:
+                        latest[(user_id, conversation_id)] = InboxUpdate(user_id, other_user_id, conversation_id, message_id, message_text, timestamp)
+
+        updates = list(latest.values())
+        if inbox_coalescer.enabled:
+            ConversationModel.record_inbox_cache(updates)
+            inbox_coalescer.add(updates)
+            return results
+
+        failed = await ConversationModel.write_inbox_updates(updates, settings.message_batch_concurrency)
+        if failed:
+            logger.warning(f"Batch of {len(items)} messages stored but {failed} inbox update(s) failed")
+        return results
         
     
     @staticmethod
-    async def get_conversation_messages(conversation_id: str, page: int, limit: int):
+    async def _fetch_messages(conversation_id: str, limit: int, before_id: Optional[uuid.UUID] = None):
+        """
+        Read at most `limit` rows of a conversation, newest first, optionally
+        strictly older than `before_id`. Relies on the partition's
+        `message_id DESC` clustering order, so only the rows asked for are read.
+        Reads from the head of the conversation use the read_hot profile,
+        older pages read_history. With the bucketed layout, buckets are
+        walked newest first until `limit` rows are found.
+        """
 
-        query = """
-        SELECT * FROM messages WHERE conversation_id = %s
+        if settings.message_layout == "bucketed":
+            return await message_buckets.fetch_before(conversation_id, limit, before_id, READ_HOT if before_id is None else READ_HISTORY)
+        if before_id is None:
+            return await storage.aexecute(SELECT_MESSAGES, (conversation_id, limit), profile=READ_HOT)
+        return await storage.aexecute(SELECT_MESSAGES_BEFORE, (conversation_id, before_id, limit), profile=READ_HISTORY)
+
+    @staticmethod
+    async def _paginate(conversation_id: str, page: int, limit: int, cursor: Optional[str], before_id: Optional[uuid.UUID]):
         """
-        rows = cassandra_client.execute(query, (conversation_id,))
-        
-        all_messages = []
-        for row in rows:
-            message = {
-                "id": str(row.get('message_id')),
-                "sender_id": row.get('sender_id'),
-                "receiver_id": row.get('recipient_id'),
-                "created_at": str(unix_time_from_uuid1(row.get('message_id'))),
-                "conversation_id": str(row.get('conversation_id')),
-                "content": row.get('message_text'),
-            }
-            all_messages.append(message)
+        Shared pagination for the message listing endpoints.
 
-        # Sort messages by time descending (latest first)
-        all_messages.sort(key=lambda msg: msg["created_at"], reverse=True)
+        With a cursor the page starts right after the message it points to.
+        Without one, page-number paging reads only the first page * limit rows
+        (plus one to detect a following page) and skips the leading ones, so
+        it is refused (ValueError) past page_max_depth rows.
+        `total` therefore counts the messages up to the end of the page, not
+        the whole conversation; `has_more` tells whether older ones follow.
+        Pages inside a conversation's cached tail are served from memory; a
+        first-page miss loads the tail, unless a message is sent to the
+        conversation while it is being read.
+        """
 
-        # Manual pagination
-        total = len(all_messages)
-        start = (page - 1) * limit
-        end = start + limit
-        paginated_messages = all_messages[start:end]
+        if cursor is not None:
+            before_id = decode_cursor(cursor)
+            start = 0
+        else:
+            if page * limit > settings.page_max_depth:
+                raise ValueError(
+                    f"Page numbers only reach the newest {settings.page_max_depth} messages; "
+                    f"page further with the cursor returned as next_cursor"
+                )
+            start = (page - 1) * limit
+
+        cached = message_cache.get_page(conversation_id, start, limit, before_id)
+        if cached is not None:
+            messages, has_more = cached
+        else:
+            read_through = message_cache.enabled and before_id is None and start + limit <= message_cache.tail_size
+            if read_through:
+                generation = message_cache.begin_fill(conversation_id)
+                try:
+                    rows = await MessageModel._fetch_messages(conversation_id, message_cache.tail_size + 1)
+                finally:
+                    # A message sent meanwhile may be missing from the rows
+                    fresh = message_cache.end_fill(conversation_id, generation)
+                tail = [(row["message_id"], row_to_message(row)) for row in rows[:message_cache.tail_size]]
+                if fresh:
+                    message_cache.store(conversation_id, tail, complete=len(rows) <= message_cache.tail_size)
+                messages = tail[start:start + limit]
+            else:
+                rows = await MessageModel._fetch_messages(conversation_id, start + limit + 1, before_id)
+                messages = [(row["message_id"], row_to_message(row)) for row in rows[start:start + limit]]
+            has_more = len(rows) > start + limit
 
         return {
-            "total": total,
+            "total": start + len(messages) if messages or start == 0 else len(rows),
             "page": page,
             "limit": limit,
-            "data": paginated_messages
+            "data": [message for _, message in messages],
+            "has_more": has_more,
+            "next_cursor": encode_cursor(messages[-1][0]) if has_more else None,
         }
-    
+
     @staticmethod
-    async def get_messages_before_timestamp(conversation_id: str, before_timestamp: datetime, page: int, limit: int):
+    async def get_conversation_messages(conversation_id: str, page: int, limit: int, cursor: Optional[str] = None):
+        """
+        Get messages of a conversation, latest first, by page number or cursor.
+        """
+
+        return await MessageModel._paginate(conversation_id, page, limit, cursor, None)
+
+    @staticmethod
+    async def get_messages_before_timestamp(conversation_id: str, before_timestamp: datetime, page: int, limit: int, cursor: Optional[str] = None):
         """
         Get messages before a timestamp with pagination.
         """
 
-        time_stamp = uuid_from_time(before_timestamp)
-        query = """
-        SELECT * FROM messages WHERE conversation_id = %s AND message_id < %s
+        return await MessageModel._paginate(conversation_id, page, limit, cursor, uuid_from_time(before_timestamp))
+
+    @staticmethod
+    async def _messages_after(conversation_id: str, after_id: uuid.UUID, limit: int) -> Dict[str, Any]:
+        """
+        Up to `limit` messages newer than `after_id`, oldest first, from the
+        cached tail when it reaches back far enough, otherwise from a
+        `message_id > ?` range read of limit + 1 rows.
         """
-        rows = cassandra_client.execute(query, (conversation_id, time_stamp))
-        print(rows)
-        all_messages = []
-        for row in rows:
-            message = {
-                "id": str(row.get('message_id')),
-                "sender_id": row.get('sender_id'),
-                "receiver_id": row.get('recipient_id'),
-                "created_at": str(unix_time_from_uuid1(row.get('message_id'))),
-                "conversation_id": str(row.get('conversation_id')),
-                "content": row.get('message_text'),
-            }
-            all_messages.append(message)
 
-        # Sort messages by time descending (latest first)
-        all_messages.sort(key=lambda msg: msg["created_at"], reverse=True)
+        cached = message_cache.get_after(conversation_id, after_id, limit)
+        if cached is not None:
+            messages, has_more = cached
+        else:
+            if settings.message_layout == "bucketed":
+                rows = await message_buckets.fetch_after(conversation_id, after_id, limit + 1, READ_HOT)
+            else:
+                rows = await storage.aexecute(SELECT_MESSAGES_AFTER, (conversation_id, after_id, limit + 1), profile=READ_HOT)
+            messages = [(row["message_id"], row_to_message(row)) for row in rows[:limit]]
+            has_more = len(rows) > limit
 
-        # Manual pagination
-        total = len(all_messages)
-        start = (page - 1) * limit
-        end = start + limit
-        paginated_messages = all_messages[start:end]
+        return {
+            "conversation_id": conversation_id,
+            "data": [message for _, message in messages],
+            "has_more": has_more,
+            "next_after": str(messages[-1][0]) if messages else str(after_id),
+        }
+
+    @staticmethod
+    async def get_messages_since(conversation_id: str, after: str, limit: int):
+        """
+        Get the messages of a conversation sent after the message `after`,
+        oldest first, for clients catching up after a disconnect.
+        """
+
+        return await MessageModel._messages_after(conversation_id, parse_message_id(after), limit)
+
+    @staticmethod
+    async def get_user_messages_since(user_id: int, after: str, limit: int, max_conversations: int):
+        """
+        Get the messages sent after the message `after` in all conversations
+        of a user.
+
+        The user's inbox is read in ascending order from `after`, so only
+        conversations with newer activity are visited, oldest activity
+        first. At most `max_conversations` of them are returned, each with up
+        to `limit` messages; `next_after` is the activity time of the last
+        conversation returned, so passing it back continues with the rest.
+        """
+
+        after_id = parse_message_id(after)
+        rows = await storage.aexecute(
+            SELECT_USER_CONVERSATIONS_AFTER, (user_id, after_id, max_conversations + 1), profile=READ_HOT
+        )
+        has_more = len(rows) > max_conversations
+        rows = rows[:max_conversations]
 
+        # An inbox can briefly hold an older row next to the current one.
+        conversation_ids = list(dict.fromkeys(row["conversation_id"] for row in rows))
+        conversations = await asyncio.gather(
+            *(MessageModel._messages_after(conversation_id, after_id, limit) for conversation_id in conversation_ids)
+        )
         return {
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "data": paginated_messages
+            "conversations": list(conversations),
+            "has_more": has_more,
+            "next_after": str(rows[-1]["last_message_time"]) if rows else str(after_id),
         }
-        
+
+    @staticmethod
+    async def export_messages(
+        conversation_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        after_id: Optional[str] = None
+    ):
+        """
+        Open a paged scan over a conversation, latest first, for exports.
+
+        Only messages sent at or after `start` and before `end` are returned.
+        `after_id` is the id of the last message an interrupted export
+        received; the scan resumes right after it. Raises ValueError for an
+        invalid id or a start that is not before the end. Pages of message_export_fetch_size
+        rows are fetched as the returned pager is consumed.
+        """
+
+        if start is not None and end is not None and start >= end:
+            raise ValueError("start must be before end")
+
+        lower = min_uuid_from_time(start) if start is not None else MIN_MESSAGE_ID
+        upper = min_uuid_from_time(end) if end is not None else MAX_MESSAGE_ID
+        if after_id is not None:
+            resume = parse_message_id(after_id)
+            if resume.time < upper.time:
+                upper = resume
+
+        if settings.message_layout == "bucketed":
+            return message_buckets.BucketScan(conversation_id, lower, upper, settings.message_export_fetch_size, READ_HISTORY)
+        return await storage.aiter(
+            SELECT_MESSAGES_RANGE, (conversation_id, lower, upper),
+            fetch_size=settings.message_export_fetch_size, profile=READ_HISTORY
+        )
 
 
 class ConversationModel:
     
     @staticmethod
-    async def get_user_conversations(user_id: int, page: int = 1, limit: int = 20):
+    def inbox_lookups(updates: List[InboxUpdate]) -> List[Callable[[], Awaitable[Any]]]:
         """
-        Fetches all conversations where the given user_id.
-        Keeps only the latest conversation per receiver.
+        Reads of the current inbox row for each update, for run_idempotent.
         """
 
-        query = """
-        SELECT * FROM user_conversations WHERE user_id = %s
+        return [
+            partial(storage.aexecute, SELECT_CONVERSATION_LATEST, (update.user_id, update.conversation_id), profile=READ_HOT)
+            for update in updates
+        ]
+
+    @staticmethod
+    async def write_inbox_updates(updates: List[InboxUpdate], concurrency: Optional[int] = None) -> int:
+        """
+        Look up and replace the inbox rows of the given updates. Returns the
+        number of updates that failed.
         """
-        rows = cassandra_client.execute(query, (user_id,))
 
-        conversations_map = {}
+        lookups = await run_idempotent(ConversationModel.inbox_lookups(updates), concurrency)
+        return await ConversationModel.apply_inbox_updates(updates, lookups, concurrency)
 
-        for row in rows:
-            receiver_id = row.get("receiver_id")
-            last_message_time = row.get("last_message_time")
+    @staticmethod
+    def record_inbox_cache(updates: List[InboxUpdate]) -> None:
+        for update in updates:
+            inbox_cache.record_message(
+                update.user_id, update.other_user_id, update.conversation_id,
+                update.message_id, update.message_text, format_last_message_at(update.message_id)
+            )
+
+    @staticmethod
+    async def apply_inbox_updates(updates: List[InboxUpdate], lookups: List[Any], concurrency: Optional[int] = None) -> int:
+        """
+        Replace the inbox rows of the given updates, using the results of
+        inbox_lookups (rows or an exception per update). Cached inboxes are
+        updated as well. Returns the number of updates that failed.
+        """
+
+        ConversationModel.record_inbox_cache(updates)
+        failed = 0
+        batches = []
+        for update, rows in zip(updates, lookups):
+            if isinstance(rows, Exception):
+                failed += 1
+                continue
+            statements = ConversationModel.inbox_update_statements(
+                *update, previous=rows[0]["last_message_time"] if rows else None
+            )
+            if statements:
+                batches.append(partial(storage.abatch, statements, profile=WRITE_INBOX))
+
+        failed += sum(isinstance(result, Exception) for result in await run_idempotent(batches, concurrency))
+        return failed
+
+    @staticmethod
+    def inbox_update_statements(
+        user_id: int,
+        other_user_id: int,
+        conversation_id: str,
+        message_id: uuid.UUID,
+        message_text: str,
+        timestamp: int,
+        previous: Optional[uuid.UUID] = None
+    ) -> List[tuple]:
+        """
+        Statements that move a conversation to the top of a user's inbox:
+        the previous inbox row is deleted, the new one inserted and the
+        user_conversation_latest lookup updated, all in the user's partition.
+        Returns an empty list when the inbox already shows this or a newer message.
+        """
+
+        if previous is not None and previous.time >= message_id.time:
+            return []
+
+        statements = []
+        if previous is not None:
+            statements.append((DELETE_USER_CONVERSATION, (timestamp, user_id, previous, conversation_id)))
+        statements.append((INSERT_USER_CONVERSATION, (user_id, message_id, conversation_id, other_user_id, message_text, timestamp)))
+        statements.append((UPSERT_CONVERSATION_LATEST, (user_id, conversation_id, message_id, timestamp)))
+        return statements
 
-            # Check if we already have a conversation with this receiver_id
-            if receiver_id not in conversations_map or last_message_time > conversations_map[receiver_id]["last_message_time"]:
-                conversations_map[receiver_id] = {
-                    "id": row.get("conversation_id"),
+    @staticmethod
+    async def get_user_conversations(user_id: int, page: int = 1, limit: int = 20):
+        """
+        Fetches the conversations of the given user_id, latest first.
+
+        Pages covered by the user's cached listing are served from memory.
+        Otherwise the inbox, which holds one row per conversation, is read
+        only as far as needed: the first page * limit rows, or the cached
+        listing size on a read-through. Rows left behind by concurrent sends
+        are skipped and deleted as they are encountered.
+        """
+
+        start = (page - 1) * limit
+        cached = inbox_cache.get_page(user_id, start, limit)
+        if cached is not None:
+            conversations, total = cached
+            return {"total": total, "page": page, "limit": limit, "data": [conversation for _, conversation in conversations]}
+
+        read_through = inbox_cache.enabled and start + limit <= inbox_cache.max_conversations
+        target = inbox_cache.max_conversations if read_through else start + limit
+        generation = inbox_cache.begin_fill(user_id) if read_through else None
+        try:
+            count_rows, pager = await asyncio.gather(
+                storage.aexecute(COUNT_USER_CONVERSATIONS, (user_id,), profile=READ_HOT),
+                storage.aiter(SELECT_USER_CONVERSATIONS, (user_id,), fetch_size=target, profile=READ_HOT),
+            )
+
+            conversations = []
+            seen = set()
+            stale = []
+            async for row in pager:
+                conversation_id = row.get("conversation_id")
+                last_message_time = row.get("last_message_time")
+                if conversation_id in seen:
+                    stale.append((DELETE_STALE_USER_CONVERSATION, (user_id, last_message_time, conversation_id)))
+                    continue
+                seen.add(conversation_id)
+                conversation_directory.remember(user_id, row.get("receiver_id"), conversation_id)
+                conversations.append((last_message_time, {
+                    "id": conversation_id,
                     "user1_id": user_id,
-                    "user2_id": receiver_id,
+                    "user2_id": row.get("receiver_id"),
+                    "last_message_at": format_last_message_at(last_message_time),
                     "last_message_content": row.get("last_message"),
-                    "last_message_time": last_message_time,
-                    "last_message_at": str(unix_time_from_uuid1(last_message_time)),
-                }
-         
-        sorted_conversations = sorted(conversations_map.values(), key=lambda x: x["last_message_time"], reverse=True)
-        start, end = (page - 1) * limit, page * limit
+                }))
+                if len(conversations) >= target:
+                    break
+        finally:
+            # A send meanwhile may be missing from the listing
+            fresh = read_through and inbox_cache.end_fill(user_id, generation)
+
+        if stale:
+            await storage.aexecute_many(stale, return_exceptions=True, profile=WRITE_INBOX)
+
+        total = max(count_rows[0]["total"] if count_rows else 0, len(conversations))
+        if fresh:
+            inbox_cache.store(user_id, conversations, total, complete=len(conversations) < target or len(conversations) >= total)
+
         return {
-            "total": len(sorted_conversations),
+            "total": total,
             "page": page,
             "limit": limit,
-            "data": sorted_conversations[start:end]
+            "data": [conversation for _, conversation in conversations[start:start + limit]]
         }
 
 
@@ -161,42 +678,36 @@ class ConversationModel:
         Get a conversation by ID.
         """
 
-        query = """
-        SELECT * FROM messages 
-        WHERE conversation_id = %s 
-        ORDER BY message_id DESC 
-        LIMIT 1
-        """
-        rows = cassandra_client.execute(query, (conversation_id,))
+        rows = await MessageModel._fetch_messages(conversation_id, 1)
         for row in rows:
             return {
                 "id": row.get("conversation_id"),
                 "user1_id": row.get("sender_id"),
                 "user2_id": row.get("recipient_id"),
-                "last_message_at": str(unix_time_from_uuid1(row.get("message_id"))),
-                "conversation_id": row.get("conversation_id"),
+                "last_message_at": format_last_message_at(row.get("message_id")),
                 "last_message_content": str(row.get('message_text')),
             }
         return None
     
+    @staticmethod
+    async def _has_messages(conversation_id: str) -> bool:
+        rows = await MessageModel._fetch_messages(conversation_id, 1)
+        return bool(rows)
+
     @staticmethod
     async def create_or_get_conversation(sender_id: int, receiver_id: int):
         """
         Get an existing conversation between two users or create a new one.
+        Resolved through the conversation directory, so steady-state sends
+        do not read from Cassandra.
         """
 
-        conversation_ids = [
-            f"{sender_id}_{receiver_id}",
-            f"{receiver_id}_{sender_id}"
-        ]
+        return await conversation_directory.resolve(sender_id, receiver_id, ConversationModel._has_messages)
 
-        for conversation_id in conversation_ids:
-            query = """
-            SELECT * FROM messages WHERE conversation_id = %s LIMIT 1
-            """
-            rows = cassandra_client.execute(query, (conversation_id,))
-            if rows:
-                return conversation_id
 
-        return str(sorted([sender_id, receiver_id])[0]) + "_" + str(sorted([sender_id, receiver_id])[1])
-            
+# Buffers inbox updates of the send paths when INBOX_COALESCE_WINDOW is set
+inbox_coalescer = InboxCoalescer(
+    window=settings.inbox_coalesce_window,
+    max_pending=settings.inbox_coalesce_max_pending,
+    flush=partial(ConversationModel.write_inbox_updates, concurrency=settings.message_batch_concurrency),
+)
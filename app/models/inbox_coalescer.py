@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class InboxCoalescer:
+    """
+    Group commit of inbox updates.
+
+    Updates are buffered per (user, conversation) for `window` seconds and
+    only the newest one of each pair is written, so a burst of messages in a
+    conversation costs one inbox write per participant instead of one per
+    message. Updates are objects with user_id, conversation_id and
+    message_id (a timeuuid), written by `flush`, which returns how many of
+    them failed.
+
+    Durability: buffered updates are acknowledged before they are written.
+    Messages themselves are always written before the send returns; what a
+    crash within the window can lose is the inbox row pointing at them, so
+    the conversation shows its previous message (or is missing from a new
+    inbox) until its next message. Pending updates are written on graceful
+    shutdown by close(). Must be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        max_pending: int,
+        flush: Callable[[List[Any]], Awaitable[int]]
+    ):
+        self.window = window
+        self.max_pending = max_pending
+        self._write = flush
+        self._pending: Dict[Tuple[int, str], Any] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+        self.received = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, updates: List[Any]) -> None:
+        """
+        Buffer updates, keeping the newest per (user, conversation).
+        """
+
+        for update in updates:
+            self.received += 1
+            key = (update.user_id, update.conversation_id)
+            current = self._pending.get(key)
+            if current is None or current.message_id.time < update.message_id.time:
+                self._pending[key] = update
+
+        if len(self._pending) >= self.max_pending:
+            self._start_flush()
+        elif self._timer is None and self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._start_flush)
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        updates = list(self._pending.values())
+        self._pending = {}
+        task = asyncio.get_running_loop().create_task(self._flush(updates))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, updates: List[Any]) -> None:
+        self.flushes += 1
+        self.written += len(updates)
+        try:
+            failed = await self._write(updates)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(updates)} inbox update(s): {str(e)}")
+            failed = len(updates)
+        if failed:
+            self.failed += failed
+            logger.warning(f"{failed} of {len(updates)} coalesced inbox update(s) failed")
+
+    async def close(self) -> None:
+        """
+        Write everything still buffered and wait for flushes in progress.
+        """
+
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "received": self.received,
+            "pending": len(self._pending),
+            "written": self.written,
+            "coalesced": self.received - self.written - len(self._pending),
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
@@ -0,0 +1,152 @@
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.cache.lru import LRUCache
+from app.config import settings
+from app.db.cassandra_client import AsyncResultPager
+from app.db.storage import storage
+from app.db.connection import WRITE_MESSAGE
+from app.models.timeuuid import bucket_of, MAX_MESSAGE_ID
+
+BUCKETED_MESSAGE_COLUMNS = "conversation_id, bucket, message_id, sender_id, recipient_id, message_text"
+MESSAGE_COLUMNS = "conversation_id, message_id, sender_id, recipient_id, message_text"
+
+INSERT_BUCKETED_MESSAGE = storage.statement("insert_bucketed_message", f"""
+    INSERT INTO messages_by_bucket ({BUCKETED_MESSAGE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?) USING TIMESTAMP ?
+""")
+INSERT_CONVERSATION_BUCKET = storage.statement("insert_conversation_bucket", """
+    INSERT INTO conversation_buckets (conversation_id, bucket) VALUES (?, ?)
+""")
+SELECT_BUCKETS_BEFORE = storage.statement("select_buckets_before", """
+    SELECT bucket FROM conversation_buckets WHERE conversation_id = ? AND bucket <= ?
+""")
+SELECT_BUCKETS_AFTER = storage.statement("select_buckets_after", """
+    SELECT bucket FROM conversation_buckets WHERE conversation_id = ? AND bucket >= ?
+    ORDER BY bucket ASC
+""")
+SELECT_BUCKETS_BETWEEN = storage.statement("select_buckets_between", """
+    SELECT bucket FROM conversation_buckets WHERE conversation_id = ? AND bucket >= ? AND bucket <= ?
+""")
+SELECT_BUCKET_MESSAGES_BEFORE = storage.statement("select_bucket_messages_before", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages_by_bucket
+    WHERE conversation_id = ? AND bucket = ? AND message_id < ? LIMIT ?
+""")
+SELECT_BUCKET_MESSAGES_AFTER = storage.statement("select_bucket_messages_after", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages_by_bucket
+    WHERE conversation_id = ? AND bucket = ? AND message_id > ?
+    ORDER BY message_id ASC LIMIT ?
+""")
+SELECT_BUCKET_MESSAGES_RANGE = storage.statement("select_bucket_messages_range", f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages_by_bucket
+    WHERE conversation_id = ? AND bucket = ? AND message_id >= ? AND message_id < ?
+""")
+
+# Bucket ids listed per request when walking a conversation.
+BUCKET_FETCH_SIZE = 16
+
+
+# (conversation_id, bucket) pairs this process has already written to
+# conversation_buckets, so that only the first message of a bucket pays for it.
+known_buckets = LRUCache(max_entries=settings.conversation_cache_size)
+
+
+async def register_bucket(conversation_id: str, bucket: int) -> None:
+    if known_buckets.peek((conversation_id, bucket)) is not None:
+        return
+    await storage.aexecute(INSERT_CONVERSATION_BUCKET, (conversation_id, bucket), profile=WRITE_MESSAGE)
+    known_buckets.put((conversation_id, bucket), True)
+
+
+async def fetch_before(
+    conversation_id: str,
+    limit: int,
+    before_id: Optional[uuid.UUID],
+    profile: str
+) -> List[Dict[str, Any]]:
+    """
+    Up to `limit` messages older than `before_id` (or the newest ones),
+    newest first. Buckets are visited newest first and the walk stops as
+    soon as the page is filled.
+    """
+
+    upper = before_id or MAX_MESSAGE_ID
+    buckets = await storage.aiter(
+        SELECT_BUCKETS_BEFORE, (conversation_id, bucket_of(upper)), fetch_size=BUCKET_FETCH_SIZE, profile=profile
+    )
+    rows: List[Dict[str, Any]] = []
+    async for row in buckets:
+        rows.extend(await storage.aexecute(
+            SELECT_BUCKET_MESSAGES_BEFORE, (conversation_id, row["bucket"], upper, limit - len(rows)), profile=profile
+        ))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+async def fetch_after(conversation_id: str, after_id: uuid.UUID, limit: int, profile: str) -> List[Dict[str, Any]]:
+    """
+    Up to `limit` messages newer than `after_id`, oldest first, walking
+    buckets oldest first from the one holding `after_id`.
+    """
+
+    buckets = await storage.aiter(
+        SELECT_BUCKETS_AFTER, (conversation_id, bucket_of(after_id)), fetch_size=BUCKET_FETCH_SIZE, profile=profile
+    )
+    rows: List[Dict[str, Any]] = []
+    async for row in buckets:
+        rows.extend(await storage.aexecute(
+            SELECT_BUCKET_MESSAGES_AFTER, (conversation_id, row["bucket"], after_id, limit - len(rows)), profile=profile
+        ))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+class BucketScan:
+    """
+    Paged scan of the messages of a conversation with lower <= message_id <
+    upper, newest first, across buckets. Exposes next_page() like
+    AsyncResultPager; every page comes from a single bucket.
+    """
+
+    def __init__(self, conversation_id: str, lower: uuid.UUID, upper: uuid.UUID, fetch_size: int, profile: str):
+        self.conversation_id = conversation_id
+        self.lower = lower
+        self.upper = upper
+        self.fetch_size = fetch_size
+        self.profile = profile
+        self._buckets: Optional[AsyncResultPager] = None
+        self._pager: Optional[AsyncResultPager] = None
+
+    async def _next_bucket(self) -> Optional[int]:
+        if self._buckets is None:
+            self._buckets = await storage.aiter(
+                SELECT_BUCKETS_BETWEEN,
+                (self.conversation_id, bucket_of(self.lower), bucket_of(self.upper)),
+                fetch_size=BUCKET_FETCH_SIZE, profile=self.profile
+            )
+        try:
+            return (await self._buckets.__anext__())["bucket"]
+        except StopAsyncIteration:
+            return None
+
+    async def next_page(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Wait for the next non-empty page of rows. Returns None once every
+        bucket has been read.
+        """
+
+        while True:
+            if self._pager is None:
+                bucket = await self._next_bucket()
+                if bucket is None:
+                    return None
+                self._pager = await storage.aiter(
+                    SELECT_BUCKET_MESSAGES_RANGE, (self.conversation_id, bucket, self.lower, self.upper),
+                    fetch_size=self.fetch_size, profile=self.profile
+                )
+            page = await self._pager.next_page()
+            if page is None:
+                self._pager = None
+            elif page:
+                return page
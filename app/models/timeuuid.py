@@ -0,0 +1,63 @@
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Tuple
+
+from cassandra.util import unix_time_from_uuid1, min_uuid_from_time, max_uuid_from_time
+from pydantic import TypeAdapter
+
+from app.config import settings
+
+# Open bounds for message_id range scans.
+MIN_MESSAGE_ID = min_uuid_from_time(0)
+MAX_MESSAGE_ID = max_uuid_from_time(253402300799)  # 9999-12-31T23:59:59Z
+
+# Offset between the UUID epoch (1582-10-15) and the Unix epoch, in 100ns units.
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def write_timestamp(message_id: uuid.UUID) -> int:
+    """
+    Cassandra write timestamp (microseconds since epoch) shared by every row
+    written for a message, derived from its timeuuid.
+    """
+
+    return (message_id.time - UUID_EPOCH_OFFSET) // 10
+
+
+def bucket_of(message_id: uuid.UUID, granularity: str = None) -> int:
+    """
+    Bucket of a message: days ("day") or months ("month") since the Unix
+    epoch, from its timeuuid. Defaults to MESSAGE_BUCKET.
+    """
+
+    seconds = unix_time_from_uuid1(message_id)
+    if (granularity or settings.message_bucket) == "month":
+        moment = datetime.fromtimestamp(max(seconds, 0), tz=timezone.utc)
+        return (moment.year - 1970) * 12 + moment.month - 1
+    return int(seconds // 86400)
+
+
+_DATETIME = TypeAdapter(datetime)
+
+
+@lru_cache(maxsize=16384)
+def format_message_id(message_id: uuid.UUID) -> Tuple[str, str]:
+    """
+    `id` and `created_at` of a message as sent to clients: the timeuuid as a
+    string and its time in Unix seconds, as a string. Both take about a
+    microsecond to compute, so they are cached for messages read again.
+    """
+
+    return str(message_id), str(unix_time_from_uuid1(message_id))
+
+
+@lru_cache(maxsize=16384)
+def format_last_message_at(message_id: uuid.UUID) -> str:
+    """
+    `last_message_at` of a conversation as sent to clients: the ISO 8601 form
+    the ConversationResponse schema gives the message's time, e.g.
+    "2023-11-14T22:13:20.123456Z".
+    """
+
+    return _DATETIME.dump_python(_DATETIME.validate_python(str(unix_time_from_uuid1(message_id))), mode="json")
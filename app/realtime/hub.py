@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+Deliver = Callable[[List[int], Event], None]
+
+# Sent to a subscriber that could not keep up, right before it is closed.
+RESYNC_EVENT: Event = {"type": "resync", "reason": "slow consumer"}
+
+
+class Subscription:
+    """
+    Events for one connected client of a user, buffered in a bounded queue.
+    """
+
+    def __init__(self, user_id: int, queue_size: int):
+        self.user_id = user_id
+        self.queue_size = queue_size
+        # Bounded by offer(), so that close() can always append its markers.
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue()
+        self.closed = False
+
+    def offer(self, event: Event) -> bool:
+        """
+        Queue an event without blocking. Returns False if the queue is full.
+        """
+        if self.closed:
+            return True
+        if self.queue.qsize() >= self.queue_size:
+            return False
+        self.queue.put_nowait(event)
+        return True
+
+    def close(self, final_event: Optional[Event] = None) -> None:
+        """
+        Replace whatever is still queued by `final_event`, if any, followed by
+        the end-of-stream marker.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        if final_event is not None:
+            self.queue.put_nowait(final_event)
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """
+        Wait for the next event. Returns None once the subscription is
+        closed; raises asyncio.TimeoutError if nothing arrives in `timeout`.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Transport:
+    """
+    Carries published events to the hubs of every worker.
+
+    `start` is given the local hub's delivery function, which must be called
+    on the event loop for every event published by any worker.
+    """
+
+    async def start(self, deliver: Deliver) -> None:
+        raise NotImplementedError
+
+    async def publish(self, user_ids: List[int], event: Event) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessTransport(Transport):
+    """
+    Delivers events to the local hub only. Enough for a single worker and
+    for tests; subscribers connected to other workers see nothing.
+    """
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, user_ids: List[int], event: Event) -> None:
+        if self._deliver is not None:
+            self._deliver(user_ids, event)
+
+
+# REALTIME_TRANSPORT values. A cross-worker transport (e.g. a broker
+# subscription per worker) registers itself here.
+TRANSPORTS: Dict[str, Callable[[], Transport]] = {
+    "inprocess": InProcessTransport,
+}
+
+
+class MessageHub:
+    """
+    asyncio pub/sub of message events, keyed by user.
+
+    Publishing never waits for subscribers: every subscription has a bounded
+    queue and a subscriber whose queue is full is dropped, after receiving
+    RESYNC_EVENT so that it can catch up through the `since` endpoints.
+    Must be used from the event loop only.
+    """
+
+    def __init__(self, queue_size: int, transport: Transport):
+        self.queue_size = queue_size
+        self.transport = transport
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._started = False
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        if not self._started:
+            await self.transport.start(self.deliver)
+            self._started = True
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription, final_event: Optional[Event] = None) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+        subscription.close(final_event)
+
+    async def publish(self, user_ids: Iterable[int], event: Event) -> None:
+        """
+        Send an event to every subscriber of the given users, on all workers.
+        """
+        await self.start()
+        self.published += 1
+        await self.transport.publish(list(dict.fromkeys(user_ids)), event)
+
+    def deliver(self, user_ids: List[int], event: Event) -> None:
+        """
+        Fan an event out to the local subscribers of the given users.
+        """
+        for user_id in user_ids:
+            for subscription in list(self._subscriptions.get(user_id, ())):
+                if subscription.offer(event):
+                    self.delivered += 1
+                    continue
+                logger.warning(f"Dropping slow realtime subscriber of user {user_id}")
+                self.dropped += 1
+                self.unsubscribe(subscription, RESYNC_EVENT)
+
+    async def close(self) -> None:
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                self.unsubscribe(subscription)
+        await self.transport.close()
+        self._started = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._subscriptions),
+            "subscribers": sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+message_hub = MessageHub(
+    queue_size=settings.realtime_queue_size,
+    transport=TRANSPORTS[settings.realtime_transport](),
+)
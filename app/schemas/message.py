@@ -20,9 +20,34 @@ class PaginatedMessageRequest(BaseModel):
     page: int = Field(1, description="Page number for pagination")
     limit: int = Field(20, description="Number of items per page")
     before_timestamp: Optional[datetime] = Field(None, description="Get messages before this timestamp")
+    cursor: Optional[str] = Field(None, description="Cursor returned by the previous page")
 
 class PaginatedMessageResponse(BaseModel):
-    total: int = Field(..., description="Total number of messages")
+    total: int = Field(..., description="Number of messages up to and including this page, counted from the cursor if one is given; the conversation's total only on the last page")
     page: int = Field(..., description="Current page number")
     limit: int = Field(..., description="Number of items per page")
-    data: List[MessageResponse] = Field(..., description="List of messages") 
\ No newline at end of file
+    data: List[MessageResponse] = Field(..., description="List of messages")
+    has_more: bool = Field(..., description="Whether older messages follow this page")
+    next_cursor: Optional[str] = Field(None, description="Opaque cursor for the next page, null when there are no more messages") 
+
+class BatchMessageResult(BaseModel):
+    index: int = Field(..., description="Position of the message in the request")
+    status: str = Field(..., description="'created' or 'failed'")
+    message: Optional[MessageResponse] = Field(None, description="The created message")
+    error: Optional[str] = Field(None, description="Why the message could not be stored")
+
+class BatchMessageResponse(BaseModel):
+    created: int = Field(..., description="Number of messages stored")
+    failed: int = Field(..., description="Number of messages that could not be stored")
+    results: List[BatchMessageResult] = Field(..., description="Per-message results, in request order")
+
+class MessageSyncResponse(BaseModel):
+    conversation_id: str = Field(..., description="ID of the conversation")
+    data: List[MessageResponse] = Field(..., description="Messages newer than `after`, oldest first")
+    has_more: bool = Field(..., description="Whether more new messages follow the returned ones")
+    next_after: str = Field(..., description="Message id to pass as `after` to continue")
+
+class UserMessageSyncResponse(BaseModel):
+    conversations: List[MessageSyncResponse] = Field(..., description="Conversations with messages newer than `after`")
+    has_more: bool = Field(..., description="Whether more conversations have newer messages")
+    next_after: str = Field(..., description="Message id to pass as `after` to continue with the remaining conversations")
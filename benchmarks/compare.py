@@ -0,0 +1,77 @@
+import sys
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.results import load_results
+
+# Metrics compared per result kind, and whether higher is better
+METRICS: Dict[str, List[Tuple[str, bool]]] = {
+    "loadtest": [("throughput", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)],
+    "micro": [("per_op_us", False)],
+}
+
+
+def change(base: float, new: float) -> float:
+    """Relative change from base to new, in percent."""
+    if base == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - base) / base * 100
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> int:
+    """
+    Print the change of every metric of the entries both runs have, marking
+    those that got worse by more than `threshold` percent. Returns how many
+    did.
+    """
+    if base["kind"] != new["kind"]:
+        raise ValueError(f"Cannot compare a {base['kind']} run with a {new['kind']} run")
+    metrics = METRICS[base["kind"]]
+    for label, run in (("base", base), ("new", new)):
+        environment = run["environment"]
+        print(f"{label}: {run['created_at']} commit {(environment['commit'] or '?')[:12]}"
+              f"{' (dirty)' if environment['dirty'] else ''} python {environment['python']}")
+
+    regressions = 0
+    header = "".join(f"{name:>24}" for name, _ in metrics)
+    print(f"\n{'':<36}{header}")
+    for name in [name for name in base["results"] if name in new["results"]]:
+        cells = []
+        for metric, higher_is_better in metrics:
+            old_value, new_value = base["results"][name][metric], new["results"][name][metric]
+            delta = change(old_value, new_value)
+            worse = -delta if higher_is_better else delta
+            flag = "!" if worse > threshold else " "
+            regressions += worse > threshold
+            cells.append(f"{old_value:>9.2f} ->{new_value:>9.2f} {delta:+6.1f}%{flag}")
+        print(f"{name:<36}" + "".join(f"{cell:>24}" for cell in cells))
+
+    only = sorted(set(base["results"]) ^ set(new["results"]))
+    if only:
+        print(f"\nIn one run only: {', '.join(only)}")
+    return regressions
+
+
+def main():
+    """Compare two result files; exits with 1 if anything regressed."""
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base", help="Result file of the baseline run")
+    parser.add_argument("new", help="Result file of the run to compare")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="Percent by which a metric may get worse before it counts as a regression")
+    args = parser.parse_args()
+
+    try:
+        regressions = compare(load_results(args.base), load_results(args.new), args.threshold)
+    except ValueError as e:
+        parser.error(str(e))
+    if regressions:
+        print(f"\n{regressions} metric(s) worse by more than {args.threshold:g}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
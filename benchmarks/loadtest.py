@@ -0,0 +1,243 @@
+import os
+import sys
+import time
+import socket
+import random
+import asyncio
+import logging
+import argparse
+import subprocess
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from benchmarks.results import latency_summary, write_results
+from benchmarks.workload import (
+    DEFAULT_MIX, Dataset, Request, Workload, add_dataset_arguments, dataset_arguments, parse_mix
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# One line per request otherwise
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class Recorder:
+    """
+    Latencies and outcomes per endpoint of the requests that started after
+    the warm-up.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.measuring = False
+
+    def record(self, endpoint: str, latency: float, status: str) -> None:
+        if not self.measuring:
+            return
+        self.statuses[endpoint][status] += 1
+        if status.startswith("2"):
+            self.latencies[endpoint].append(latency)
+        else:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        results = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            results[endpoint] = {
+                **latency_summary(self.latencies[endpoint], self.errors[endpoint], elapsed),
+                "statuses": dict(self.statuses[endpoint]),
+            }
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        results["all"] = latency_summary(everything, sum(self.errors.values()), elapsed)
+        return results
+
+
+async def issue(client: httpx.AsyncClient, request: Request) -> str:
+    """
+    Send a request and read its whole body. Returns the status code, or the
+    error's name if there was no response.
+    """
+    try:
+        response = await client.request(request.method, request.path, json=request.body)
+        return str(response.status_code)
+    except httpx.HTTPError as e:
+        return type(e).__name__
+
+
+async def closed_loop(client, workload: Workload, recorder: Recorder, concurrency: int, deadline: float) -> None:
+    """
+    `concurrency` clients each sending their next request as soon as the
+    previous one is answered.
+    """
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            request = workload.next()
+            started = time.perf_counter()
+            status = await issue(client, request)
+            recorder.record(request.endpoint, time.perf_counter() - started, status)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+
+
+async def open_loop(client, workload: Workload, recorder: Recorder, rate: float, deadline: float, seed: int) -> None:
+    """
+    Requests arriving at `rate` per second (Poisson), whether or not earlier
+    ones were answered. Latency counts from when a request was due, so a
+    stalled server is not hidden by requests that were sent late.
+    """
+    rng = random.Random(seed)
+    pending = set()
+
+    async def timed(request: Request, due: float):
+        status = await issue(client, request)
+        recorder.record(request.endpoint, time.perf_counter() - due, status)
+
+    due = time.perf_counter()
+    while due < deadline:
+        due += rng.expovariate(rate)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(timed(workload.next(), due))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_standin(args) -> subprocess.Popen:
+    """
+    Serve the app on seeded in-memory storage in a child process, so the
+    driver's own CPU use does not count against the server.
+    """
+    command = [
+        sys.executable, str(Path(__file__).with_name("standin.py")),
+        "--port", str(args.port), "--latency", str(args.latency), "--jitter", str(args.jitter),
+        *dataset_arguments(args),
+    ]
+    return subprocess.Popen(
+        command, cwd=Path(__file__).resolve().parent.parent, env={**os.environ, "STORAGE_BACKEND": args.backend}
+    )
+
+
+async def wait_until_ready(url: str, server: Optional[subprocess.Popen], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url, timeout=5) as client:
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                raise RuntimeError(f"The app server exited with status {server.returncode}")
+            try:
+                if (await client.get("/readyz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+async def run(args, url: str) -> Dict[str, Dict]:
+    workload = Workload(Dataset.from_args(args), parse_mix(args.mix), args.workload_seed, args.page_size)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + args.warmup + args.duration
+
+        async def start_measuring():
+            await asyncio.sleep(args.warmup)
+            recorder.measuring = True
+            return time.perf_counter(), time.process_time()
+
+        measuring = asyncio.create_task(start_measuring())
+        if args.rate:
+            await open_loop(client, workload, recorder, args.rate, deadline, args.workload_seed)
+        else:
+            await closed_loop(client, workload, recorder, args.concurrency, deadline)
+        measured_from, cpu_from = await measuring
+        elapsed = time.perf_counter() - measured_from
+
+    # A driver that is short of CPU measures itself rather than the server.
+    driver_cpu = (time.process_time() - cpu_from) / elapsed
+    if driver_cpu > 0.9:
+        logger.warning(f"The load driver used {driver_cpu:.0%} of a CPU; run several drivers or lower the load")
+    results = recorder.summary(elapsed)
+    results["all"]["driver_cpu"] = driver_cpu
+    return results
+
+
+def report(results: Dict[str, Dict]) -> None:
+    print(f"{'endpoint':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, summary in results.items():
+        print(
+            f"{endpoint:<14}{summary['requests']:>10}{summary['errors']:>8}{summary['throughput']:>10.1f}"
+            f"{summary['p50_ms']:>9.2f}{summary['p95_ms']:>9.2f}{summary['p99_ms']:>9.2f}{summary['max_ms']:>9.2f}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the API with a mix of endpoints")
+    parser.add_argument("--url", help="App to load test; by default one is started on in-memory storage")
+    parser.add_argument("--backend", choices=("memory", "cassandra"), default="memory",
+                        help="Storage of the app started without --url: the memory backend, or the Cassandra "
+                             "client and driver against a stand-in session (default memory)")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"Endpoint weights, from {', '.join(Workload.ENDPOINTS)} (default {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients (connections with --rate)")
+    parser.add_argument("--rate", type=float, help="Requests per second, arriving at random (open loop); "
+                                                   "by default every client sends as soon as it is answered")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring starts")
+    parser.add_argument("--timeout", type=float, default=10, help="Request timeout in seconds")
+    parser.add_argument("--page-size", type=int, default=20, help="limit of listing requests")
+    parser.add_argument("--workload-seed", type=int, default=1, help="Random seed of the request sequence")
+    parser.add_argument("--port", type=int, default=None, help="Port of the app started without --url (default: a free one)")
+    parser.add_argument("--latency", type=float, default=0, help="In-memory storage: milliseconds per statement")
+    parser.add_argument("--jitter", type=float, default=0, help="In-memory storage: up to this many extra milliseconds")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/loadtest-<time>.json)")
+    add_dataset_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    """Run a load test and save its results."""
+    args = parse_args()
+    server = None
+    url = args.url
+    if url is None:
+        args.port = args.port or free_port()
+        url = f"http://127.0.0.1:{args.port}"
+        server = start_standin(args)
+    try:
+        asyncio.run(wait_until_ready(url, server, timeout=120))
+        logger.info(f"Load testing {url} for {args.duration:.0f}s after a {args.warmup:.0f}s warm-up")
+        results = asyncio.run(run(args, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    report(results)
+    config = {**vars(args), "backend": args.backend if server is not None else None}
+    path = write_results("loadtest", config, results, args.output)
+    logger.info(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# See benchmarks/standin.py: STORAGE_BACKEND=cassandra times the Cassandra
+# client and driver code too, against a stand-in session.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from cassandra.util import uuid_from_time
+
+from app.api.responses import PrebuiltJSONResponse
+from app.cache.inbox_cache import inbox_cache
+from app.cache.message_cache import message_cache
+from app.config import settings
+from app.db.storage import storage
+from app.models.cassandra_models import (
+    ConversationModel, MessageModel, decode_cursor, encode_cursor, row_to_message
+)
+from app.models.timeuuid import format_last_message_at, format_message_id
+from app.schemas.message import PaginatedMessageResponse
+from benchmarks import standin
+from benchmarks.results import write_results
+from benchmarks.workload import Dataset, add_dataset_arguments
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+
+def measure(run: Callable[[int], float], min_time: float, repeat: int) -> List[float]:
+    """
+    Seconds per call of an operation, once per repeat. `run(n)` performs it
+    n times and returns the time taken; n is doubled until a run lasts
+    `min_time`, as timeit's autorange does.
+    """
+    number = 1
+    while run(number) < min_time:
+        number *= 2
+    return [run(number) / number for _ in range(repeat)]
+
+
+def sync_runner(operation: Callable[[], Any]) -> Callable[[int], float]:
+    def run(number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        return time.perf_counter() - started
+
+    return run
+
+
+def async_runner(loop: asyncio.AbstractEventLoop, operation: Callable[[], Any]) -> Callable[[int], float]:
+    async def repeat(number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            await operation()
+        return time.perf_counter() - started
+
+    return lambda number: loop.run_until_complete(repeat(number))
+
+
+def message_rows(count: int) -> List[Dict[str, Any]]:
+    """Rows of a conversation page as the driver returns them."""
+    base = uuid_from_time(1700000000)
+    return [
+        {
+            "conversation_id": "1_2",
+            "message_id": uuid_from_time(1700000000 + i, clock_seq=base.clock_seq),
+            "sender_id": 1 + i % 2,
+            "recipient_id": 2 - i % 2,
+            "message_text": f"Message number {i} of the benchmark conversation",
+        }
+        for i in range(count)
+    ]
+
+
+def serialization_benchmarks() -> Dict[str, Callable[[int], float]]:
+    rows = message_rows(PAGE_SIZE)
+    page = {
+        "total": PAGE_SIZE, "page": 1, "limit": PAGE_SIZE,
+        "data": [row_to_message(row) for row in rows],
+        "has_more": True, "next_cursor": encode_cursor(rows[-1]["message_id"]),
+    }
+    cursor = page["next_cursor"]
+    message_id = rows[0]["message_id"]
+
+    def row_to_message_cold():
+        format_message_id.cache_clear()
+        for row in rows:
+            row_to_message(row)
+
+    def row_to_message_warm():
+        for row in rows:
+            row_to_message(row)
+
+    def format_last_message_at_cold():
+        format_last_message_at.cache_clear()
+        format_last_message_at(message_id)
+
+    return {
+        f"row_to_message_cold[{PAGE_SIZE}]": sync_runner(row_to_message_cold),
+        f"row_to_message_warm[{PAGE_SIZE}]": sync_runner(row_to_message_warm),
+        f"page_pydantic[{PAGE_SIZE}]": sync_runner(
+            lambda: PaginatedMessageResponse.model_validate(page).model_dump_json()
+        ),
+        f"page_prebuilt[{PAGE_SIZE}]": sync_runner(lambda: PrebuiltJSONResponse(page).body),
+        "format_last_message_at_cold": sync_runner(format_last_message_at_cold),
+        "format_last_message_at_warm": sync_runner(lambda: format_last_message_at(message_id)),
+        "encode_cursor": sync_runner(lambda: encode_cursor(message_id)),
+        "decode_cursor": sync_runner(lambda: decode_cursor(cursor)),
+    }
+
+
+def model_benchmarks(loop: asyncio.AbstractEventLoop, args) -> Dict[str, Callable[[int], float]]:
+    """
+    The model paths against in-memory storage without latency, so that
+    what is measured is the app's own work per request. The storage is
+    seeded before the first of them runs.
+    """
+    dataset = Dataset.from_args(args)
+
+    def setup():
+        started = time.monotonic()
+        standin.setup_backend(dataset)
+        logger.info(f"Seeded the {settings.storage_backend} backend in {time.monotonic() - started:.1f}s")
+        storage.ensure_connected()
+        storage.prepare_all()
+
+    def runner(operation):
+        run = async_runner(loop, operation)
+
+        def run_seeded(number):
+            if not storage.connected:
+                setup()
+            return run(number)
+
+        return run_seeded
+
+    # The largest conversation, and the busiest user, who is in it
+    user_a, user_b = dataset.conversations[0]
+    conversation_id = f"{user_a}_{user_b}"
+    before = dataset.end_time - timedelta(days=dataset.days / 2)
+    after = str(uuid_from_time(dataset.end_time - timedelta(days=1)))
+
+    async def history_uncached():
+        message_cache.invalidate(conversation_id)
+        await MessageModel.get_conversation_messages(conversation_id, 1, 20)
+
+    async def inbox_uncached():
+        inbox_cache.invalidate(user_a)
+        await ConversationModel.get_user_conversations(user_a, 1, 20)
+
+    return {
+        "get_conversation_messages_cached": runner(
+            lambda: MessageModel.get_conversation_messages(conversation_id, 1, 20)
+        ),
+        "get_conversation_messages_uncached": runner(history_uncached),
+        "get_conversation_messages_page3": runner(
+            lambda: MessageModel.get_conversation_messages(conversation_id, 3, 20)
+        ),
+        "get_messages_before_timestamp": runner(
+            lambda: MessageModel.get_messages_before_timestamp(conversation_id, before, 1, 20)
+        ),
+        "get_messages_since": runner(lambda: MessageModel.get_messages_since(conversation_id, after, 100)),
+        "get_user_conversations_cached": runner(
+            lambda: ConversationModel.get_user_conversations(user_a, 1, 20)
+        ),
+        "get_user_conversations_uncached": runner(inbox_uncached),
+        "create_message": runner(
+            lambda: MessageModel.create_message(conversation_id, user_a, user_b, "Benchmark message")
+        ),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the model and serialization paths in-process")
+    parser.add_argument("-k", dest="pattern", help="Only run benchmarks whose name matches this regular expression")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed run")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/micro-<time>.json)")
+    add_dataset_arguments(parser)
+    parser.set_defaults(messages=20000)
+    return parser.parse_args()
+
+
+def main():
+    """Run the micro-benchmarks and save their results."""
+    args = parse_args()
+    pattern = re.compile(args.pattern) if args.pattern else None
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    benchmarks = {**serialization_benchmarks(), **model_benchmarks(loop, args)}
+
+    results = {}
+    print(f"{'benchmark':<40}{'best us':>12}{'median us':>12}")
+    for name, run in benchmarks.items():
+        if pattern is not None and not pattern.search(name):
+            continue
+        timings = measure(run, args.min_time, args.repeat)
+        results[name] = {"per_op_us": min(timings) * 1e6, "median_us": statistics.median(timings) * 1e6}
+        print(f"{name:<40}{results[name]['per_op_us']:>12.2f}{results[name]['median_us']:>12.2f}")
+
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+    path = write_results("micro", vars(args), results, args.output)
+    logger.info(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
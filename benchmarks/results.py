@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Settings that change what a benchmark measures, recorded with its results
+SETTING_PREFIXES = ("STORAGE_", "CASSANDRA_", "MESSAGE_", "INBOX_", "CONVERSATION_", "REALTIME_", "WEB_CONCURRENCY")
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list, q in [0, 100].
+    """
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def latency_summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """
+    Throughput and latency distribution, in milliseconds, of the requests
+    of one endpoint completed in `elapsed` seconds.
+    """
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+    }
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=RESULTS_DIR.parent, capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    """
+    What a run was measured on: code revision, interpreter, machine and the
+    app settings taken from the environment.
+    """
+    try:
+        import orjson  # noqa: F401
+        has_orjson = True
+    except ImportError:
+        has_orjson = False
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "orjson": has_orjson,
+        "settings": {name: value for name, value in sorted(os.environ.items()) if name.startswith(SETTING_PREFIXES)},
+    }
+
+
+def write_results(kind: str, config: Dict[str, Any], results: Dict[str, Any], output: Optional[str] = None) -> Path:
+    """
+    Save a run as JSON, by default to benchmarks/results/<kind>-<time>.json.
+    Returns the path written.
+    """
+    created = datetime.now(timezone.utc)
+    path = Path(output) if output else RESULTS_DIR / f"{kind}-{created:%Y%m%d-%H%M%S}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "kind": kind,
+        "created_at": created.isoformat(),
+        "environment": environment(),
+        "config": config,
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2, default=str) + "\n")
+    return path
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
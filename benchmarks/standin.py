@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The app's in-memory backend unless STORAGE_BACKEND=cassandra, which runs
+# the Cassandra client and driver code against StandInSession instead.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from cassandra import InvalidRequest
+from cassandra.query import FETCH_SIZE_UNSET, BatchStatement, BoundStatement
+
+import app.db.cassandra_client as client_module
+from app.config import settings
+from app.db.cassandra_client import cassandra_client
+from app.db.memory_client import MemoryClient, MemoryEngine
+from app.db.storage import storage
+from app.models.timeuuid import write_timestamp
+from app.models.timeuuid import bucket_of
+
+logger = logging.getLogger(__name__)
+
+# Rows per page when a statement sets no fetch size, as in the driver
+DEFAULT_FETCH_SIZE = 5000
+
+
+class StandInPrepared:
+    """
+    What the client uses of a driver PreparedStatement.
+    """
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query_string = query
+        self.query_id = name.encode()
+        self.is_idempotent = False
+        # Every statement's partition key is its first bind value, except
+        # for the DELETE ... USING TIMESTAMP ones.
+        self.routing_key_indexes = [1] if name == "delete_user_conversation" else [0]
+        self.keyspace = None
+        self.consistency_level = None
+        self.serial_consistency_level = None
+        self.fetch_size = None
+        self.custom_payload = None
+        self.retry_policy = None
+        self.result_metadata = None
+        self.column_metadata = []
+
+    def bind(self, values) -> "StandInBound":
+        return StandInBound(self, values)
+
+
+class StandInBound(BoundStatement):
+    """
+    A bound statement keeping its raw values, which BatchStatement.add()
+    carries over as they are.
+    """
+
+    def __init__(self, prepared: StandInPrepared, values):
+        self.prepared_statement = prepared
+        self.values = list(values)
+        self.fetch_size = None
+
+
+class StandInResponseFuture:
+    """
+    What the client uses of a driver ResponseFuture. Rows are computed when
+    the statement is executed and handed out a page at a time, as copies,
+    each after the session's latency.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], fetch_size: Optional[int], latency: float, error: Optional[Exception] = None):
+        self._rows = rows
+        self._fetch_size = DEFAULT_FETCH_SIZE if fetch_size in (None, FETCH_SIZE_UNSET) else fetch_size
+        self._latency = latency
+        self._error = error
+        self._offset = 0
+        self._callback = None
+        self._errback = None
+
+    @property
+    def has_more_pages(self) -> bool:
+        return self._offset + self._fetch_size < len(self._rows)
+
+    def add_callbacks(self, callback, errback) -> None:
+        self._callback = callback
+        self._errback = errback
+        self._deliver()
+
+    def start_fetching_next_page(self) -> None:
+        self._offset += self._fetch_size
+        self._deliver()
+
+    def _deliver(self) -> None:
+        if self._error is not None:
+            deliver, argument = self._errback, self._error
+        else:
+            deliver, argument = self._callback, [dict(row) for row in self._rows[self._offset:self._offset + self._fetch_size]]
+        if self._latency > 0:
+            asyncio.get_running_loop().call_later(self._latency, deliver, argument)
+        else:
+            deliver(argument)
+
+    def get_query_trace_ids(self) -> list:
+        return []
+
+    def get_query_trace(self, max_wait: Optional[float] = None):
+        return None
+
+
+class StandInSession:
+    """
+    A driver Session running the app's statements on a MemoryEngine, so
+    that the Cassandra client's own code (binding, paging, admission
+    control, metrics) runs as it does against a cluster. Every statement is
+    answered after `latency` seconds plus up to `jitter` more.
+    """
+
+    def __init__(self, engine: MemoryEngine, latency: float = 0, jitter: float = 0):
+        self.engine = engine
+        self.latency = latency
+        self.jitter = jitter
+
+    def prepare(self, query: str) -> StandInPrepared:
+        name = cassandra_client.statement_name(query)
+        if name.startswith("_") or not hasattr(self.engine, name):
+            raise InvalidRequest(f"Statement {name} is not supported by the memory engine")
+        return StandInPrepared(name, query)
+
+    def _run(self, statement) -> List[Dict[str, Any]]:
+        if isinstance(statement, BatchStatement):
+            for _, query_id, values in statement._statements_and_parameters:
+                getattr(self.engine, query_id.decode())(*values)
+            return []
+        return getattr(self.engine, statement.prepared_statement.name)(*statement.values) or []
+
+    def execute(self, statement, execution_profile=None, trace=False) -> List[Dict[str, Any]]:
+        return self._run(statement)
+
+    def execute_async(self, statement, execution_profile=None, trace=False) -> StandInResponseFuture:
+        latency = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        try:
+            rows = self._run(statement)
+        except Exception as e:
+            return StandInResponseFuture([], None, latency, e)
+        return StandInResponseFuture(rows, getattr(statement, "fetch_size", None), latency)
+
+
+class StandInCluster:
+    """
+    What the client uses of a driver Cluster; stands for one node that is
+    always up.
+    """
+
+    def __init__(self, session: StandInSession):
+        self.session = session
+        self.metadata = SimpleNamespace(all_hosts=lambda: [SimpleNamespace(is_up=True)])
+
+    def connect(self, keyspace: Optional[str] = None, wait_for_all_pools: bool = False) -> StandInSession:
+        return self.session
+
+    def shutdown(self) -> None:
+        pass
+
+
+def install(engine: MemoryEngine, latency: float = 0, jitter: float = 0) -> StandInSession:
+    """
+    Make cassandra_client connect to `engine` instead of a cluster. Must be
+    called before the app connects.
+    """
+    session = StandInSession(engine, latency, jitter)
+    client_module.create_cluster = lambda *args, **kwargs: StandInCluster(session)
+    return session
+
+
+def seed(engine: MemoryEngine, dataset) -> int:
+    """
+    Fill an engine with the messages and inboxes of a workload.Dataset, as
+    scripts/generate_test_data.py writes them to Cassandra. Returns the
+    number of messages.
+    """
+    flat = settings.message_layout in ("flat", "dual")
+    bucketed = settings.message_layout in ("dual", "bucketed")
+    latest = {}
+    count = 0
+    for conversation_id, message_id, sender_id, recipient_id, text, _ in dataset.messages():
+        timestamp = write_timestamp(message_id)
+        if flat:
+            engine.insert_message(conversation_id, message_id, sender_id, recipient_id, text, timestamp)
+        if bucketed:
+            bucket = bucket_of(message_id)
+            engine.insert_bucketed_message(conversation_id, bucket, message_id, sender_id, recipient_id, text, timestamp)
+            engine.insert_conversation_bucket(conversation_id, bucket)
+        latest[conversation_id] = (message_id, text)
+        count += 1
+
+    for user_a, user_b in dataset.conversations:
+        conversation_id = f"{user_a}_{user_b}"
+        message_id, text = latest[conversation_id]
+        timestamp = write_timestamp(message_id)
+        for user_id, other_user_id in ((user_a, user_b), (user_b, user_a)):
+            engine.insert_user_conversation(user_id, message_id, conversation_id, other_user_id, text, timestamp)
+            engine.upsert_conversation_latest(user_id, conversation_id, message_id, timestamp)
+    return count
+
+
+def setup_backend(dataset, latency: float = 0, jitter: float = 0) -> int:
+    """
+    Seed the app's storage backend with a workload.Dataset and give it
+    `latency` seconds per statement plus up to `jitter` more: the memory
+    backend directly, or for STORAGE_BACKEND=cassandra, a StandInSession
+    installed under cassandra_client. Returns the number of messages.
+    """
+    if isinstance(storage, MemoryClient):
+        engine = storage.engine
+        storage.latency, storage.jitter = latency, jitter
+    else:
+        engine = MemoryEngine()
+        install(engine, latency, jitter)
+    return seed(engine, dataset)
+
+
+def parse_args():
+    from benchmarks.workload import add_dataset_arguments
+
+    parser = argparse.ArgumentParser(description="Serve the app on seeded in-memory storage")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen address")
+    parser.add_argument("--port", type=int, default=8765, help="Listen port")
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds every statement takes")
+    parser.add_argument("--jitter", type=float, default=0, help="Up to this many extra milliseconds per statement")
+    add_dataset_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    """Seed the storage backend and serve the app on it with one worker."""
+    import uvicorn
+    from benchmarks.workload import Dataset
+
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    dataset = Dataset.from_args(args)
+    started = time.monotonic()
+    count = setup_backend(dataset, args.latency / 1000, args.jitter / 1000)
+    logger.info(
+        f"Seeded {len(dataset.conversations)} conversations with {count} messages "
+        f"in {time.monotonic() - started:.1f}s ({settings.storage_backend} backend)"
+    )
+
+    from app.main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
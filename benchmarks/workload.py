@@ -0,0 +1,200 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from cassandra.util import min_uuid_from_time
+
+from scripts.generate_test_data import ZipfSampler, pick_conversations, message_counts, conversation_messages
+
+# Endpoint weights of the default load test: mostly reads, as clients poll
+DEFAULT_MIX = "send=20,inbox=40,history=30,before=10"
+
+
+def add_dataset_arguments(parser) -> None:
+    """
+    Arguments describing the data set. They mean the same as for
+    scripts/generate_test_data.py, so a cluster filled by the script with
+    the same values can be load tested with them too.
+    """
+    parser.add_argument("--users", type=int, default=1000, help="Number of users")
+    parser.add_argument("--conversations", type=int, default=5000, help="Number of conversations")
+    parser.add_argument("--messages", type=int, default=100000, help="Total number of messages")
+    parser.add_argument("--user-skew", type=float, default=1.0, help="Zipf exponent of user activity (0 = uniform)")
+    parser.add_argument("--conversation-skew", type=float, default=1.1,
+                        help="Zipf exponent of conversation sizes and popularity (0 = uniform)")
+    parser.add_argument("--days", type=float, default=30, help="Time span the messages are spread over")
+    parser.add_argument("--end-time", type=datetime.fromisoformat, default=datetime(2024, 1, 1),
+                        help="Time of the newest messages (ISO format)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the data set")
+
+
+def dataset_arguments(args) -> List[str]:
+    """
+    The dataset arguments of `args` as a command line, for a child process.
+    """
+    return [
+        "--users", str(args.users), "--conversations", str(args.conversations), "--messages", str(args.messages),
+        "--user-skew", str(args.user_skew), "--conversation-skew", str(args.conversation_skew),
+        "--days", str(args.days), "--end-time", args.end_time.isoformat(), "--seed", str(args.seed),
+    ]
+
+
+class Dataset:
+    """
+    Users 1..users and the conversations and messages between them, drawn
+    exactly as scripts/generate_test_data.py draws them from the same seed.
+    The load driver only needs the conversations, which are cheap to draw;
+    messages() replays the rest for the stand-in backend.
+    """
+
+    def __init__(
+        self,
+        users: int,
+        conversations: int,
+        messages: int,
+        user_skew: float,
+        conversation_skew: float,
+        days: float,
+        seed: int,
+        end_time: datetime
+    ):
+        self.users = users
+        self.message_count = messages
+        self.user_skew = user_skew
+        self.conversation_skew = conversation_skew
+        self.days = days
+        self.end_time = end_time
+        rng = random.Random(seed)
+        user_sampler = ZipfSampler(users, user_skew, rng)
+        # (smaller user id, larger user id), largest conversations first
+        self.conversations: List[Tuple[int, int]] = pick_conversations(rng, users, conversations, user_sampler)
+        self._state = rng.getstate()
+
+    @classmethod
+    def from_args(cls, args) -> "Dataset":
+        return cls(
+            args.users, args.conversations, args.messages, args.user_skew, args.conversation_skew,
+            args.days, args.seed, args.end_time
+        )
+
+    def messages(self) -> Iterator[Tuple[str, Any, int, int, str, datetime]]:
+        rng = random.Random()
+        rng.setstate(self._state)
+        counts = message_counts(rng, len(self.conversations), self.message_count, self.conversation_skew)
+        return conversation_messages(rng, self.conversations, counts, self.end_time, self.days)
+
+
+class Request(NamedTuple):
+    endpoint: str
+    method: str
+    path: str
+    body: Optional[Any] = None
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse "endpoint=weight,..." into weights, e.g. "send=20,inbox=80".
+    """
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in Workload.ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}', expected one of {', '.join(Workload.ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise ValueError("The mix needs at least one endpoint with a positive weight")
+    return weights
+
+
+class Workload:
+    """
+    Random requests against the API in the proportions of a mix. Users and
+    conversations are picked with the data set's Zipf skews, so the users
+    with the lowest ids and the largest conversations are the busiest, as
+    in the data.
+    """
+
+    ENDPOINTS = ("send", "batch", "inbox", "conversation", "history", "before", "since", "user_since", "export")
+
+    def __init__(self, dataset: Dataset, mix: Dict[str, float], seed: int, page_size: int = 20, batch_size: int = 10):
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.users = ZipfSampler(dataset.users, dataset.user_skew, self.rng)
+        self.conversations = ZipfSampler(len(dataset.conversations), dataset.conversation_skew, self.rng)
+        self.endpoints = list(mix)
+        self.weights = list(mix.values())
+        self.sent = 0
+
+    def next(self) -> Request:
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        return getattr(self, f"_{endpoint}")()
+
+    def _user(self) -> int:
+        return self.users.sample() + 1
+
+    def _pair(self) -> Tuple[int, int]:
+        return self.dataset.conversations[self.conversations.sample()]
+
+    def _conversation_id(self) -> str:
+        return "{}_{}".format(*self._pair())
+
+    def _page(self) -> int:
+        # Most readers stay on the first page, a few scroll back
+        draw = self.rng.random()
+        return 1 if draw < 0.7 else 2 if draw < 0.9 else self.rng.randint(3, 5)
+
+    def _moment(self, days: float) -> datetime:
+        return self.dataset.end_time - timedelta(days=self.rng.uniform(0, days))
+
+    def _message(self) -> Dict[str, Any]:
+        sender_id, receiver_id = self._pair()
+        if self.rng.random() < 0.5:
+            sender_id, receiver_id = receiver_id, sender_id
+        self.sent += 1
+        return {"sender_id": sender_id, "receiver_id": receiver_id, "content": f"Benchmark message {self.sent}"}
+
+    def _send(self) -> Request:
+        return Request("send", "POST", "/api/messages/", self._message())
+
+    def _batch(self) -> Request:
+        return Request("batch", "POST", "/api/messages/batch", [self._message() for _ in range(self.batch_size)])
+
+    def _inbox(self) -> Request:
+        return Request("inbox", "GET", f"/api/conversations/user/{self._user()}?page=1&limit={self.page_size}")
+
+    def _conversation(self) -> Request:
+        return Request("conversation", "GET", f"/api/conversations/{self._conversation_id()}")
+
+    def _history(self) -> Request:
+        return Request(
+            "history", "GET",
+            f"/api/messages/conversation/{self._conversation_id()}?page={self._page()}&limit={self.page_size}"
+        )
+
+    def _before(self) -> Request:
+        return Request(
+            "before", "GET",
+            f"/api/messages/conversation/{self._conversation_id()}/before"
+            f"?before_timestamp={self._moment(self.dataset.days).isoformat()}&limit={self.page_size}"
+        )
+
+    def _since(self) -> Request:
+        after = min_uuid_from_time(self._moment(1))
+        return Request("since", "GET", f"/api/messages/conversation/{self._conversation_id()}/since?after={after}&limit=100")
+
+    def _user_since(self) -> Request:
+        after = min_uuid_from_time(self._moment(1))
+        return Request(
+            "user_since", "GET", f"/api/messages/user/{self._user()}/since?after={after}&limit={self.page_size}&conversations=20"
+        )
+
+    def _export(self) -> Request:
+        start = self._moment(self.dataset.days)
+        return Request(
+            "export", "GET",
+            f"/api/messages/conversation/{self._conversation_id()}/export?start={start.isoformat()}"
+            f"&end={(start + timedelta(days=1)).isoformat()}"
+        )
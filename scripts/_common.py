@@ -0,0 +1,21 @@
+import logging
+
+from cassandra.query import named_tuple_factory
+
+from app.config import settings
+from app.db.connection import create_cluster
+
+logger = logging.getLogger(__name__)
+
+
+def connect_to_cassandra():
+    """Connect to the app's keyspace, with rows as named tuples."""
+    logger.info("Connecting to Cassandra...")
+    try:
+        cluster = create_cluster(row_factory=named_tuple_factory)
+        session = cluster.connect(settings.cassandra_keyspace)
+        logger.info("Connected to Cassandra!")
+        return cluster, session
+    except Exception as e:
+        logger.error(f"Failed to connect to Cassandra: {str(e)}")
+        raise
@@ -1,152 +1,298 @@
-import os
-import uuid
+import sys
+import json
+import time
 import logging
 import random
-from datetime import datetime, timedelta
-from cassandra.cluster import Cluster
-import json
+import argparse
+import itertools
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cassandra.concurrent import execute_concurrent
 from cassandra.util import uuid_from_time
 
+from app.config import settings
+from app.models.timeuuid import bucket_of, write_timestamp
+from scripts._common import connect_to_cassandra
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cassandra connection settings
-CASSANDRA_HOST = os.getenv("CASSANDRA_HOST", "localhost")
-CASSANDRA_PORT = int(os.getenv("CASSANDRA_PORT", "9042"))
-CASSANDRA_KEYSPACE = os.getenv("CASSANDRA_KEYSPACE", "messenger")
-
-# Test data configuration
+# Default test data configuration
 NUM_USERS = 10  # Number of users to create
 NUM_CONVERSATIONS = 15  # Number of conversations to create
-MAX_MESSAGES_PER_CONVERSATION = 50  # Maximum number of messages per conversation
+NUM_MESSAGES = 400  # Total number of messages across all conversations
 
-def connect_to_cassandra():
-    """Connect to Cassandra cluster."""
-    logger.info("Connecting to Cassandra...")
-    try:
-        cluster = Cluster([CASSANDRA_HOST])
-        session = cluster.connect(CASSANDRA_KEYSPACE)
-        logger.info("Connected to Cassandra!")
-        return cluster, session
-    except Exception as e:
-        logger.error(f"Failed to connect to Cassandra: {str(e)}")
-        raise
-    
-def export_to_json(filename, data):
-    Path("testdata").mkdir(exist_ok=True)
-    with open(f"testdata/{filename}", 'w') as f:
-        json.dump(data, f, indent=4, default=str)
-
-def generate_test_data(session):
+class ZipfSampler:
+    """Draws ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s."""
+
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1.0 / (rank + 1) ** s for rank in range(n)))
+
+    def sample(self):
+        return bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+class NDJSONExporter:
+    """Streams rows to testdata/*.ndjson, one JSON object per line."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory) if directory else None
+        self.files = {}
+
+    def write(self, name, row):
+        if self.directory is None:
+            return
+        if name not in self.files:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.files[name] = open(self.directory / f"{name}.ndjson", "w")
+        self.files[name].write(json.dumps(row, default=str) + "\n")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+class Progress:
+    """Logs row counts and throughput at a fixed interval."""
+
+    def __init__(self, label, total, interval=5.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def update(self, success):
+        self.done += 1
+        if not success:
+            self.failed += 1
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        logger.info(
+            f"{self.label}: {self.done}/{self.total} rows "
+            f"({self.done / elapsed:,.0f} rows/s, {self.failed} failed)"
+        )
+
+def write_statements(session, statements, label, total, concurrency):
+    """Pipeline (statement, params) pairs through execute_concurrent without keeping results in memory."""
+    progress = Progress(label, total)
+    results = execute_concurrent(
+        session, statements,
+        concurrency=concurrency, raise_on_first_error=False, results_generator=True
+    )
+    for success, _ in results:
+        progress.update(success)
+    progress.report()
+    return progress
+
+def write_rows(session, statement, rows, label, total, concurrency):
+    """Write every row with the same prepared statement."""
+    return write_statements(session, ((statement, row) for row in rows), label, total, concurrency)
+
+def pick_conversations(rng, num_users, num_conversations, user_sampler):
+    """Distinct user pairs; active (low rank) users take part in more conversations."""
+    max_pairs = num_users * (num_users - 1) // 2
+    if num_conversations > max_pairs:
+        raise ValueError(f"{num_users} users can have at most {max_pairs} conversations")
+
+    pairs = set()
+    while len(pairs) < num_conversations:
+        a, b = user_sampler.sample() + 1, user_sampler.sample() + 1
+        if a != b:
+            pairs.add(tuple(sorted((a, b))))
+    conversations = sorted(pairs)
+    rng.shuffle(conversations)
+    return conversations
+
+def message_counts(rng, num_conversations, num_messages, skew):
+    """Every conversation gets one message; the rest follow a Zipf distribution."""
+    counts = [1] * num_conversations
+    sampler = ZipfSampler(num_conversations, skew, rng)
+    for _ in range(max(num_messages - num_conversations, 0)):
+        counts[sampler.sample()] += 1
+    return counts
+
+def conversation_messages(rng, conversations, counts, end_time, days):
+    """
+    Messages of every conversation, one conversation after the other and
+    oldest first, as (conversation_id, message_id, sender_id, recipient_id,
+    text, time). Everything is drawn from rng, so a seed always gives the
+    same messages, here and in the benchmarks' stand-in backend.
+    """
+    for (user_a, user_b), count in zip(conversations, counts):
+        conversation_id = f"{user_a}_{user_b}"
+        # Messages are spread evenly, with jitter, over a random window ending at end_time.
+        span = timedelta(days=rng.uniform(0, days))
+        msg_time = end_time - span
+        step = span / (count + 1)
+        for i in range(count):
+            msg_time += step * rng.uniform(0.5, 1.5) if i else step
+            msg_uuid = uuid_from_time(msg_time, node=rng.getrandbits(48), clock_seq=rng.getrandbits(14))
+            from_id, to_id = (user_a, user_b) if rng.random() < 0.5 else (user_b, user_a)
+            yield conversation_id, msg_uuid, from_id, to_id, f"Message {i + 1} from {from_id} to {to_id}", msg_time
+
+def generate_test_data(session, args):
     """
     Generate test data in Cassandra.
-    
-    Students should implement this function to generate test data based on their schema design.
-    The function should create:
-    - Users (with IDs 1-NUM_USERS)
-    - Conversations between random pairs of users
-    - Messages in each conversation with realistic timestamps
+
+    Creates users 1..args.users, args.conversations conversations between
+    Zipf-weighted pairs of users and args.messages messages whose spread over
+    conversations is Zipf-skewed as well. Everything is derived from
+    args.seed (and args.end_time), so runs are reproducible. Rows are
+    streamed through prepared statements and execute_concurrent, and
+    exported as NDJSON while they are written, in constant memory apart
+    from per-conversation bookkeeping.
+
+    Messages go to the tables the app reads with MESSAGE_LAYOUT: `messages`,
+    `messages_by_bucket` and `conversation_buckets`, or all three ("dual").
     """
     logger.info("Generating test data...")
-    
-    # TODO: Students should implement the test data generation logic
-    # Hint:
-    # 1. Create a set of user IDs
-    # 2. Create conversations between random pairs of users
-    # 3. For each conversation, generate a random number of messages
-    # 4. Update relevant tables to maintain data consistency
-
-    user_ids = list(range(1, NUM_USERS + 1))
-    used_pairs = set()
-
-    users = []
-    conversations = []
-    messages = []
-
-    for user_id in user_ids:
-        users.append({"user_id": user_id})
-        session.execute(
-            "INSERT INTO users (user_id) VALUES (%s)",
-            (user_id,)
-        )
-    logger.info(f"Inserted {NUM_USERS} users into the database")
-
-    conversations_created = 0
-
-    while conversations_created < NUM_CONVERSATIONS:
-        sender_id, receiver_id = random.sample(user_ids, 2)
-        user_pair = tuple(sorted((sender_id, receiver_id)))
-        if user_pair in used_pairs:
-            continue
-        used_pairs.add(user_pair)
-        conversations_created += 1
-
-        conversation_id = f"{user_pair[0]}_{user_pair[1]}"
-        num_messages = random.randint(5, MAX_MESSAGES_PER_CONVERSATION)
-        start_time = datetime.now() - timedelta(days=random.randint(0, 30))
-        last_message_time = None
-        last_msg_txt = ""
-
-        for i in range(num_messages):
-            msg_time = start_time + timedelta(minutes=i)
-            msg_uuid = uuid_from_time(msg_time)
-            from_id, to_id = (sender_id , receiver_id) if i % 2 == 0 else (receiver_id, sender_id)
-            msg_text = f"Message {i + 1} from {from_id} to {to_id}"
-
-            msg = {
+    rng = random.Random(args.seed)
+    exporter = NDJSONExporter(None if args.no_export else args.export_dir)
+    end_time = args.end_time
+    started = time.monotonic()
+
+    insert_user = session.prepare("INSERT INTO users (user_id) VALUES (?)")
+    insert_message = session.prepare(
+        "INSERT INTO messages (conversation_id, message_id, sender_id, recipient_id, message_text) "
+        "VALUES (?, ?, ?, ?, ?) USING TIMESTAMP ?"
+    )
+    insert_bucketed_message = session.prepare(
+        "INSERT INTO messages_by_bucket (conversation_id, bucket, message_id, sender_id, recipient_id, message_text) "
+        "VALUES (?, ?, ?, ?, ?, ?) USING TIMESTAMP ?"
+    )
+    insert_bucket = session.prepare("INSERT INTO conversation_buckets (conversation_id, bucket) VALUES (?, ?)")
+    flat = settings.message_layout in ("flat", "dual")
+    bucketed = settings.message_layout in ("dual", "bucketed")
+    insert_inbox = session.prepare(
+        "INSERT INTO user_conversations (user_id, last_message_time, conversation_id, receiver_id, last_message) "
+        "VALUES (?, ?, ?, ?, ?) USING TIMESTAMP ?"
+    )
+    insert_latest = session.prepare(
+        "INSERT INTO user_conversation_latest (user_id, conversation_id, last_message_time) "
+        "VALUES (?, ?, ?) USING TIMESTAMP ?"
+    )
+
+    def users():
+        for user_id in range(1, args.users + 1):
+            exporter.write("users", {"user_id": user_id})
+            yield (user_id,)
+
+    write_rows(session, insert_user, users(), "users", args.users, args.concurrency)
+
+    user_sampler = ZipfSampler(args.users, args.user_skew, rng)
+    conversations = pick_conversations(rng, args.users, args.conversations, user_sampler)
+    counts = message_counts(rng, len(conversations), args.messages, args.conversation_skew)
+    # Latest message of every conversation, filled while its messages are generated.
+    latest = {}
+    # (conversation_id, bucket) of every bucketed message
+    buckets = set()
+
+    def messages():
+        for conversation_id, msg_uuid, from_id, to_id, msg_text, msg_time in conversation_messages(
+            rng, conversations, counts, end_time, args.days
+        ):
+            exporter.write("messages", {
                 "conversation_id": conversation_id,
                 "message_id": msg_uuid,
                 "sender_id": from_id,
                 "receiver_id": to_id,
                 "timestamp": msg_time,
                 "text": msg_text
-            }
-            messages.append(msg)
-
-            session.execute(
-                "INSERT INTO messages (conversation_id, message_id, sender_id, recipient_id, message_text) "
-                "VALUES (%s, %s, %s, %s, %s)",
-                (conversation_id, msg_uuid, from_id, to_id, msg_text)
-            )
-
-            
-            last_message_time = msg_uuid
-            last_msg_txt = msg_text
-
-            for user_id, other_user_id in [(sender_id, receiver_id) , (receiver_id, sender_id)]:
-                convo = {
-                    "user_id": user_id,
-                    "last_message_time": str(last_message_time),
-                    "conversation_id": conversation_id,
-                    "receiver_id": other_user_id,
-                    "last_msg_txt": last_msg_txt
-                }
-                conversations.append(convo) 
-                session.execute(
-                    "INSERT INTO user_conversations (user_id, last_message_time, conversation_id, receiver_id, last_message) "
-                    "VALUES (%s, %s, %s, %s, %s)",
-                    (user_id, last_message_time, conversation_id, other_user_id, last_msg_txt)
-                )
-
-    export_to_json("users.json", users)
-    export_to_json("conversations.json", conversations)
-    export_to_json("messages.json", messages)               
-    logger.info(f"Generated {NUM_CONVERSATIONS} conversations with messages")
-    logger.info(f"User IDs range from 1 to {NUM_USERS}")
+            })
+            latest[conversation_id] = (msg_uuid, msg_text)
+            timestamp = write_timestamp(msg_uuid)
+            if flat:
+                yield insert_message, (conversation_id, msg_uuid, from_id, to_id, msg_text, timestamp)
+            if bucketed:
+                bucket = bucket_of(msg_uuid)
+                buckets.add((conversation_id, bucket))
+                yield insert_bucketed_message, (conversation_id, bucket, msg_uuid, from_id, to_id, msg_text, timestamp)
+
+    progress = write_statements(
+        session, messages(), f"message rows ({settings.message_layout})", sum(counts) * (flat + bucketed), args.concurrency
+    )
+    if bucketed:
+        write_rows(session, insert_bucket, sorted(buckets), "conversation buckets", len(buckets), args.concurrency)
+
+    # Inboxes hold one row per conversation: only the latest message.
+    inbox = []
+    for user_a, user_b in conversations:
+        conversation_id = f"{user_a}_{user_b}"
+        msg_uuid, msg_text = latest[conversation_id]
+        for user_id, other_user_id in ((user_a, user_b), (user_b, user_a)):
+            inbox.append((user_id, msg_uuid, conversation_id, other_user_id, msg_text))
+
+    def inbox_rows():
+        for user_id, last_message_time, conversation_id, other_user_id, last_msg_txt in inbox:
+            exporter.write("conversations", {
+                "user_id": user_id,
+                "last_message_time": str(last_message_time),
+                "conversation_id": conversation_id,
+                "receiver_id": other_user_id,
+                "last_msg_txt": last_msg_txt
+            })
+            yield (user_id, last_message_time, conversation_id, other_user_id, last_msg_txt, write_timestamp(last_message_time))
+
+    def latest_rows():
+        for user_id, last_message_time, conversation_id, _, _ in inbox:
+            yield (user_id, conversation_id, last_message_time, write_timestamp(last_message_time))
+
+    write_rows(session, insert_inbox, inbox_rows(), "inbox rows", len(inbox), args.concurrency)
+    write_rows(session, insert_latest, latest_rows(), "inbox lookups", len(inbox), args.concurrency)
+    exporter.close()
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Generated {len(conversations)} conversations with {sum(counts)} messages ({progress.done} rows) "
+        f"in {elapsed:.1f}s ({sum(counts) / max(elapsed, 1e-9):,.0f} messages/s)"
+    )
+    logger.info(f"User IDs range from 1 to {args.users}")
     logger.info("Use these IDs for testing the API endpoints")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate messenger test data")
+    parser.add_argument("--users", type=int, default=NUM_USERS, help="Number of users")
+    parser.add_argument("--conversations", type=int, default=NUM_CONVERSATIONS, help="Number of conversations")
+    parser.add_argument("--messages", type=int, default=NUM_MESSAGES, help="Total number of messages")
+    parser.add_argument("--user-skew", type=float, default=1.0,
+                        help="Zipf exponent of user activity (0 = uniform)")
+    parser.add_argument("--conversation-skew", type=float, default=1.1,
+                        help="Zipf exponent of conversation sizes (0 = uniform)")
+    parser.add_argument("--days", type=float, default=30, help="Time span the messages are spread over")
+    parser.add_argument("--end-time", type=datetime.fromisoformat, default=None,
+                        help="Time of the newest messages (ISO format, default now); fix it for reproducible ids")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--concurrency", type=int, default=256, help="Writes in flight")
+    parser.add_argument("--export-dir", default="testdata", help="Directory for the NDJSON export")
+    parser.add_argument("--no-export", action="store_true", help="Skip the NDJSON export")
+    args = parser.parse_args()
+    if args.end_time is None:
+        args.end_time = datetime.now(timezone.utc)
+    return args
+
 def main():
     """Main function to generate test data."""
+    args = parse_args()
     cluster = None
-    
+
     try:
         # Connect to Cassandra
         cluster, session = connect_to_cassandra()
-        
+
         # Generate test data
-        generate_test_data(session)
-        
+        generate_test_data(session, args)
+
         logger.info("Test data generation completed successfully!")
     except Exception as e:
         logger.error(f"Error generating test data: {str(e)}")
@@ -156,4 +302,4 @@ def main():
             logger.info("Cassandra connection closed")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
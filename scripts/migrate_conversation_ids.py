@@ -0,0 +1,264 @@
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import SimpleStatement
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings
+from app.models.timeuuid import write_timestamp
+from scripts._common import connect_to_cassandra
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FETCH_SIZE = 1000
+
+def parse_legacy_id(conversation_id):
+    """
+    Return (canonical_id, user_a, user_b) for a reversed "{larger}_{smaller}"
+    id, or None if the id is already canonical or not a user pair.
+    """
+    parts = conversation_id.split("_")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        return None
+    high, low = int(parts[0]), int(parts[1])
+    if high <= low:
+        return None
+    return f"{low}_{high}", high, low
+
+class ConversationIdMigration:
+    """
+    Moves conversations stored under reversed ids to their canonical id, in
+    the message tables of the given MESSAGE_LAYOUT: `messages` when flat,
+    `messages_by_bucket` and `conversation_buckets` when bucketed, all of
+    them when dual.
+    """
+
+    def __init__(self, session, layout="flat", dry_run=False, concurrency=50):
+        self.session = session
+        self.flat = layout in ("flat", "dual")
+        self.bucketed = layout in ("dual", "bucketed")
+        self.dry_run = dry_run
+        self.concurrency = concurrency
+
+        self.insert_message = session.prepare(
+            "INSERT INTO messages (conversation_id, message_id, sender_id, recipient_id, message_text) "
+            "VALUES (?, ?, ?, ?, ?) USING TIMESTAMP ?"
+        )
+        self.delete_partition = session.prepare(
+            "DELETE FROM messages USING TIMESTAMP ? WHERE conversation_id = ?"
+        )
+        self.select_buckets = session.prepare(
+            "SELECT bucket FROM conversation_buckets WHERE conversation_id = ?"
+        )
+        self.insert_bucketed_message = session.prepare(
+            "INSERT INTO messages_by_bucket (conversation_id, bucket, message_id, sender_id, recipient_id, message_text) "
+            "VALUES (?, ?, ?, ?, ?, ?) USING TIMESTAMP ?"
+        )
+        self.insert_bucket = session.prepare(
+            "INSERT INTO conversation_buckets (conversation_id, bucket) VALUES (?, ?)"
+        )
+        self.delete_bucket_partition = session.prepare(
+            "DELETE FROM messages_by_bucket USING TIMESTAMP ? WHERE conversation_id = ? AND bucket = ?"
+        )
+        self.select_bucket_message = session.prepare(
+            "SELECT message_id FROM messages_by_bucket WHERE conversation_id = ? AND bucket = ? LIMIT 1"
+        )
+        self.delete_bucket = session.prepare(
+            "DELETE FROM conversation_buckets USING TIMESTAMP ? WHERE conversation_id = ? AND bucket = ?"
+        )
+        self.select_latest = session.prepare(
+            "SELECT last_message_time FROM user_conversation_latest WHERE user_id = ? AND conversation_id = ?"
+        )
+        self.select_inbox_row = session.prepare(
+            "SELECT receiver_id, last_message FROM user_conversations "
+            "WHERE user_id = ? AND last_message_time = ? AND conversation_id = ?"
+        )
+        self.insert_inbox_row = session.prepare(
+            "INSERT INTO user_conversations (user_id, last_message_time, conversation_id, receiver_id, last_message) "
+            "VALUES (?, ?, ?, ?, ?) USING TIMESTAMP ?"
+        )
+        self.delete_inbox_row = session.prepare(
+            "DELETE FROM user_conversations WHERE user_id = ? AND last_message_time = ? AND conversation_id = ?"
+        )
+        self.upsert_latest = session.prepare(
+            "INSERT INTO user_conversation_latest (user_id, conversation_id, last_message_time) "
+            "VALUES (?, ?, ?) USING TIMESTAMP ?"
+        )
+        self.delete_latest = session.prepare(
+            "DELETE FROM user_conversation_latest WHERE user_id = ? AND conversation_id = ?"
+        )
+
+    def copy_messages(self, legacy_id, canonical_id):
+        """Stream a legacy partition into the canonical one, page by page."""
+        rows = self.session.execute(
+            SimpleStatement(
+                "SELECT message_id, sender_id, recipient_id, message_text FROM messages WHERE conversation_id = %s",
+                fetch_size=FETCH_SIZE
+            ),
+            (legacy_id,)
+        )
+        batch = []
+        copied = 0
+        for row in rows:
+            batch.append((
+                canonical_id, row.message_id, row.sender_id, row.recipient_id,
+                row.message_text, write_timestamp(row.message_id)
+            ))
+            if len(batch) >= FETCH_SIZE:
+                copied += self._flush(self.insert_message, batch)
+                batch = []
+        return copied + self._flush(self.insert_message, batch)
+
+    def copy_buckets(self, legacy_id, canonical_id):
+        """
+        Stream every bucket partition of a legacy conversation into the same
+        bucket of the canonical one. Returns the messages copied and the
+        buckets visited.
+        """
+        buckets = [row.bucket for row in self.session.execute(self.select_buckets, (legacy_id,))]
+        copied = 0
+        for bucket in buckets:
+            rows = self.session.execute(
+                SimpleStatement(
+                    "SELECT message_id, sender_id, recipient_id, message_text FROM messages_by_bucket "
+                    "WHERE conversation_id = %s AND bucket = %s",
+                    fetch_size=FETCH_SIZE
+                ),
+                (legacy_id, bucket)
+            )
+            batch = []
+            for row in rows:
+                batch.append((
+                    canonical_id, bucket, row.message_id, row.sender_id, row.recipient_id,
+                    row.message_text, write_timestamp(row.message_id)
+                ))
+                if len(batch) >= FETCH_SIZE:
+                    copied += self._flush(self.insert_bucketed_message, batch)
+                    batch = []
+            copied += self._flush(self.insert_bucketed_message, batch)
+            if not self.dry_run:
+                # Registered after its rows, so readers never see an empty bucket.
+                self.session.execute(self.insert_bucket, (canonical_id, bucket))
+        return copied, buckets
+
+    def delete_buckets(self, legacy_id, buckets, started):
+        """
+        Delete the copied bucket partitions. A bucket stays registered while
+        it still holds messages sent during the copy, so a second run finds
+        them: the app registers a bucket only once per process.
+        """
+        for bucket in buckets:
+            self.session.execute(self.delete_bucket_partition, (started, legacy_id, bucket))
+            if self.session.execute(self.select_bucket_message, (legacy_id, bucket)).one() is None:
+                self.session.execute(self.delete_bucket, (started, legacy_id, bucket))
+
+    def _flush(self, statement, batch):
+        if batch and not self.dry_run:
+            execute_concurrent_with_args(self.session, statement, batch, concurrency=self.concurrency)
+        return len(batch)
+
+    def move_inbox(self, user_id, legacy_id, canonical_id):
+        """Point a user's inbox at the canonical id, keeping the newer of both rows."""
+        legacy = self.session.execute(self.select_latest, (user_id, legacy_id)).one()
+        if legacy is None:
+            return
+        current = self.session.execute(self.select_latest, (user_id, canonical_id)).one()
+        row = self.session.execute(
+            self.select_inbox_row, (user_id, legacy.last_message_time, legacy_id)
+        ).one()
+        if self.dry_run:
+            return
+
+        if row is not None and (current is None or current.last_message_time.time < legacy.last_message_time.time):
+            if current is not None:
+                self.session.execute(self.delete_inbox_row, (user_id, current.last_message_time, canonical_id))
+            timestamp = write_timestamp(legacy.last_message_time)
+            self.session.execute(
+                self.insert_inbox_row,
+                (user_id, legacy.last_message_time, canonical_id, row.receiver_id, row.last_message, timestamp)
+            )
+            self.session.execute(
+                self.upsert_latest, (user_id, canonical_id, legacy.last_message_time, timestamp)
+            )
+        self.session.execute(self.delete_inbox_row, (user_id, legacy.last_message_time, legacy_id))
+        self.session.execute(self.delete_latest, (user_id, legacy_id))
+
+    def legacy_ids(self):
+        """
+        Reversed conversation ids found in the message tables of the layout,
+        each once.
+        """
+        tables = (["messages"] if self.flat else []) + (["conversation_buckets"] if self.bucketed else [])
+        seen = set()
+        for table in tables:
+            conversations = self.session.execute(
+                SimpleStatement(f"SELECT DISTINCT conversation_id FROM {table}", fetch_size=FETCH_SIZE)
+            )
+            for conversation in conversations:
+                legacy_id = conversation.conversation_id
+                if legacy_id not in seen and parse_legacy_id(legacy_id) is not None:
+                    seen.add(legacy_id)
+                    yield legacy_id
+
+    def run(self):
+        migrated = 0
+        for legacy_id in self.legacy_ids():
+            canonical_id, user_a, user_b = parse_legacy_id(legacy_id)
+            # Messages sent to the legacy id while we copy are newer than this
+            # and survive the partition delete; a second run picks them up.
+            started = int(time.time() * 1_000_000)
+
+            copied = self.copy_messages(legacy_id, canonical_id) if self.flat else 0
+            buckets = []
+            if self.bucketed:
+                bucketed_copied, buckets = self.copy_buckets(legacy_id, canonical_id)
+                # In dual layout both tables hold every message; count them once.
+                copied = copied or bucketed_copied
+            for user_id in (user_a, user_b):
+                self.move_inbox(user_id, legacy_id, canonical_id)
+            if not self.dry_run:
+                if self.flat:
+                    self.session.execute(self.delete_partition, (started, legacy_id))
+                self.delete_buckets(legacy_id, buckets, started)
+
+            migrated += 1
+            logger.info(f"{'Would move' if self.dry_run else 'Moved'} {copied} messages from {legacy_id} to {canonical_id}")
+
+        logger.info(f"Migrated {migrated} legacy conversations")
+
+def main():
+    """
+    Move conversations stored under reversed ids to their canonical id.
+
+    Run it with the app's MESSAGE_LAYOUT, once, restart the app with
+    CONVERSATION_LEGACY_LOOKUP=false, then run it again to move messages that
+    were sent while the first run copied. Switch layouts before or after the
+    migration, not during it.
+    """
+    parser = argparse.ArgumentParser(description="Rewrite legacy '{larger}_{smaller}' conversation ids")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent writes while copying")
+    args = parser.parse_args()
+
+    cluster = None
+    try:
+        cluster, session = connect_to_cassandra()
+        ConversationIdMigration(
+            session, settings.message_layout, dry_run=args.dry_run, concurrency=args.concurrency
+        ).run()
+        logger.info("Conversation id migration completed. Set CONVERSATION_LEGACY_LOOKUP=false to skip legacy lookups.")
+    except Exception as e:
+        logger.error(f"Error migrating conversation ids: {str(e)}")
+        raise
+    finally:
+        if cluster:
+            cluster.shutdown()
+            logger.info("Cassandra connection closed")
+
+if __name__ == "__main__":
+    main()
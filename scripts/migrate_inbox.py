@@ -0,0 +1,109 @@
+import sys
+import argparse
+import logging
+from pathlib import Path
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import SimpleStatement
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models.timeuuid import write_timestamp
+from scripts._common import connect_to_cassandra
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FETCH_SIZE = 1000
+
+def compact_user(session, user_id, upsert_latest, delete_row, dry_run=False, concurrency=50):
+    """
+    Compact one inbox partition.
+
+    Rows are streamed newest first, so the first row seen for a conversation
+    is its current one: it is recorded in user_conversation_latest and every
+    older row of the same conversation is deleted. Memory is bounded by the
+    number of conversations of the user, not by the partition size.
+    """
+    rows = session.execute(
+        SimpleStatement(
+            "SELECT last_message_time, conversation_id FROM user_conversations WHERE user_id = %s",
+            fetch_size=FETCH_SIZE
+        ),
+        (user_id,)
+    )
+
+    seen = set()
+    latest = []
+    stale = []
+    removed = 0
+    for row in rows:
+        if row.conversation_id in seen:
+            stale.append((user_id, row.last_message_time, row.conversation_id))
+            removed += 1
+        else:
+            seen.add(row.conversation_id)
+            latest.append((user_id, row.conversation_id, row.last_message_time, write_timestamp(row.last_message_time)))
+
+        # Flush deletions as we go so huge partitions stay in constant memory.
+        if len(stale) >= FETCH_SIZE:
+            if not dry_run:
+                execute_concurrent_with_args(session, delete_row, stale, concurrency=concurrency)
+            stale = []
+
+    if not dry_run:
+        execute_concurrent_with_args(session, upsert_latest, latest, concurrency=concurrency)
+        execute_concurrent_with_args(session, delete_row, stale, concurrency=concurrency)
+
+    return len(latest), removed
+
+def migrate(session, dry_run=False, concurrency=50):
+    """Compact every inbox partition into one row per conversation."""
+    # The backfill writes with the message time as write timestamp, so a
+    # lookup row written meanwhile by a live send (stamped with its newer
+    # message time) is never overwritten.
+    upsert_latest = session.prepare(
+        "INSERT INTO user_conversation_latest (user_id, conversation_id, last_message_time) VALUES (?, ?, ?) "
+        "USING TIMESTAMP ?"
+    )
+    delete_row = session.prepare(
+        "DELETE FROM user_conversations WHERE user_id = ? AND last_message_time = ? AND conversation_id = ?"
+    )
+
+    users = session.execute(
+        SimpleStatement("SELECT DISTINCT user_id FROM user_conversations", fetch_size=FETCH_SIZE)
+    )
+
+    total_users = total_kept = total_deleted = 0
+    for user in users:
+        kept, deleted = compact_user(session, user.user_id, upsert_latest, delete_row, dry_run, concurrency)
+        total_users += 1
+        total_kept += kept
+        total_deleted += deleted
+        if total_users % 1000 == 0:
+            logger.info(f"Processed {total_users} users ({total_kept} conversations kept, {total_deleted} rows removed)")
+
+    action = "would remove" if dry_run else "removed"
+    logger.info(f"Compacted {total_users} inboxes: {total_kept} conversations kept, {action} {total_deleted} rows")
+
+def main():
+    """Compact existing user_conversations partitions."""
+    parser = argparse.ArgumentParser(description="Compact user_conversations into one row per conversation")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent writes per user")
+    args = parser.parse_args()
+
+    cluster = None
+    try:
+        cluster, session = connect_to_cassandra()
+        migrate(session, dry_run=args.dry_run, concurrency=args.concurrency)
+        logger.info("Inbox migration completed successfully!")
+    except Exception as e:
+        logger.error(f"Error migrating inboxes: {str(e)}")
+        raise
+    finally:
+        if cluster:
+            cluster.shutdown()
+            logger.info("Cassandra connection closed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import sys
+import argparse
+import logging
+from pathlib import Path
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import SimpleStatement
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings
+from app.models.timeuuid import bucket_of, write_timestamp
+from scripts._common import connect_to_cassandra
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FETCH_SIZE = 1000
+
+class MessageBucketMigration:
+    """Copies `messages` partitions into `messages_by_bucket`, bucket by bucket."""
+
+    def __init__(self, session, granularity, dry_run=False, concurrency=50):
+        self.session = session
+        self.granularity = granularity
+        self.dry_run = dry_run
+        self.concurrency = concurrency
+
+        # Rows keep the write timestamp of their message, so copies never
+        # overwrite newer data written by the app in dual mode.
+        self.insert_message = session.prepare(
+            "INSERT INTO messages_by_bucket (conversation_id, bucket, message_id, sender_id, recipient_id, message_text) "
+            "VALUES (?, ?, ?, ?, ?, ?) USING TIMESTAMP ?"
+        )
+        self.insert_bucket = session.prepare(
+            "INSERT INTO conversation_buckets (conversation_id, bucket) VALUES (?, ?)"
+        )
+
+    def copy_conversation(self, conversation_id):
+        """
+        Stream one partition newest first. Rows of a bucket are contiguous in
+        that order, so each bucket is registered as soon as the stream moves
+        past it. Rows are written every FETCH_SIZE rows, so memory does not
+        grow with the partition.
+        """
+        rows = self.session.execute(
+            SimpleStatement(
+                "SELECT message_id, sender_id, recipient_id, message_text FROM messages WHERE conversation_id = %s",
+                fetch_size=FETCH_SIZE
+            ),
+            (conversation_id,)
+        )
+        copied = 0
+        buckets = 0
+        bucket = None
+        batch = []
+        for row in rows:
+            row_bucket = bucket_of(row.message_id, self.granularity)
+            if row_bucket != bucket or len(batch) >= FETCH_SIZE:
+                copied += self._flush(conversation_id, bucket, batch, register=row_bucket != bucket)
+                buckets += row_bucket != bucket
+                bucket, batch = row_bucket, []
+            batch.append((
+                conversation_id, row_bucket, row.message_id, row.sender_id, row.recipient_id,
+                row.message_text, write_timestamp(row.message_id)
+            ))
+        copied += self._flush(conversation_id, bucket, batch, register=True)
+        return copied, buckets
+
+    def _flush(self, conversation_id, bucket, batch, register):
+        if not batch:
+            return 0
+        if not self.dry_run:
+            execute_concurrent_with_args(self.session, self.insert_message, batch, concurrency=self.concurrency)
+            if register:
+                # Registered after its rows, so readers never see an empty bucket.
+                self.session.execute(self.insert_bucket, (conversation_id, bucket))
+        return len(batch)
+
+    def run(self, conversation_ids=None):
+        if conversation_ids is None:
+            conversations = self.session.execute(
+                SimpleStatement("SELECT DISTINCT conversation_id FROM messages", fetch_size=FETCH_SIZE)
+            )
+            conversation_ids = (conversation.conversation_id for conversation in conversations)
+
+        migrated = 0
+        total = 0
+        for conversation_id in conversation_ids:
+            copied, buckets = self.copy_conversation(conversation_id)
+            migrated += 1
+            total += copied
+            logger.info(
+                f"{'Would copy' if self.dry_run else 'Copied'} {copied} messages of {conversation_id} "
+                f"into {buckets} bucket(s)"
+            )
+
+        logger.info(f"Migrated {total} messages of {migrated} conversations")
+
+def main():
+    """
+    Copy the `messages` table into the bucketed layout while the app keeps running.
+
+    1. Restart the app with MESSAGE_LAYOUT=dual: new messages go to both tables.
+    2. Run this script. Copies carry the original write timestamps, so it can
+       be interrupted and rerun, also per conversation with --conversation.
+    3. Restart the app with MESSAGE_LAYOUT=bucketed.
+    """
+    parser = argparse.ArgumentParser(description="Copy messages into time-bucketed partitions")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be copied")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent writes while copying")
+    parser.add_argument("--conversation", action="append", help="Only copy this conversation (repeatable)")
+    args = parser.parse_args()
+
+    cluster = None
+    try:
+        cluster, session = connect_to_cassandra()
+        migration = MessageBucketMigration(
+            session, settings.message_bucket, dry_run=args.dry_run, concurrency=args.concurrency
+        )
+        migration.run(args.conversation)
+        logger.info("Message bucket migration completed. Set MESSAGE_LAYOUT=bucketed to read from the new layout.")
+    except Exception as e:
+        logger.error(f"Error migrating messages: {str(e)}")
+        raise
+    finally:
+        if cluster:
+            cluster.shutdown()
+            logger.info("Cassandra connection closed")
+
+if __name__ == "__main__":
+    main()
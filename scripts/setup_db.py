@@ -1,34 +1,52 @@
 import os
+import sys
 import time
 import logging
-from cassandra.cluster import Cluster
-from cassandra.auth import PlainTextAuthProvider
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cassandra.query import named_tuple_factory
+
+from app.config import settings
+from app.db.connection import create_cluster
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cassandra connection settings
-CASSANDRA_HOST = os.getenv("CASSANDRA_HOST", "localhost")
-CASSANDRA_PORT = int(os.getenv("CASSANDRA_PORT", "9042"))
-CASSANDRA_KEYSPACE = os.getenv("CASSANDRA_KEYSPACE", "messenger")
+# Cassandra connection settings come from the app's shared configuration
+CASSANDRA_KEYSPACE = settings.cassandra_keyspace
+# Seconds to wait for Cassandra to accept connections
+CASSANDRA_WAIT_TIMEOUT = float(os.getenv("CASSANDRA_WAIT_TIMEOUT", "120"))
 
-def wait_for_cassandra():
-    """Wait for Cassandra to be ready before proceeding."""
+def wait_for_cassandra(timeout=CASSANDRA_WAIT_TIMEOUT):
+    """
+    Wait for Cassandra to be ready before proceeding. Retries start after
+    CASSANDRA_CONNECT_BACKOFF seconds and back off exponentially, so a node
+    that is already up is used right away and a starting one is not hammered.
+    """
     logger.info("Waiting for Cassandra to be ready...")
-    cluster = None
-    
-    for _ in range(10):
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = settings.cassandra_connect_backoff
+    attempt = 0
+
+    while True:
+        attempt += 1
+        cluster = create_cluster(row_factory=named_tuple_factory)
         try:
-            cluster = Cluster([CASSANDRA_HOST])
-            session = cluster.connect()
-            logger.info("Cassandra is ready!")
+            cluster.connect()
+            logger.info(f"Cassandra is ready after {time.monotonic() - started:.1f}s ({attempt} attempt(s))")
             return cluster
         except Exception as e:
-            logger.warning(f"Cassandra not ready yet: {str(e)}")
-            time.sleep(5) 
-    
-    logger.error("Failed to connect to Cassandra after multiple attempts.")
-    raise Exception("Could not connect to Cassandra")
+            cluster.shutdown()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Failed to connect to Cassandra after {attempt} attempts.")
+                raise Exception("Could not connect to Cassandra") from e
+            logger.warning(f"Cassandra not ready yet, retrying in {min(delay, remaining):.1f}s: {str(e)}")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, settings.cassandra_connect_backoff_max)
 
 def create_keyspace(session):
     logger.info(f"Creating keyspace {CASSANDRA_KEYSPACE} if it doesn't exist...")
@@ -63,6 +81,18 @@ def create_tables(session):
     """
     session.execute(conversation_table_query)
 
+    # One row per (user, conversation) pointing at the current inbox row,
+    # so the send path can replace it instead of piling up new ones.
+    conversation_latest_table_query = f"""
+    CREATE TABLE IF NOT EXISTS user_conversation_latest (
+    user_id int,
+    conversation_id text,
+    last_message_time timeuuid,
+    PRIMARY KEY (user_id, conversation_id)
+    );
+    """
+    session.execute(conversation_latest_table_query)
+
     message_table_query = f"""
     CREATE TABLE IF NOT EXISTS messages (
     conversation_id text,
@@ -75,6 +105,31 @@ def create_tables(session):
     """
 
     session.execute(message_table_query)
+
+    # Bucketed layout (MESSAGE_LAYOUT=dual/bucketed): one partition per
+    # conversation and day or month, so partitions stay bounded in size.
+    bucketed_message_table_query = f"""
+    CREATE TABLE IF NOT EXISTS messages_by_bucket (
+    conversation_id text,
+    bucket int,
+    message_id timeuuid,
+    sender_id int,
+    recipient_id int,
+    message_text text,
+    PRIMARY KEY ((conversation_id, bucket), message_id)
+    ) WITH CLUSTERING ORDER BY (message_id DESC);
+    """
+    session.execute(bucketed_message_table_query)
+
+    # Buckets holding messages of each conversation, newest first.
+    conversation_buckets_table_query = f"""
+    CREATE TABLE IF NOT EXISTS conversation_buckets (
+    conversation_id text,
+    bucket int,
+    PRIMARY KEY (conversation_id, bucket)
+    ) WITH CLUSTERING ORDER BY (bucket DESC);
+    """
+    session.execute(conversation_buckets_table_query)
     logger.info("Tables created successfully.")
 
 def main():
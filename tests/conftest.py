@@ -0,0 +1,44 @@
+import os
+from itertools import count
+
+# Settings are read when app.config is imported, so the backend has to be
+# chosen before the app is.
+os.environ["STORAGE_BACKEND"] = "memory"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.storage import storage
+from app.main import app
+
+_user_ids = count(1000)
+
+
+@pytest.fixture(scope="session")
+def client():
+    storage.ensure_connected()
+    storage.prepare_all()
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def users():
+    """
+    A pair of user ids no other test has used, so tests share the backend's
+    tables and caches without seeing each other's messages.
+    """
+    return next(_user_ids), next(_user_ids)
+
+
+@pytest.fixture
+def send(client):
+    """
+    Send a message and return it.
+    """
+    def send(sender_id: int, receiver_id: int, content: str) -> dict:
+        response = client.post("/api/messages/", json={"sender_id": sender_id, "receiver_id": receiver_id, "content": content})
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return send
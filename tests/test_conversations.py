@@ -0,0 +1,60 @@
+import uuid
+
+from app.cache.inbox_cache import inbox_cache
+from app.db.storage import storage
+from app.models.timeuuid import write_timestamp
+
+
+def test_inbox_holds_one_entry_per_conversation(client, users, send):
+    user_id, other_id = users
+    for i in range(3):
+        send(user_id, other_id, f"message {i}")
+    send(other_id, user_id, "reply")
+
+    body = client.get(f"/api/conversations/user/{user_id}").json()
+    assert body["total"] == 1
+    assert [(conversation["last_message_content"]) for conversation in body["data"]] == ["reply"]
+
+
+def test_inbox_is_ordered_by_latest_message(client, users, send):
+    user_id, first_id = users
+    second_id = first_id + 10 ** 6
+    send(user_id, first_id, "to first")
+    send(user_id, second_id, "to second")
+    send(first_id, user_id, "from first")
+
+    body = client.get(f"/api/conversations/user/{user_id}").json()
+    assert [conversation["last_message_content"] for conversation in body["data"]] == ["from first", "to second"]
+    assert body["total"] == 2
+
+
+def test_inbox_cache_sees_new_messages(client, users, send):
+    user_id, other_id = users
+    send(user_id, other_id, "first")
+    url = f"/api/conversations/user/{user_id}"
+    assert [conversation["last_message_content"] for conversation in client.get(url).json()["data"]] == ["first"]
+    hits = inbox_cache.stats()["hits"]
+    assert [conversation["last_message_content"] for conversation in client.get(url).json()["data"]] == ["first"]
+    assert inbox_cache.stats()["hits"] == hits + 1
+
+    send(other_id, user_id, "second")
+    assert [conversation["last_message_content"] for conversation in client.get(url).json()["data"]] == ["second"]
+
+
+def test_inbox_ties_are_ordered_by_conversation_id(client, users):
+    # Rows sharing last_message_time come in conversation_id order, as the
+    # clustering order of user_conversations has Cassandra return them.
+    user_id, _ = users
+    shared, newer = uuid.uuid1(), uuid.uuid1()
+    rows = [(shared, user_id + 3), (shared, user_id + 1), (newer, user_id + 4), (shared, user_id + 2)]
+    for last_message_time, other_id in rows:
+        conversation_id = f"{user_id}_{other_id}"
+        storage.engine.insert_user_conversation(
+            user_id, last_message_time, conversation_id, other_id, conversation_id, write_timestamp(last_message_time)
+        )
+        storage.engine.upsert_conversation_latest(user_id, conversation_id, last_message_time, write_timestamp(last_message_time))
+
+    body = client.get(f"/api/conversations/user/{user_id}").json()
+    assert [conversation["id"] for conversation in body["data"]] == [
+        f"{user_id}_{user_id + 4}", f"{user_id}_{user_id + 1}", f"{user_id}_{user_id + 2}", f"{user_id}_{user_id + 3}"
+    ]
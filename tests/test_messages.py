@@ -0,0 +1,106 @@
+import json
+
+from app.cache.message_cache import message_cache
+from app.config import settings
+
+
+def conversation_id(sender_id: int, receiver_id: int) -> str:
+    return f"{min(sender_id, receiver_id)}_{max(sender_id, receiver_id)}"
+
+
+def test_cursor_pages_cover_the_conversation_once(client, users, send):
+    sent = [send(*users, f"message {i}") for i in range(7)]
+
+    ids, cursor, pages = [], None, []
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/api/messages/conversation/{conversation_id(*users)}", params=params)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append(body)
+        ids.extend(message["id"] for message in body["data"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    assert ids == [message["id"] for message in reversed(sent)]
+    assert [len(page["data"]) for page in pages] == [3, 3, 1]
+    assert [page["has_more"] for page in pages] == [True, True, False]
+    # Counted from the cursor, when there is one
+    assert [page["total"] for page in pages] == [3, 3, 1]
+
+
+def test_last_page_has_no_cursor(client, users, send):
+    for i in range(3):
+        send(*users, f"message {i}")
+
+    body = client.get(f"/api/messages/conversation/{conversation_id(*users)}", params={"limit": 3}).json()
+    assert len(body["data"]) == 3
+    assert body["has_more"] is False
+    assert body["next_cursor"] is None
+    assert body["total"] == 3
+
+
+def test_bad_cursor_is_rejected(client, users, send):
+    send(*users, "hello")
+
+    response = client.get(f"/api/messages/conversation/{conversation_id(*users)}", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_tail_cache_sees_new_messages(client, users, send):
+    send(*users, "first")
+    url = f"/api/messages/conversation/{conversation_id(*users)}"
+    assert [message["content"] for message in client.get(url).json()["data"]] == ["first"]
+    hits = message_cache.stats()["hits"]
+    assert [message["content"] for message in client.get(url).json()["data"]] == ["first"]
+    assert message_cache.stats()["hits"] == hits + 1
+
+    send(*users, "second")
+    assert [message["content"] for message in client.get(url).json()["data"]] == ["second", "first"]
+
+
+def test_since_continues_from_next_after(client, users, send):
+    first = send(*users, "seen")
+    sent = [send(*users, f"new {i}") for i in range(5)]
+    url = f"/api/messages/conversation/{conversation_id(*users)}/since"
+
+    body = client.get(url, params={"after": first["id"], "limit": 3}).json()
+    assert [message["id"] for message in body["data"]] == [message["id"] for message in sent[:3]]
+    assert body["has_more"] is True
+
+    body = client.get(url, params={"after": body["next_after"], "limit": 3}).json()
+    assert [message["id"] for message in body["data"]] == [message["id"] for message in sent[3:]]
+    assert body["has_more"] is False
+
+    body = client.get(url, params={"after": body["next_after"], "limit": 3}).json()
+    assert body["data"] == []
+    assert body["next_after"] == sent[-1]["id"]
+
+
+def test_export_resumes_after_id(client, users, send):
+    sent = [send(*users, f"message {i}") for i in range(5)]
+    url = f"/api/messages/conversation/{conversation_id(*users)}/export"
+
+    lines = [json.loads(line) for line in client.get(url).text.splitlines()]
+    assert [line["id"] for line in lines] == [message["id"] for message in reversed(sent)]
+
+    response = client.get(url, params={"after_id": lines[1]["id"]})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [message["id"] for message in reversed(sent[:3])]
+
+
+def test_batch_over_the_limit_is_rejected(client, users):
+    sender_id, receiver_id = users
+    messages = [
+        {"sender_id": sender_id, "receiver_id": receiver_id, "content": str(i)}
+        for i in range(settings.message_batch_max_size + 1)
+    ]
+    del messages[-1]["content"]
+
+    # Refused on its length alone, without validating the messages
+    response = client.post("/api/messages/batch", json=messages)
+    assert response.status_code == 422
+    assert [error["type"] for error in response.json()["detail"]] == ["too_long"]
+    assert client.get(f"/api/messages/conversation/{conversation_id(*users)}").json()["data"] == []